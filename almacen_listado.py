@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Almacén del listado de empresas de Axesor
+Guarda en SQLite las empresas de cada página en cuanto se descargan,
+eliminando duplicados al insertar, para que la memoria no crezca con el
+número de empresas y los resultados parciales sobrevivan a una caída.
+Junto a cada página se guarda el checkpoint del municipio, de modo que un
+recorrido interrumpido pueda continuar donde se quedó
+"""
+
+import csv
+import logging
+import sqlite3
+import threading
+
+from openpyxl import Workbook
+
+from reintentos import RegistroFallos
+
+# Columnas del listado, en el orden en que se exportan
+COLUMNAS_LISTADO = ['razon_social', 'municipio', 'fuente', 'url_detalles']
+
+TAMANO_BLOQUE_EXPORTACION = 1000
+
+
+class SumideroListado:
+    """Cola SQLite de empresas del listado con deduplicación por razón social"""
+
+    def __init__(self, db_path='listado_axesor.db'):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.init_database()
+        # Páginas que no se pudieron descargar ni tras los reintentos
+        self.fallos = RegistroFallos(db_path, 'listado_axesor')
+
+    def init_database(self):
+        """Crea las tablas del listado y de checkpoints si no existen"""
+        with self.conn:
+            # (orden_municipio, pagina, posicion) reproduce el orden de un recorrido secuencial
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS empresas_listado (
+                    razon_social TEXT PRIMARY KEY,
+                    municipio TEXT,
+                    fuente TEXT,
+                    url_detalles TEXT,
+                    orden_municipio INTEGER NOT NULL,
+                    pagina INTEGER NOT NULL,
+                    posicion INTEGER NOT NULL,
+                    fecha_extraccion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            self.conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_listado_orden
+                ON empresas_listado(orden_municipio, pagina, posicion)
+            ''')
+            # Checkpoint por municipio: última página cuyas empresas están guardadas
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS progreso_municipios (
+                    municipio TEXT PRIMARY KEY,
+                    orden_municipio INTEGER NOT NULL,
+                    url_base TEXT,
+                    ultima_pagina INTEGER DEFAULT 0,
+                    ultima_pagina_url TEXT,
+                    estado TEXT DEFAULT 'en_curso',
+                    fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+    def vaciar(self):
+        """Borra el listado, los checkpoints y los fallos de una ejecución anterior"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM empresas_listado")
+            self.conn.execute("DELETE FROM progreso_municipios")
+        self.fallos.vaciar()
+
+    def cargar_progreso(self):
+        """Devuelve el checkpoint de cada municipio registrado"""
+        with self.lock:
+            filas = self.conn.execute('''
+                SELECT municipio, estado, ultima_pagina, ultima_pagina_url FROM progreso_municipios
+            ''').fetchall()
+        return {
+            municipio: {'estado': estado, 'ultima_pagina': ultima_pagina, 'ultima_pagina_url': ultima_pagina_url}
+            for municipio, estado, ultima_pagina, ultima_pagina_url in filas
+        }
+
+    def iniciar_municipio(self, municipio, orden_municipio, url_base):
+        """Registra el municipio y devuelve (última página completada, su URL)"""
+        with self.lock, self.conn:
+            self.conn.execute('''
+                INSERT OR IGNORE INTO progreso_municipios (municipio, orden_municipio, url_base)
+                VALUES (?, ?, ?)
+            ''', (municipio, orden_municipio, url_base))
+            fila = self.conn.execute('''
+                SELECT ultima_pagina, ultima_pagina_url FROM progreso_municipios WHERE municipio = ?
+            ''', (municipio,)).fetchone()
+        return fila[0], fila[1]
+
+    def completar_municipio(self, municipio):
+        """Marca el municipio como recorrido entero"""
+        with self.lock, self.conn:
+            self.conn.execute('''
+                UPDATE progreso_municipios
+                SET estado = 'completado', fecha_actualizacion = CURRENT_TIMESTAMP
+                WHERE municipio = ?
+            ''', (municipio,))
+
+    def agregar(self, empresas, orden_municipio, pagina, municipio=None, pagina_url=None):
+        """Guarda las empresas de una página y, si se indica el municipio, su checkpoint en una sola transacción"""
+        filas = [
+            (empresa['razon_social'], empresa.get('municipio'), empresa.get('fuente'),
+             empresa.get('url_detalles'), orden_municipio, pagina, posicion)
+            for posicion, empresa in enumerate(empresas)
+        ]
+
+        # Ante una razón social repetida se conserva la que aparecería antes en un
+        # recorrido secuencial, aunque los municipios se descarguen en paralelo
+        with self.lock, self.conn:
+            if municipio:
+                self.conn.execute('''
+                    UPDATE progreso_municipios
+                    SET ultima_pagina = ?, ultima_pagina_url = ?, fecha_actualizacion = CURRENT_TIMESTAMP
+                    WHERE municipio = ? AND ultima_pagina < ?
+                ''', (pagina, pagina_url, municipio, pagina))
+            self.conn.executemany('''
+                INSERT INTO empresas_listado
+                (razon_social, municipio, fuente, url_detalles, orden_municipio, pagina, posicion)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(razon_social) DO UPDATE SET
+                    municipio = excluded.municipio,
+                    fuente = excluded.fuente,
+                    url_detalles = excluded.url_detalles,
+                    orden_municipio = excluded.orden_municipio,
+                    pagina = excluded.pagina,
+                    posicion = excluded.posicion
+                WHERE (excluded.orden_municipio, excluded.pagina, excluded.posicion)
+                    < (orden_municipio, pagina, posicion)
+            ''', filas)
+
+    def total(self):
+        """Número de empresas únicas en el listado"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM empresas_listado").fetchone()[0]
+
+    def estadisticas(self):
+        """Totales del listado calculados en SQL"""
+        with self.lock:
+            fila = self.conn.execute('''
+                SELECT COUNT(*), COUNT(DISTINCT municipio), COUNT(url_detalles)
+                FROM empresas_listado
+            ''').fetchone()
+        return {
+            'total_empresas': fila[0],
+            'municipios_unicos': fila[1],
+            'empresas_con_enlace': fila[2],
+            'paginas_fallidas': self.fallos.total()
+        }
+
+    def leer_por_bloques(self):
+        """Recorre el listado en orden de extracción, por bloques de filas"""
+        # Conexión propia para no bloquear a los hilos que siguen insertando
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute(f'''
+                SELECT {', '.join(COLUMNAS_LISTADO)}
+                FROM empresas_listado
+                ORDER BY orden_municipio, pagina, posicion
+            ''')
+            while True:
+                filas = cursor.fetchmany(TAMANO_BLOQUE_EXPORTACION)
+                if not filas:
+                    break
+                yield filas
+        finally:
+            conn.close()
+
+    def exportar_csv(self, archivo_csv):
+        """Escribe el listado en CSV sin cargarlo entero en memoria"""
+        with open(archivo_csv, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNAS_LISTADO)
+            for filas in self.leer_por_bloques():
+                writer.writerows(filas)
+        logging.info(f"Resultados guardados en CSV: {archivo_csv}")
+
+    def exportar_excel(self, archivo_excel):
+        """Escribe el listado en Excel con openpyxl en modo write-only"""
+        libro = Workbook(write_only=True)
+        hoja = libro.create_sheet('Sheet1')
+        hoja.append(COLUMNAS_LISTADO)
+        for filas in self.leer_por_bloques():
+            for fila in filas:
+                hoja.append(list(fila))
+        libro.save(archivo_excel)
+        logging.info(f"Resultados guardados en Excel: {archivo_excel}")
+
+    def cerrar(self):
+        """Cierra las conexiones con la base de datos"""
+        with self.lock:
+            self.conn.close()
+        self.fallos.cerrar()
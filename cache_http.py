@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caché HTTP en disco compartida por los scrapers
+Guarda comprimida cada respuesta GET correcta en un archivo cuyo nombre es el
+hash de la URL, con la fecha de descarga, para que las repeticiones y las
+pruebas de los extractores lean del disco en lugar de volver a la red.
+Las fichas de empresa se guardan días; listados y búsquedas, solo un rato
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.request import ACCEPT_ENCODING
+
+from config import Config
+from reintentos import EXCEPCIONES_TRANSITORIAS, PoliticaReintentos, clasificar_error
+
+# Cabeceras que ya no describen el cuerpo guardado (se guarda descomprimido)
+CABECERAS_DESCARTADAS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+# Cabeceras con las que quien llama pide preguntar al servidor aunque haya copia
+CABECERAS_REVALIDACION = ('If-None-Match', 'If-Modified-Since')
+
+
+def segundos_retry_after(response):
+    """Segundos pedidos en la cabecera Retry-After (solo la forma numérica), o None"""
+    valor = response.headers.get('Retry-After', '')
+    try:
+        return max(float(valor), 0)
+    except ValueError:
+        return None
+
+
+class CacheHTTP:
+    """Caché de respuestas en disco con caducidad y límite de tamaño"""
+
+    def __init__(self, directorio=Config.DIRECTORIO_CACHE_HTTP, ttl=Config.TTL_CACHE_HTTP,
+                 tamano_maximo=Config.TAMANO_MAXIMO_CACHE_HTTP, ttl_listados=Config.TTL_CACHE_HTTP_LISTADOS,
+                 patrones_fichas=Config.PATRONES_URL_FICHAS):
+        self.directorio = directorio
+        # ttl vale para las fichas y ttl_listados para el resto; ttl=None no caduca nada
+        self.ttl = ttl
+        self.ttl_listados = ttl_listados
+        self.patron_fichas = re.compile('|'.join(patrones_fichas)) if patrones_fichas else None
+        self.tamano_maximo = tamano_maximo
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+        # Se calcula en la primera escritura: quien solo lee no recorre el directorio
+        self.tamano_actual = None
+
+    @staticmethod
+    def clave(url):
+        """Hash de la URL que da nombre a la entrada"""
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def caducidad(self, url):
+        """Segundos de vigencia de la entrada de la URL (None o 0: no caduca)"""
+        if not self.ttl:
+            return self.ttl
+        if self.patron_fichas and self.patron_fichas.search(url):
+            return self.ttl
+        return self.ttl_listados
+
+    def caducada(self, url, metadatos):
+        """Indica si la entrada ya no vale según la fecha en que se descargó"""
+        ttl = self.caducidad(url)
+        return bool(ttl) and time.time() - metadatos.get('fecha_descarga', 0) > ttl
+
+    def ruta(self, url):
+        """Ruta del archivo de la entrada (repartido en subdirectorios de 256 entradas)"""
+        clave = self.clave(url)
+        return os.path.join(self.directorio, clave[:2], f"{clave}.gz")
+
+    def archivos(self):
+        """Recorre los archivos de la caché"""
+        for subdirectorio in os.scandir(self.directorio):
+            if subdirectorio.is_dir():
+                for archivo in os.scandir(subdirectorio.path):
+                    if archivo.name.endswith('.gz'):
+                        yield archivo
+
+    def calcular_tamano(self):
+        """Bytes ocupados por la caché en disco"""
+        return sum(archivo.stat().st_size for archivo in self.archivos())
+
+    def obtener(self, url):
+        """Devuelve (metadatos, cuerpo) si hay una entrada vigente para la URL, o None"""
+        ruta = self.ruta(url)
+        try:
+            with gzip.open(ruta, 'rb') as f:
+                metadatos = json.loads(f.readline())
+                if self.caducada(url, metadatos):
+                    return None
+                cuerpo = f.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError, KeyError) as e:
+            logging.warning(f"Entrada de caché dañada para {url}: {e}")
+            return None
+
+        # La fecha de modificación hace de último acceso para la expulsión
+        try:
+            os.utime(ruta)
+        except OSError:
+            pass
+        return metadatos, cuerpo
+
+    def contiene(self, url):
+        """Indica si hay una entrada vigente para la URL sin leer el cuerpo"""
+        try:
+            with gzip.open(self.ruta(url), 'rb') as f:
+                metadatos = json.loads(f.readline())
+        except (OSError, EOFError, ValueError):
+            return False
+        return not self.caducada(url, metadatos)
+
+    def guardar(self, url, response):
+        """Guarda una respuesta descargada"""
+        metadatos = {
+            'url': url,
+            'url_final': response.url,
+            'status': response.status_code,
+            'encoding': response.encoding,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() not in CABECERAS_DESCARTADAS},
+            'fecha_descarga': time.time(),
+            'hash_cuerpo': hashlib.sha256(response.content).hexdigest(),
+        }
+
+        ruta = self.ruta(url)
+        temporal = f"{ruta}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            anterior = os.path.getsize(ruta) if os.path.exists(ruta) else 0
+            with gzip.open(temporal, 'wb', compresslevel=6) as f:
+                f.write(json.dumps(metadatos, ensure_ascii=False).encode('utf-8') + b'\n')
+                f.write(response.content)
+            # Reemplazo atómico: un lector nunca ve una entrada a medio escribir
+            os.replace(temporal, ruta)
+            nuevo = os.path.getsize(ruta)
+        except OSError as e:
+            logging.warning(f"No se pudo guardar en caché {url}: {e}")
+            return
+
+        with self._lock:
+            if self.tamano_actual is None:
+                self.tamano_actual = self.calcular_tamano()
+            else:
+                self.tamano_actual += nuevo - anterior
+            if self.tamano_maximo and self.tamano_actual > self.tamano_maximo:
+                self.expulsar()
+
+    def expulsar(self):
+        """Borra las entradas menos usadas hasta bajar al 90% del tamaño máximo"""
+        objetivo = self.tamano_maximo * 0.9
+        archivos = sorted(self.archivos(), key=lambda archivo: archivo.stat().st_mtime)
+        expulsadas = 0
+        for archivo in archivos:
+            if self.tamano_actual <= objetivo:
+                break
+            try:
+                tamano = archivo.stat().st_size
+                os.remove(archivo.path)
+            except OSError:
+                continue
+            self.tamano_actual -= tamano
+            expulsadas += 1
+        logging.info(f"Caché HTTP: {expulsadas} entradas expulsadas por tamaño")
+
+    def respuesta(self, url, metadatos, cuerpo):
+        """Reconstruye un requests.Response a partir de una entrada"""
+        response = requests.Response()
+        response.status_code = metadatos['status']
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(metadatos['headers'])
+        response.encoding = metadatos['encoding']
+        response.url = metadatos.get('url_final', url)
+        response._content = cuerpo
+        response.from_cache = True
+        return response
+
+
+class SesionCache(requests.Session):
+    """Sesión de requests que sirve los GET desde la caché en disco, marca el ritmo con el limitador
+    y reintenta los errores transitorios"""
+
+    def __init__(self, cache=None, limitador=None, reintentos=None):
+        super().__init__()
+        self.cache = cache
+        # Solo las peticiones que salen a la red esperan turno en el limitador
+        self.limitador = limitador
+        self.reintentos = reintentos or PoliticaReintentos()
+        # urllib3 anuncia br solo si está instalado brotli, así que nunca llega algo que no sepa descomprimir
+        self.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        self.tamano_pool = None
+        self.configurar_conexiones()
+
+    def configurar_conexiones(self, tamano_pool=Config.TAMANO_POOL_POR_HOST):
+        """Monta adaptadores con `tamano_pool` conexiones keep-alive por host"""
+        # urllib3 no repite nada por su cuenta: cada reintento pasa por PoliticaReintentos
+        # y espera turno en el limitador. Las conexiones keep-alive que el servidor cerró
+        # mientras estaban en el pool ya las descarta urllib3 antes de reutilizarlas
+        for prefijo in ('https://', 'http://'):
+            anterior = self.adapters.get(prefijo)
+            self.mount(prefijo, HTTPAdapter(pool_connections=Config.HOSTS_EN_POOL, pool_maxsize=tamano_pool,
+                                            max_retries=0))
+            if anterior:
+                anterior.close()
+        self.tamano_pool = tamano_pool
+
+    def ajustar_pool(self, concurrencia):
+        """Amplía el pool si va a haber más hilos que conexiones reutilizables"""
+        if concurrencia > self.tamano_pool:
+            self.configurar_conexiones(concurrencia)
+
+    def en_cache(self, url):
+        """Indica si un GET a la URL se serviría desde la caché"""
+        return bool(self.cache) and self.cache.contiene(url)
+
+    @staticmethod
+    def pide_revalidar(headers):
+        """Indica si la petición lleva cabeceras condicionales o Cache-Control: no-cache"""
+        headers = CaseInsensitiveDict(headers or {})
+        return (any(cabecera in headers for cabecera in CABECERAS_REVALIDACION)
+                or 'no-cache' in headers.get('Cache-Control', ''))
+
+    def request(self, method, url, *args, **kwargs):
+        usar_cache = self.cache is not None and method.upper() == 'GET' and not kwargs.get('stream')
+
+        # Una revalidación va siempre a la red; la respuesta nueva sí se guarda
+        if usar_cache and not self.pide_revalidar(kwargs.get('headers')):
+            entrada = self.cache.obtener(url)
+            if entrada:
+                return self.cache.respuesta(url, *entrada)
+
+        response = self.pedir_con_reintentos(method, url, *args, **kwargs)
+        response.from_cache = False
+
+        if usar_cache and response.status_code == 200:
+            self.cache.guardar(url, response)
+        return response
+
+    def pedir_con_reintentos(self, method, url, *args, **kwargs):
+        """Hace la petición real reintentando los errores transitorios con espera exponencial"""
+        intento = 0
+        while True:
+            enviada = self.limitador.esperar(url) if self.limitador else None
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except EXCEPCIONES_TRANSITORIAS as e:
+                transitorio, tipo = clasificar_error(e)
+                # Solo un timeout apunta a un servidor saturado; un error SSL o una
+                # conexión rechazada se reintentan (o no) sin bajar el ritmo del host
+                if self.limitador and isinstance(e, requests.Timeout):
+                    self.limitador.registrar_saturacion(url, enviada=enviada)
+                if not transitorio or not self.reintentos.quedan_intentos(intento):
+                    e.intentos = intento + 1
+                    raise
+                self.reintentos.esperar(intento, url, tipo)
+                intento += 1
+                continue
+
+            # El resultado de cada petición real ajusta el ritmo del host
+            retry_after = segundos_retry_after(response)
+            if self.limitador:
+                if response.status_code in Config.ESTADOS_SATURACION:
+                    self.limitador.registrar_saturacion(url, retry_after, enviada)
+                elif response.status_code < 500:
+                    self.limitador.registrar_exito(url)
+
+            transitorio, tipo = clasificar_error(response=response)
+            if response.status_code >= 400 and transitorio and self.reintentos.quedan_intentos(intento):
+                self.reintentos.esperar(intento, url, tipo, retry_after)
+                intento += 1
+                continue
+
+            response.intentos = intento + 1
+            return response
+
+
+def crear_sesion_cache(limitador=None, concurrencia=1):
+    """Sesión compartida de los scrapers: caché de Config, pool de conexiones, reintentos y compresión"""
+    cache = CacheHTTP() if Config.USAR_CACHE_HTTP else None
+    sesion = SesionCache(cache, limitador)
+    sesion.ajustar_pool(concurrencia)
+    return sesion
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Índice de códigos postales por municipio
+Resuelve el código postal de un municipio con una búsqueda en diccionario,
+usando la misma normalización de nombres en todos los scrapers
+"""
+
+import logging
+import unicodedata
+
+import pandas as pd
+
+from config import Config
+
+
+def normalizar_nombre(nombre):
+    """Normaliza un nombre de municipio (sin tildes, minúsculas, sin guiones)"""
+    # Quitar tildes
+    nombre = unicodedata.normalize('NFD', str(nombre)).encode('ascii', 'ignore').decode('utf-8')
+    # Convertir a minúsculas y quitar espacios extra
+    nombre = nombre.lower().strip()
+    # Quitar caracteres especiales
+    nombre = nombre.replace('-', ' ').replace('_', ' ')
+    # Quitar espacios múltiples
+    return ' '.join(nombre.split())
+
+
+class IndiceCodigosPostales:
+    """Diccionario municipio normalizado -> código postal principal"""
+
+    def __init__(self, archivo_csv=Config.ARCHIVO_CSV_ENTRADA):
+        self.codigos = self.cargar(archivo_csv)
+
+    def cargar(self, archivo_csv):
+        """Construye el índice a partir del CSV de municipios y códigos postales"""
+        try:
+            df_cp = pd.read_csv(archivo_csv, usecols=['municipio', 'codigo_postal'])
+            df_cp = df_cp.dropna(subset=['municipio', 'codigo_postal'])
+
+            codigos = {}
+            for municipio, cp in zip(df_cp['municipio'], df_cp['codigo_postal']):
+                # Se conserva el primer código postal de cada municipio
+                codigos.setdefault(normalizar_nombre(municipio), str(cp).split('.')[0])
+
+            logging.info(f"Índice de códigos postales: {len(codigos)} municipios")
+            return codigos
+        except Exception as e:
+            logging.error(f"Error cargando códigos postales: {e}")
+            return {}
+
+    def obtener(self, municipio, por_defecto=None):
+        """Devuelve el código postal del municipio o el valor por defecto"""
+        if not isinstance(municipio, str):
+            return por_defecto
+        return self.codigos.get(normalizar_nombre(municipio), por_defecto)
@@ -9,6 +9,7 @@ class Config:
     ARCHIVO_SALIDA_EXCEL = f"empresas_encontradas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
     ARCHIVO_SALIDA_CSV = f"empresas_encontradas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
     ARCHIVO_LOG = "scraper.log"
+    ARCHIVO_LISTADO_AXESOR = "listado_axesor.db"  # Cola SQLite con el listado de Axesor
 
     # Configuración de búsqueda
     MAX_CODIGOS_POSTALES = None  # None para procesar todos, número para limitar
@@ -24,6 +25,43 @@ class Config:
     TIMEOUT_REQUEST = 15
     TIMEOUT_PAGINA = 20
 
+    # Configuración de concurrencia
+    CONCURRENCIA_DETALLES = 1  # Descargas simultáneas de fichas (1 = secuencial)
+    CONCURRENCIA_MUNICIPIOS = 1  # Municipios de Axesor recorridos a la vez (1 = secuencial)
+    CONCURRENCIA_PAGINAS = 1  # Páginas de un mismo municipio descargadas a la vez (1 = secuencial)
+    MAX_PETICIONES_POR_SEGUNDO = 2  # Techo de peticiones por segundo a cada host
+
+    # Control adaptativo del ritmo por host (aumento aditivo, reducción multiplicativa)
+    TASA_INICIAL_PETICIONES = 1  # Peticiones por segundo con las que arranca cada host
+    TASA_MINIMA_PETICIONES = 0.1  # Suelo de la tasa tras reducciones seguidas
+    INCREMENTO_TASA = 0.1  # Peticiones/s que se suman tras cada respuesta correcta
+    FACTOR_REDUCCION_TASA = 0.5  # Multiplicador de la tasa ante 429, 503 o timeouts
+    ESTADOS_SATURACION = (429, 503)  # Respuestas que indican que el servidor pide ir más despacio
+
+    # Configuración de las conexiones HTTP
+    TAMANO_POOL_POR_HOST = 10  # Conexiones keep-alive reutilizables por host (como mínimo, los hilos concurrentes)
+    HOSTS_EN_POOL = 10  # Hosts distintos que conservan su propio pool
+
+    # Configuración de la caché HTTP en disco
+    USAR_CACHE_HTTP = True
+    DIRECTORIO_CACHE_HTTP = "cache_http"
+    TTL_CACHE_HTTP = 7 * 24 * 3600  # Segundos que se considera vigente una ficha de empresa descargada
+    TTL_CACHE_HTTP_LISTADOS = 3600  # Segundos para el resto (listados y búsquedas, que cambian a menudo)
+    PATRONES_URL_FICHAS = [
+        r'axesor\.es/Informes-Empresas/',  # Fichas de detalle de Axesor
+    ]
+    TAMANO_MAXIMO_CACHE_HTTP = 2 * 1024 ** 3  # Bytes; al superarse se borran las menos usadas
+
+    # Configuración del análisis de HTML
+    PARSER_HTML = None  # Backend de BeautifulSoup; None = lxml si está instalado, si no html.parser
+
+    # Configuración de escritura en SQLite
+    TAMANO_LOTE_DB = 50  # Empresas por transacción
+    INTERVALO_COMMIT_DB = 10  # Segundos máximos entre commits
+
+    # Configuración de la validación de CIF en archivos
+    TAMANO_BLOQUE_CIF = 100000  # Filas leídas, validadas y escritas de cada vez en modo por bloques
+
     # Configuración de User Agents
     USER_AGENTS = [
         'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -84,6 +122,12 @@ class Config:
         r'CNAE\s*(\d{4})'
     ]
 
+    PATRONES_CODIGO_POSTAL = [
+        r'\b30\d{3}\b',  # Códigos postales de Murcia
+        r'CP[:\s]*(\d{5})',
+        r'Código Postal[:\s]*(\d{5})'
+    ]
+
     # Configuración de logging
     NIVEL_LOG = 'INFO'
     FORMATO_LOG = '%(asctime)s - %(levelname)s - %(message)s'
@@ -97,7 +141,8 @@ class Config:
 
     # Configuración de retry
     MAX_REINTENTOS = 3
-    TIEMPO_ESPERA_REINTENTO = 5
+    TIEMPO_ESPERA_REINTENTO = 5  # Espera base; se dobla en cada reintento
+    ESPERA_MAXIMA_REINTENTO = 60  # Segundos máximos entre dos reintentos
 
     # Configuración de filtros
     FILTRAR_DUPLICADOS = True
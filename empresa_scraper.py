@@ -1,9 +1,4 @@
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-import time
-import random
-import re
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
@@ -15,15 +10,22 @@ import json
 import os
 from datetime import datetime
 
+from cache_http import crear_sesion_cache
+from config import Config
+from escaner_texto import ESCANER_EMPRESA_SCRAPER
+from limitador_peticiones import LimitadorPorHost
+from parser_html import crear_soup
+
 class EmpresaScraper:
     def __init__(self):
         self.ua = UserAgent()
-        self.session = requests.Session()
+        # El limitador adapta el ritmo de cada host y sustituye a las pausas aleatorias
+        self.limitador = LimitadorPorHost(Config.MAX_PETICIONES_POR_SEGUNDO)
+        self.session = crear_sesion_cache(self.limitador)
         self.session.headers.update({
             'User-Agent': self.ua.random,
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
             'Accept-Language': 'es-ES,es;q=0.8,en-US;q=0.5,en;q=0.3',
-            'Accept-Encoding': 'gzip, deflate',
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
         })
@@ -48,26 +50,6 @@ class EmpresaScraper:
             print(f"Error al cargar el CSV: {e}")
             return []
 
-    def extraer_cif_de_texto(self, texto):
-        """Extrae CIF del texto usando patrones regex"""
-        from config import Config
-
-        for patron in Config.PATRONES_CIF:
-            matches = re.findall(patron, texto, re.IGNORECASE)
-            if matches:
-                for match in matches:
-                    # Si el patrón tiene grupos, tomar el primer grupo
-                    if isinstance(match, tuple):
-                        cif = match[0]
-                    else:
-                        cif = match
-
-                    # Validar CIF
-                    if Config.validar_cif(cif):
-                        return cif.upper()
-
-        return None
-
     def buscar_en_google(self, codigo_postal, pagina=1):
         """Busca empresas en Google para un código postal específico"""
         from config import Config
@@ -77,7 +59,7 @@ class EmpresaScraper:
         try:
             response = self.session.get(url, timeout=10)
             if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
+                soup = crear_soup(response.content)
                 resultados = []
 
                 # Buscar enlaces de resultados
@@ -113,7 +95,7 @@ class EmpresaScraper:
             response = self.session.get(url, timeout=15)
 
             if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
+                soup = crear_soup(response.content)
                 empresas = []
 
                 # Buscar empresas en los resultados
@@ -133,7 +115,7 @@ class EmpresaScraper:
 
                         # Extraer CIF si está disponible
                         texto_completo = nombre.get_text() + " " + (direccion.get_text() if direccion else "")
-                        cif = self.extraer_cif_de_texto(texto_completo)
+                        cif = ESCANER_EMPRESA_SCRAPER.buscar('cif', texto_completo)
                         if cif:
                             empresa_data['cif'] = cif
 
@@ -154,7 +136,7 @@ class EmpresaScraper:
             response = self.session.get(url, timeout=15)
 
             if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
+                soup = crear_soup(response.content)
                 empresas = []
 
                 # Buscar empresas en los resultados
@@ -174,7 +156,7 @@ class EmpresaScraper:
 
                         # Extraer CIF
                         texto_completo = nombre.get_text() + " " + (direccion.get_text() if direccion else "")
-                        cif = self.extraer_cif_de_texto(texto_completo)
+                        cif = ESCANER_EMPRESA_SCRAPER.buscar('cif', texto_completo)
                         if cif:
                             empresa_data['cif'] = cif
 
@@ -193,41 +175,16 @@ class EmpresaScraper:
         try:
             response = self.session.get(url, timeout=15)
             if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
-
-                # Buscar información de contacto
-                email = ""
-                telefono = ""
-                cnae = ""
-                cif = ""
-
-                # Buscar email
-                from config import Config
-                email_pattern = Config.PATRONES_EMAIL[0]
-                emails = re.findall(email_pattern, response.text)
-                if emails:
-                    email = emails[0]
-
-                # Buscar teléfono
-                telefono_pattern = r'(\+34\s?)?[6-9]\d{8}'
-                telefonos = re.findall(telefono_pattern, response.text)
-                if telefonos:
-                    telefono = telefonos[0]
-
-                # Buscar CIF
-                cif = self.extraer_cif_de_texto(response.text)
-
-                # Buscar CNAE
-                cnae_pattern = r'CNAE[:\s]*(\d{4})'
-                cnae_match = re.search(cnae_pattern, response.text)
-                if cnae_match:
-                    cnae = cnae_match.group(1)
+                soup = crear_soup(response.content)
+
+                # Email, teléfono, CIF y CNAE con el escáner compartido
+                entidades = ESCANER_EMPRESA_SCRAPER.extraer(response.text)
 
                 return {
-                    'email': email,
-                    'telefono': telefono,
-                    'cif': cif,
-                    'cnae': cnae
+                    'email': entidades['email'] or "",
+                    'telefono': entidades['telefono'] or "",
+                    'cif': entidades['cif'],
+                    'cnae': entidades['cnae'] or ""
                 }
             else:
                 return {'email': '', 'telefono': '', 'cif': '', 'cnae': ''}
@@ -265,9 +222,6 @@ class EmpresaScraper:
 
                 empresas_codigo.append(empresa)
 
-            # Pausa entre páginas
-            time.sleep(random.uniform(2, 5))
-
         # Buscar en eInforma
         print(f"  Buscando en eInforma...")
         empresas_einforma = self.buscar_en_einforma(codigo_postal)
@@ -331,9 +285,6 @@ class EmpresaScraper:
             self.empresas_encontradas.extend(empresas)
             total_empresas += len(empresas)
 
-            # Pausa entre códigos postales
-            time.sleep(random.uniform(3, 7))
-
         print(f"\nBúsqueda completada. Total de empresas encontradas: {total_empresas}")
         return self.empresas_encontradas
 
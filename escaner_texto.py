@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Escáner de CIF, CNAE, email, teléfono y código postal en texto
+Compila una sola vez los patrones de cada scraper y los recorre por prioridad,
+parando en la primera coincidencia válida de cada entidad. Antes de pasar un
+patrón por el texto se comprueba que su parte fija ("CIF", "CNAE", "@"...) aparece,
+así los patrones que no pueden coincidir no recorren la página entera. La
+validación (dígito de control del CIF) se aplica después, solo a los candidatos
+"""
+
+import re
+
+from config import Config
+from validador_cif import ValidadorCIF
+
+# Teléfono español de 9 cifras con prefijo +34 opcional; el valor es la coincidencia entera
+PATRON_TELEFONO = r'(\+34\s?)?[6-9]\d{8}'
+
+# Patrones de cada scraper: entidad -> (patrones en orden de prioridad, flags de re).
+# Son los que usaba cada uno por su cuenta, con las mismas mayúsculas/minúsculas
+PATRONES_EMPRESA_SCRAPER = {
+    'cif': (Config.PATRONES_CIF, re.IGNORECASE),
+    'email': (Config.PATRONES_EMAIL[:1], 0),
+    'telefono': ([PATRON_TELEFONO], 0),
+    'cnae': ([r'CNAE[:\s]*(\d{4})'], 0),
+}
+
+PATRONES_SCRAPER_AVANZADO = {
+    'cif': (Config.PATRONES_CIF, re.IGNORECASE),
+    'email': (Config.PATRONES_EMAIL[:1], 0),
+    'telefono': ([PATRON_TELEFONO], 0),
+    'cnae': ([r'CNAE[:\s]*(\d{4})', r'Actividad[:\s]*(\d{4})', r'Código[:\s]*(\d{4})'], re.IGNORECASE),
+}
+
+PATRONES_AXESOR = {
+    'cif': ([
+        r'\b[A-Z]\d{8}\b',
+        r'\b[A-Z]\d{7}[A-Z]\b',
+        r'CIF[:\s]*([A-Z]\d{7,8}[A-Z]?)',
+        r'Código[:\s]*([A-Z]\d{7,8}[A-Z]?)',
+        r'Fiscal[:\s]*([A-Z]\d{7,8}[A-Z]?)',
+    ], re.IGNORECASE),
+    'cnae': ([r'CNAE[:\s]*(\d{4})', r'Actividad[:\s]*(\d{4})', r'Código[:\s]*(\d{4})'], re.IGNORECASE),
+    'codigo_postal': (Config.PATRONES_CODIGO_POSTAL, 0),
+}
+
+# Entidades cuyo valor es el primer grupo del patrón (p. ej. el CIF tras "CIF:");
+# en el resto el grupo es opcional (prefijo +34) y el valor es la coincidencia entera
+VALOR_EN_GRUPO = {'cif', 'cnae', 'codigo_postal'}
+
+
+def cif_valido(cif):
+    """Comprueba formato y dígito de control de un CIF candidato"""
+    return ValidadorCIF.validar_cif_completo(cif)[0]
+
+
+# Comprobación que debe pasar cada candidato para darlo por bueno
+VALIDADORES = {
+    'cif': cif_valido,
+}
+
+
+def literal_obligatorio(patron):
+    """Trozo de texto fijo que tiene que aparecer en la página para que el patrón coincida ('' si no hay)
+
+    Solo mira el nivel exterior del patrón: lo que va entre paréntesis o corchetes
+    puede ser opcional o variable, y con una alternativa '|' no hay nada obligatorio
+    """
+    tramos = []
+    actual = ''
+    profundidad = 0
+    i = 0
+    while i < len(patron):
+        caracter = patron[i]
+        siguiente = patron[i + 1] if i + 1 < len(patron) else ''
+        literal = None
+        if caracter == '\\':
+            # \( o \. son caracteres fijos; \d, \s, \b... no
+            if siguiente and not siguiente.isalnum():
+                literal = siguiente
+            i += 2
+        elif caracter == '[':
+            # Se salta la clase entera (un ']' justo al principio forma parte de ella)
+            i = patron.index(']', i + 2 if siguiente == ']' else i + 1) + 1
+        elif caracter == '{':
+            # Repeticiones {n,m}: no son texto
+            i = patron.index('}', i) + 1
+        else:
+            if caracter == '(':
+                profundidad += 1
+            elif caracter == ')':
+                profundidad -= 1
+            elif caracter == '|' and profundidad == 0:
+                return ''
+            elif caracter not in '.^$*+?':
+                literal = caracter
+            i += 1
+
+        # Un carácter seguido de ?, * o {n,m} puede no estar
+        if literal is not None and profundidad == 0 and patron[i:i + 1] not in ('?', '*', '{'):
+            actual += literal
+        else:
+            tramos.append(actual)
+            actual = ''
+    tramos.append(actual)
+    return max(tramos, key=len)
+
+
+class EscanerTexto:
+    """Busca las entidades de un texto con expresiones compiladas una sola vez"""
+
+    def __init__(self, patrones, validadores=VALIDADORES):
+        # Cada entidad guarda sus expresiones en orden de prioridad con el grupo del
+        # valor y el literal que debe aparecer en el texto (en minúsculas si no distingue)
+        self.expresiones = {}
+        for entidad, (lista, flags) in patrones.items():
+            compiladas = []
+            for patron in lista:
+                expresion = re.compile(patron, flags)
+                grupo_valor = 1 if expresion.groups and entidad in VALOR_EN_GRUPO else 0
+                literal = literal_obligatorio(patron)
+                sin_mayusculas = bool(flags & re.IGNORECASE)
+                compiladas.append((expresion, grupo_valor, literal.lower() if sin_mayusculas else literal,
+                                   sin_mayusculas))
+            self.expresiones[entidad] = compiladas
+        self.validadores = validadores
+
+    def candidatos(self, entidad, texto, minusculas=None):
+        """Genera los valores de una entidad por prioridad del patrón y posición en el texto"""
+        if not texto:
+            return
+        for expresion, grupo_valor, literal, sin_mayusculas in self.expresiones[entidad]:
+            # Buscar un texto fijo es mucho más barato que pasar el patrón por toda la página
+            if literal:
+                if sin_mayusculas:
+                    minusculas = texto.lower() if minusculas is None else minusculas
+                    if literal not in minusculas:
+                        continue
+                elif literal not in texto:
+                    continue
+            # finditer es perezoso: el texto solo se recorre hasta el primer candidato aceptado
+            for coincidencia in expresion.finditer(texto):
+                valor = coincidencia.group(grupo_valor)
+                if valor:
+                    yield valor.strip()
+
+    def buscar(self, entidad, texto, minusculas=None):
+        """Primer valor de la entidad que pasa su validación (None si no hay ninguno)"""
+        validar = self.validadores.get(entidad)
+        descartados = set()
+        for valor in self.candidatos(entidad, texto, minusculas):
+            if validar is None:
+                return valor
+            # Varios patrones suelen encontrar el mismo valor: se valida una sola vez
+            if valor in descartados:
+                continue
+            if validar(valor):
+                return valor.upper() if entidad == 'cif' else valor
+            descartados.add(valor)
+        return None
+
+    def extraer(self, texto, entidades=None):
+        """Primer valor válido de cada entidad pedida (por defecto, de todas las del escáner)"""
+        # El texto en minúsculas se calcula una vez y lo comparten todas las entidades
+        minusculas = texto.lower() if texto else None
+        return {entidad: self.buscar(entidad, texto, minusculas) for entidad in (entidades or self.expresiones)}
+
+
+# Un escáner por scraper: las expresiones se compilan una vez por proceso
+ESCANER_EMPRESA_SCRAPER = EscanerTexto(PATRONES_EMPRESA_SCRAPER)
+ESCANER_SCRAPER_AVANZADO = EscanerTexto(PATRONES_SCRAPER_AVANZADO)
+ESCANER_AXESOR = EscanerTexto(PATRONES_AXESOR)
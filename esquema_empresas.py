@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Esquema compartido de empresas_detalles
+Campos de la ficha, contadores de estadisticas_procesamiento y la columna
+version_cambio que siguen los clientes en directo. No depende de la red ni de
+pandas, así que lo pueden importar tanto los procesos que escriben (scraper,
+re-extracción) como el servidor web, que solo lee
+"""
+
+# Contadores de estadisticas_procesamiento y condición que debe cumplir cada fila
+# para sumar en ellos ({fila} se sustituye por NEW u OLD en los triggers)
+CONDICIONES_ESTADISTICAS = [
+    ('empresas_con_direccion', "{fila}.direccion IS NOT NULL AND {fila}.direccion != ''"),
+    ('empresas_con_telefono', "{fila}.telefono IS NOT NULL AND {fila}.telefono != ''"),
+    ('empresas_con_cif', "{fila}.cif IS NOT NULL AND {fila}.cif != ''"),
+    ('empresas_con_web', "{fila}.sitio_web IS NOT NULL AND {fila}.sitio_web != '' AND {fila}.sitio_web != 'N/A'"),
+    ('empresas_con_email', "{fila}.email IS NOT NULL AND {fila}.email != ''"),
+    ('empresas_con_fecha', "{fila}.fecha_constitucion IS NOT NULL AND {fila}.fecha_constitucion != ''"),
+    ('empresas_con_cnae', "{fila}.cnae IS NOT NULL AND {fila}.cnae != ''"),
+    ('empresas_con_objeto', "{fila}.objeto_social IS NOT NULL AND {fila}.objeto_social != ''"),
+]
+
+# Campos que se extraen de la ficha de cada empresa
+CAMPOS_DETALLE = [
+    'direccion', 'telefono', 'cif', 'sitio_web', 'email', 'fecha_constitucion', 'cnae', 'objeto_social'
+]
+
+# Columnas cuyo cambio da a la empresa un número nuevo en version_cambio
+COLUMNAS_VERSIONADAS = ['razon_social', 'municipio', 'codigo_postal'] + CAMPOS_DETALLE + ['url_detalles']
+
+
+def asegurar_version_cambios(conn):
+    """Prepara version_cambio, el cursor de /api/empresas/cambios y del flujo SSE
+
+    Cada alta o modificación de una empresa recibe el siguiente número de
+    secuencia_cambios, también los UPDATE en el sitio de reextraer_detalles.py,
+    que conservan el id y por eso no se podían seguir con él
+    """
+    columnas = [fila[1] for fila in conn.execute("PRAGMA table_info(empresas_detalles)")]
+    if 'version_cambio' not in columnas:
+        conn.execute("ALTER TABLE empresas_detalles ADD COLUMN version_cambio INTEGER")
+        # Hasta ahora el cursor era el id: las filas existentes conservan esa posición
+        conn.execute("UPDATE empresas_detalles SET version_cambio = id")
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS secuencia_cambios (
+            id INTEGER PRIMARY KEY,
+            ultimo INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO secuencia_cambios (id, ultimo)
+        SELECT 1, COALESCE(MAX(version_cambio), 0) FROM empresas_detalles
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_empresas_version ON empresas_detalles(version_cambio)")
+
+    # El trigger de actualización solo atiende a las columnas de datos, así que
+    # el UPDATE de version_cambio no lo vuelve a disparar
+    triggers = {
+        'version_tras_insertar': 'INSERT',
+        'version_tras_actualizar': f"UPDATE OF {', '.join(COLUMNAS_VERSIONADAS)}",
+    }
+    for nombre, evento in triggers.items():
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {nombre} AFTER {evento} ON empresas_detalles
+            BEGIN
+                UPDATE secuencia_cambios SET ultimo = ultimo + 1 WHERE id = 1;
+                UPDATE empresas_detalles
+                SET version_cambio = (SELECT ultimo FROM secuencia_cambios WHERE id = 1)
+                WHERE id = NEW.id;
+            END
+        ''')
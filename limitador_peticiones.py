@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Limitador de peticiones por host
+Reparte los turnos de petición entre hilos y adapta el ritmo de cada
+servidor a lo que aguanta: sube la tasa poco a poco mientras las respuestas
+son correctas y la divide ante 429, 503 o timeouts (AIMD), sin pasar nunca
+de un máximo de peticiones por segundo
+"""
+
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+from config import Config
+
+
+class LimitadorPorHost:
+    """Controla la tasa de peticiones por host de forma segura entre hilos"""
+
+    def __init__(self, peticiones_por_segundo=None, tasa_inicial=Config.TASA_INICIAL_PETICIONES,
+                 tasa_minima=Config.TASA_MINIMA_PETICIONES, incremento=Config.INCREMENTO_TASA,
+                 factor_reduccion=Config.FACTOR_REDUCCION_TASA):
+        # Techo de la tasa; None o 0 lo desactiva y la tasa solo la limita el servidor
+        self.peticiones_por_segundo = peticiones_por_segundo
+        self.tasa_inicial = min(tasa_inicial, peticiones_por_segundo) if peticiones_por_segundo else tasa_inicial
+        self.tasa_minima = tasa_minima
+        self.incremento = incremento
+        self.factor_reduccion = factor_reduccion
+        self._lock = threading.Lock()
+        self._proximo_turno = {}
+        self._tasas = {}
+        self._ultima_reduccion = {}
+
+    @staticmethod
+    def _host(url):
+        """Host al que se reparte el turno"""
+        return urlparse(url).netloc
+
+    def _intervalo(self, host):
+        """Segundos mínimos entre dos peticiones al mismo host con su tasa actual"""
+        return 1.0 / self._tasas.get(host, self.tasa_inicial)
+
+    def esperar(self, url):
+        """Bloquea hasta que haya turno libre para el host de la URL; devuelve cuándo se pidió el turno"""
+        host = self._host(url)
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self._proximo_turno.get(host, ahora))
+            self._proximo_turno[host] = turno + self._intervalo(host)
+
+        espera = turno - ahora
+        if espera > 0:
+            time.sleep(espera)
+        return ahora
+
+    def registrar_exito(self, url):
+        """Aumento aditivo: cada respuesta correcta sube un poco la tasa del host"""
+        host = self._host(url)
+        with self._lock:
+            tasa = self._tasas.get(host, self.tasa_inicial) + self.incremento
+            if self.peticiones_por_segundo:
+                tasa = min(tasa, self.peticiones_por_segundo)
+            self._tasas[host] = tasa
+
+    def registrar_saturacion(self, url, retry_after=None, enviada=None):
+        """Reducción multiplicativa ante 429, 503 o timeouts; respeta Retry-After si llega"""
+        host = self._host(url)
+        with self._lock:
+            anterior = self._tasas.get(host, self.tasa_inicial)
+            # Las peticiones que ya tenían turno al reducir traen el mismo aviso:
+            # solo cuenta una reducción por episodio de saturación
+            repetida = enviada is not None and enviada < self._ultima_reduccion.get(host, float('-inf'))
+            tasa = anterior if repetida else max(anterior * self.factor_reduccion, self.tasa_minima)
+            self._tasas[host] = tasa
+            if not repetida:
+                self._ultima_reduccion[host] = time.monotonic()
+
+            # Aplazar el siguiente turno del host con el nuevo intervalo (o lo que pida el servidor)
+            pausa = max(1.0 / tasa, retry_after or 0)
+            self._proximo_turno[host] = max(self._proximo_turno.get(host, 0), time.monotonic() + pausa)
+        if repetida:
+            return
+        logging.warning(f"Servidor saturado ({host}): tasa reducida de {anterior:.2f} a {tasa:.2f} peticiones/s")
+
+    def tasa_actual(self, url):
+        """Peticiones por segundo que se están haciendo al host de la URL"""
+        with self._lock:
+            return self._tasas.get(self._host(url), self.tasa_inicial)
+
+    def tasas(self):
+        """Tasa actual de cada host al que ya se ha hecho alguna petición"""
+        with self._lock:
+            return dict(self._tasas)
+
+    def describir(self):
+        """Resumen legible de las tasas actuales para los registros de progreso"""
+        tasas = self.tasas()
+        if not tasas:
+            return f"{self.tasa_inicial:.2f} peticiones/s"
+        return ", ".join(f"{host} {tasa:.2f}/s" for host, tasa in sorted(tasas.items()))
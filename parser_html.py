@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Análisis de HTML compartido por los scrapers
+Elige el backend de BeautifulSoup (lxml si está instalado, html.parser si no)
+y permite construir solo las partes de la página que lee cada extractor
+"""
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from config import Config
+
+
+def elegir_parser(preferido=Config.PARSER_HTML):
+    """Backend configurado o, si no se indica, lxml cuando está disponible"""
+    if preferido:
+        return preferido
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+
+PARSER_HTML = elegir_parser()
+
+# Partes de la página que necesita cada extractor (el resto no se llega a construir)
+SOLO_TABLAS = SoupStrainer('table')
+SOLO_ENLACES = SoupStrainer('a', href=True)
+SOLO_LISTADO = SoupStrainer(['table', 'a'])
+
+
+def crear_soup(html, solo=None):
+    """Parsea el HTML con el backend elegido, limitado a las etiquetas de `solo` si se indica"""
+    return BeautifulSoup(html, PARSER_HTML, parse_only=solo)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Re-extracción de detalles de empresas desde la caché HTTP
+Vuelve a pasar el HTML ya descargado de cada ficha por los extractores
+actuales de ScraperDetallesSQLite, repartiendo el trabajo entre varios
+procesos, y actualiza empresas_detalles por lotes sin hacer peticiones
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cache_http import CacheHTTP
+from config import Config
+from esquema_empresas import CAMPOS_DETALLE, asegurar_version_cambios
+from scraper_detalles_empresas_sqlite import ExtractorDetalles
+
+# Estado de cada proceso trabajador (se crea una vez por proceso)
+_cache = None
+_extractor = None
+
+
+def iniciar_trabajador(directorio_cache):
+    """Prepara la caché y los extractores de un proceso trabajador"""
+    global _cache, _extractor
+    # Sin caducidad: para re-extraer vale cualquier copia guardada
+    _cache = CacheHTTP(directorio_cache, ttl=None, tamano_maximo=None)
+    _extractor = ExtractorDetalles()
+
+
+def extraer_desde_cache(url_detalles):
+    """Extrae los campos de una ficha guardada; devuelve (url, campos o None si no está en caché)"""
+    entrada = _cache.obtener(url_detalles)
+    if not entrada:
+        return url_detalles, None
+    _, html = entrada
+    return url_detalles, _extractor.extraer_campos(html)
+
+
+def actualizar_lote(conn, lote):
+    """Actualiza un lote de empresas en una sola transacción y devuelve cuántas cambiaron"""
+    asignaciones = ", ".join(f"{campo} = ?" for campo in CAMPOS_DETALLE)
+    # Solo se tocan las filas con algún campo distinto, así los triggers de
+    # estadísticas no trabajan para las que no cambian
+    diferencias = " OR ".join(f"{campo} IS NOT ?" for campo in CAMPOS_DETALLE)
+    with conn:
+        cursor = conn.executemany(f'''
+            UPDATE empresas_detalles SET {asignaciones}
+            WHERE url_detalles = ? AND ({diferencias})
+        ''', lote)
+    return cursor.rowcount
+
+
+def reextraer(db_path='empresas_murcia.db', directorio_cache=Config.DIRECTORIO_CACHE_HTTP, procesos=None,
+              tamano_lote=500, max_empresas=None):
+    """Re-extrae los detalles de todas las empresas con ficha en caché"""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # Las filas actualizadas conservan su id: los clientes en directo las ven por version_cambio
+    with conn:
+        asegurar_version_cambios(conn)
+
+    query = "SELECT url_detalles FROM empresas_detalles WHERE url_detalles IS NOT NULL ORDER BY id"
+    if max_empresas:
+        query += f" LIMIT {int(max_empresas)}"
+    urls = [fila[0] for fila in conn.execute(query)]
+
+    procesos = procesos or os.cpu_count() or 1
+    logging.info(f"Re-extrayendo {len(urls)} empresas con {procesos} procesos")
+
+    inicio = time.time()
+    procesadas = sin_cache = actualizadas = 0
+    lote = []
+    with ProcessPoolExecutor(max_workers=procesos, initializer=iniciar_trabajador,
+                             initargs=(directorio_cache,)) as executor:
+        # chunksize reparte las URLs en paquetes para no pagar un viaje entre procesos por ficha
+        for url_detalles, campos in executor.map(extraer_desde_cache, urls, chunksize=50):
+            if campos is None:
+                sin_cache += 1
+                continue
+
+            procesadas += 1
+            valores = [campos[campo] for campo in CAMPOS_DETALLE]
+            lote.append(valores + [url_detalles] + valores)
+            if len(lote) >= tamano_lote:
+                actualizadas += actualizar_lote(conn, lote)
+                lote = []
+
+    if lote:
+        actualizadas += actualizar_lote(conn, lote)
+    conn.close()
+
+    logging.info(f"Re-extracción completada en {time.time() - inicio:.1f}s: {procesadas} fichas procesadas, "
+                 f"{actualizadas} empresas actualizadas, {sin_cache} sin ficha en caché")
+    return {'procesadas': procesadas, 'actualizadas': actualizadas, 'sin_cache': sin_cache}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-extrae los detalles de empresas desde la caché HTTP')
+    parser.add_argument('--db-path', default='empresas_murcia.db', help='Ruta de la base de datos SQLite')
+    parser.add_argument('--directorio-cache', default=Config.DIRECTORIO_CACHE_HTTP,
+                        help='Directorio de la caché HTTP')
+    parser.add_argument('--procesos', type=int, help='Procesos trabajadores (por defecto, uno por núcleo)')
+    parser.add_argument('--tamano-lote', type=int, default=500, help='Empresas actualizadas por transacción')
+    parser.add_argument('--max-empresas', type=int, help='Número máximo de empresas a re-extraer')
+
+    args = parser.parse_args()
+    reextraer(args.db_path, args.directorio_cache, args.procesos, args.tamano_lote, args.max_empresas)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reintentos de peticiones y registro de fallos permanentes
+Clasifica cada error como transitorio (timeouts, cortes de conexión, 429 y
+5xx), que se reintenta con espera exponencial con jitter, o permanente, que
+se anota en la tabla fallos_permanentes para no perder la fila de vista
+"""
+
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+import requests
+
+from config import Config
+
+# Respuestas que suelen arreglarse solas esperando un poco
+ESTADOS_TRANSITORIOS = (429, 500, 502, 503, 504)
+
+# Errores de red que merecen otro intento (un error SSL no se arregla reintentando)
+EXCEPCIONES_TRANSITORIAS = (requests.Timeout, requests.ConnectionError, requests.exceptions.ChunkedEncodingError)
+EXCEPCIONES_PERMANENTES = (requests.exceptions.SSLError,)
+
+
+def clasificar_error(error=None, response=None):
+    """Devuelve (transitorio, tipo) para una excepción o una respuesta con error"""
+    if response is None and isinstance(error, requests.HTTPError):
+        response = error.response
+    if response is not None:
+        return response.status_code in ESTADOS_TRANSITORIOS, f"http_{response.status_code}"
+    if isinstance(error, EXCEPCIONES_PERMANENTES):
+        return False, type(error).__name__
+    return isinstance(error, EXCEPCIONES_TRANSITORIAS), type(error).__name__
+
+
+class PoliticaReintentos:
+    """Número de reintentos y esperas exponenciales con jitter entre ellos"""
+
+    def __init__(self, max_reintentos=Config.MAX_REINTENTOS, espera_base=Config.TIEMPO_ESPERA_REINTENTO,
+                 espera_maxima=Config.ESPERA_MAXIMA_REINTENTO):
+        self.max_reintentos = max_reintentos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+
+    def quedan_intentos(self, intento):
+        """Indica si tras el intento número `intento` (desde 0) se puede volver a probar"""
+        return intento < self.max_reintentos
+
+    def calcular_espera(self, intento, retry_after=None):
+        """Segundos de espera antes del reintento: la mitad fija y la otra mitad al azar"""
+        # El jitter evita que los hilos que fallaron a la vez vuelvan a la vez
+        techo = min(self.espera_maxima, self.espera_base * 2 ** intento)
+        espera = techo / 2 + random.uniform(0, techo / 2)
+        return max(espera, retry_after or 0)
+
+    def esperar(self, intento, url, motivo, retry_after=None):
+        """Duerme antes de reintentar y deja constancia en el log"""
+        espera = self.calcular_espera(intento, retry_after)
+        logging.warning(f"{motivo} en {url}; reintento {intento + 1}/{self.max_reintentos} en {espera:.1f}s")
+        time.sleep(espera)
+
+
+class RegistroFallos:
+    """Tabla fallos_permanentes (dead letter) con su propia conexión SQLite
+
+    Va en una conexión aparte de la del proceso que la usa: un commit aquí no
+    confirma nada a medias de esa conexión, como un lote de empresas sin cerrar
+    """
+
+    def __init__(self, db_path, origen):
+        self.origen = origen
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.lock, self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS fallos_permanentes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    origen TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    contexto TEXT,
+                    tipo_error TEXT,
+                    detalle TEXT,
+                    intentos INTEGER,
+                    fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(origen, url)
+                )
+            ''')
+            # Solo se borra de la tabla lo que falló antes, sin consultar por cada acierto
+            self.urls = {fila[0] for fila in self.conn.execute(
+                "SELECT url FROM fallos_permanentes WHERE origen = ?", (origen,))}
+
+    def registrar(self, url, error=None, response=None, contexto=None):
+        """Anota (o actualiza) el fallo definitivo de una URL"""
+        if response is None and isinstance(error, requests.HTTPError):
+            response = error.response
+        transitorio, tipo = clasificar_error(error, response)
+        intentos = getattr(response if response is not None else error, 'intentos', 1)
+        detalle = str(error) if error is not None else getattr(response, 'reason', None)
+        try:
+            with self.lock, self.conn:
+                self.conn.execute('''
+                    INSERT OR REPLACE INTO fallos_permanentes
+                    (origen, url, contexto, tipo_error, detalle, intentos, fecha)
+                    VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ''', (self.origen, url, json.dumps(contexto, ensure_ascii=False) if contexto else None,
+                      tipo, detalle, intentos))
+                self.urls.add(url)
+        except Exception as e:
+            logging.error(f"Error registrando fallo permanente de {url}: {e}")
+            return
+        estado = "agotados los reintentos" if transitorio else "error permanente"
+        logging.error(f"Fallo registrado en fallos_permanentes ({estado}, {tipo}): {url}")
+
+    def resolver(self, url):
+        """Quita una URL de la tabla cuando por fin se procesa bien"""
+        if url not in self.urls:
+            return
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM fallos_permanentes WHERE origen = ? AND url = ?", (self.origen, url))
+            self.urls.discard(url)
+
+    def vaciar(self):
+        """Borra los fallos de este origen (al empezar un recorrido desde cero)"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM fallos_permanentes WHERE origen = ?", (self.origen,))
+            self.urls.clear()
+
+    def total(self):
+        """Número de fallos pendientes de este origen"""
+        return len(self.urls)
+
+    def cerrar(self):
+        """Cierra la conexión del registro"""
+        with self.lock:
+            self.conn.close()
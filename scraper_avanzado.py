@@ -1,15 +1,16 @@
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-import time
-import random
-import re
 import json
 from urllib.parse import urljoin, urlparse
 import logging
 from datetime import datetime
 import os
 
+from cache_http import crear_sesion_cache
+from config import Config
+from escaner_texto import ESCANER_SCRAPER_AVANZADO
+from limitador_peticiones import LimitadorPorHost
+from parser_html import crear_soup
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -22,12 +23,13 @@ logging.basicConfig(
 
 class ScraperAvanzado:
     def __init__(self):
-        self.session = requests.Session()
+        # El limitador adapta el ritmo de cada host y sustituye a las pausas aleatorias
+        self.limitador = LimitadorPorHost(Config.MAX_PETICIONES_POR_SEGUNDO)
+        self.session = crear_sesion_cache(self.limitador)
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
             'Accept-Language': 'es-ES,es;q=0.8,en-US;q=0.5,en;q=0.3',
-            'Accept-Encoding': 'gzip, deflate',
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
         })
@@ -61,7 +63,7 @@ class ScraperAvanzado:
                     response = self.session.get(url, timeout=15)
 
                     if response.status_code == 200:
-                        soup = BeautifulSoup(response.content, 'html.parser')
+                        soup = crear_soup(response.content)
 
                         # Buscar resultados de Google
                         for resultado in soup.find_all(['div', 'article'], class_=['g', 'result']):
@@ -81,8 +83,6 @@ class ScraperAvanzado:
                                     if datos_empresa:
                                         empresas.append(datos_empresa)
 
-                    time.sleep(random.uniform(2, 4))
-
                 except Exception as e:
                     logging.error(f"Error en búsqueda Google: {e}")
                     continue
@@ -96,7 +96,7 @@ class ScraperAvanzado:
             response = self.session.get(url, timeout=15)
 
             if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
+                soup = crear_soup(response.content)
                 empresas = []
 
                 # Buscar empresas en los resultados
@@ -115,7 +115,7 @@ class ScraperAvanzado:
                         }
 
                         # Extraer CIF si está disponible
-                        cif = self.extraer_cif_de_texto(nombre.get_text() + " " + (direccion.get_text() if direccion else ""))
+                        cif = ESCANER_SCRAPER_AVANZADO.buscar('cif', nombre.get_text() + " " + (direccion.get_text() if direccion else ""))
                         if cif:
                             empresa_data['cif'] = cif
 
@@ -136,7 +136,7 @@ class ScraperAvanzado:
             response = self.session.get(url, timeout=15)
 
             if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
+                soup = crear_soup(response.content)
                 empresas = []
 
                 # Buscar empresas en los resultados
@@ -155,7 +155,7 @@ class ScraperAvanzado:
                         }
 
                         # Extraer CIF
-                        cif = self.extraer_cif_de_texto(nombre.get_text() + " " + (direccion.get_text() if direccion else ""))
+                        cif = ESCANER_SCRAPER_AVANZADO.buscar('cif', nombre.get_text() + " " + (direccion.get_text() if direccion else ""))
                         if cif:
                             empresa_data['cif'] = cif
 
@@ -169,32 +169,12 @@ class ScraperAvanzado:
             logging.error(f"Error en InfoEmpresas: {e}")
             return []
 
-    def extraer_cif_de_texto(self, texto):
-        """Extrae CIF del texto usando patrones regex"""
-        from config import Config
-
-        for patron in Config.PATRONES_CIF:
-            matches = re.findall(patron, texto, re.IGNORECASE)
-            if matches:
-                for match in matches:
-                    # Si el patrón tiene grupos, tomar el primer grupo
-                    if isinstance(match, tuple):
-                        cif = match[0]
-                    else:
-                        cif = match
-
-                    # Validar CIF
-                    if Config.validar_cif(cif):
-                        return cif.upper()
-
-        return None
-
     def extraer_datos_pagina(self, url, codigo_postal):
         """Extrae datos detallados de una página web"""
         try:
             response = self.session.get(url, timeout=20)
             if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
+                soup = crear_soup(response.content)
 
                 # Buscar nombre de empresa
                 nombre_empresa = ""
@@ -215,36 +195,12 @@ class ScraperAvanzado:
                         direccion = elem.get_text().strip()
                         break
 
-                # Buscar email
-                email = ""
-                from config import Config
-                email_pattern = Config.PATRONES_EMAIL[0]
-                emails = re.findall(email_pattern, response.text)
-                if emails:
-                    email = emails[0]
-
-                # Buscar teléfono
-                telefono = ""
-                telefono_pattern = r'(\+34\s?)?[6-9]\d{8}'
-                telefonos = re.findall(telefono_pattern, response.text)
-                if telefonos:
-                    telefono = telefonos[0]
-
-                # Buscar CIF
-                cif = self.extraer_cif_de_texto(response.text)
-
-                # Buscar CNAE
-                cnae = ""
-                cnae_patterns = [
-                    r'CNAE[:\s]*(\d{4})',
-                    r'Actividad[:\s]*(\d{4})',
-                    r'Código[:\s]*(\d{4})'
-                ]
-                for pattern in cnae_patterns:
-                    match = re.search(pattern, response.text, re.IGNORECASE)
-                    if match:
-                        cnae = match.group(1)
-                        break
+                # Email, teléfono, CIF y CNAE con el escáner compartido
+                entidades = ESCANER_SCRAPER_AVANZADO.extraer(response.text)
+                email = entidades['email'] or ""
+                telefono = entidades['telefono'] or ""
+                cif = entidades['cif']
+                cnae = entidades['cnae'] or ""
 
                 return {
                     'razon_social': nombre_empresa,
@@ -274,7 +230,7 @@ class ScraperAvanzado:
             response = self.session.get(url, timeout=15)
 
             if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
+                soup = crear_soup(response.content)
                 # Implementar extracción de datos de Facebook
                 pass
         except Exception as e:
@@ -361,9 +317,6 @@ class ScraperAvanzado:
             self.empresas_encontradas.extend(empresas)
             total_empresas += len(empresas)
 
-            # Pausa entre códigos postales
-            time.sleep(random.uniform(5, 10))
-
         logging.info(f"Búsqueda completada. Total de empresas encontradas: {total_empresas}")
         return self.empresas_encontradas
 
@@ -5,16 +5,22 @@ Busca empresas por municipios en https://www.axesor.es/directorio-informacion-em
 """
 
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-import time
-import random
 import re
 import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
 from urllib.parse import urljoin, quote
 
+from almacen_listado import SumideroListado
+from cache_http import crear_sesion_cache
+from codigos_postales import normalizar_nombre
+from config import Config
+from escaner_texto import ESCANER_AXESOR
+from limitador_peticiones import LimitadorPorHost
+from parser_html import SOLO_ENLACES, SOLO_LISTADO, crear_soup
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -26,21 +32,31 @@ logging.basicConfig(
 )
 
 class ScraperAxesor:
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, peticiones_por_segundo=Config.MAX_PETICIONES_POR_SEGUNDO, db_listado=Config.ARCHIVO_LISTADO_AXESOR):
+        # Compartido por todos los hilos: limita la tasa total contra axesor.es
+        self.limitador = LimitadorPorHost(peticiones_por_segundo)
+        # Las páginas ya descargadas salen de la caché en disco sin pasar por el limitador
+        self.session = crear_sesion_cache(self.limitador)
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
             'Accept-Language': 'es-ES,es;q=0.8,en-US;q=0.5,en;q=0.3',
-            'Accept-Encoding': 'gzip, deflate',
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
         })
 
-        self.empresas_encontradas = []
+        # Las empresas de cada página van directamente a SQLite, ya sin duplicados
+        self.sumidero = SumideroListado(db_listado)
         self.urls_procesadas = set()
         self.base_url = "https://www.axesor.es"
 
+    def descargar(self, url, timeout=20):
+        """Descarga una URL respetando el límite de peticiones por host (la sesión aplica el limitador y los reintentos)"""
+        response = self.session.get(url, timeout=timeout)
+        if response.status_code == 200:
+            self.sumidero.fallos.resolver(url)
+        return response
+
     def cargar_municipios_murcia(self, archivo_csv):
         """Carga los municipios únicos de Murcia del CSV"""
         try:
@@ -62,7 +78,7 @@ class ScraperAxesor:
             if response.status_code != 200:
                 logging.error(f"No se pudo acceder a la página principal de Axesor ({url})")
                 return {}
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = crear_soup(response.content, SOLO_ENLACES)
             enlaces = {}
             for a in soup.find_all('a', href=True):
                 href = a['href']
@@ -104,7 +120,7 @@ class ScraperAxesor:
                 response = self.session.get(url, timeout=20)
 
                 if response.status_code == 200:
-                    soup = BeautifulSoup(response.content, 'html.parser')
+                    soup = self.parsear_listado(response.content)
 
                     # Buscar empresas en la página
                     empresas_pagina = self.extraer_empresas_pagina(soup, municipio)
@@ -120,9 +136,6 @@ class ScraperAxesor:
                     logging.warning(f"    Error HTTP {response.status_code} en página {pagina}")
                     break
 
-                # Pausa entre páginas
-                time.sleep(random.uniform(2, 4))
-
             except Exception as e:
                 logging.error(f"    Error al procesar página {pagina}: {e}")
                 break
@@ -130,6 +143,14 @@ class ScraperAxesor:
         logging.info(f"  Total empresas encontradas en {municipio}: {len(empresas)}")
         return empresas
 
+    def parsear_listado(self, html):
+        """Construye solo las tablas y los enlaces de una página de listado"""
+        soup = crear_soup(html, SOLO_LISTADO)
+        if soup.find('table'):
+            return soup
+        # Sin tabla, extraer_empresas_pagina busca las empresas en otros contenedores
+        return crear_soup(html)
+
     def extraer_empresas_pagina(self, soup, municipio):
         """Extrae empresas de una página de resultados de Axesor"""
         empresas = []
@@ -245,24 +266,13 @@ class ScraperAxesor:
         try:
             response = self.session.get(url, timeout=20)
             if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
+                soup = crear_soup(response.content)
 
                 datos = {}
 
-                # Buscar CIF
-                cif = self.extraer_cif_de_texto(response.text)
-                if cif:
-                    datos['cif'] = cif
-
-                # Buscar CNAE
-                cnae = self.extraer_cnae_de_texto(response.text)
-                if cnae:
-                    datos['cnae'] = cnae
-
-                # Buscar código postal
-                codigo_postal = self.extraer_codigo_postal_de_texto(response.text)
-                if codigo_postal:
-                    datos['codigo_postal'] = codigo_postal
+                # CIF, CNAE y código postal con el escáner compartido
+                entidades = ESCANER_AXESOR.extraer(response.text)
+                datos.update({campo: valor for campo, valor in entidades.items() if valor})
 
                 # Buscar dirección más detallada
                 direccion_elem = soup.find(['span', 'p', 'div'], class_=re.compile(r'.*direccion.*|.*address.*'))
@@ -281,214 +291,301 @@ class ScraperAxesor:
 
         return None
 
-    def extraer_cif_de_texto(self, texto):
-        """Extrae CIF del texto usando patrones regex"""
-        patrones_cif = [
-            r'\b[A-Z]\d{8}\b',
-            r'\b[A-Z]\d{7}[A-Z]\b',
-            r'CIF[:\s]*([A-Z]\d{7,8}[A-Z]?)',
-            r'Código[:\s]*([A-Z]\d{7,8}[A-Z]?)',
-            r'Fiscal[:\s]*([A-Z]\d{7,8}[A-Z]?)'
-        ]
-
-        for patron in patrones_cif:
-            matches = re.findall(patron, texto, re.IGNORECASE)
-            if matches:
-                for match in matches:
-                    if isinstance(match, tuple):
-                        cif = match[0]
-                    else:
-                        cif = match
-
-                    if self.validar_cif(cif):
-                        return cif.upper()
-
-        return None
-
-    def extraer_cnae_de_texto(self, texto):
-        """Extrae CNAE del texto"""
-        patrones_cnae = [
-            r'CNAE[:\s]*(\d{4})',
-            r'Actividad[:\s]*(\d{4})',
-            r'Código[:\s]*(\d{4})'
-        ]
-
-        for patron in patrones_cnae:
-            matches = re.findall(patron, texto, re.IGNORECASE)
-            if matches:
-                return matches[0]
-
-        return None
-
-    def extraer_codigo_postal_de_texto(self, texto):
-        """Extrae código postal del texto"""
-        patrones_cp = [
-            r'\b30\d{3}\b',  # Códigos postales de Murcia
-            r'CP[:\s]*(\d{5})',
-            r'Código Postal[:\s]*(\d{5})'
-        ]
-
-        for patron in patrones_cp:
-            matches = re.findall(patron, texto)
-            if matches:
-                return matches[0]
-
-        return None
-
-    def validar_cif(self, cif):
-        """Valida si un CIF tiene el formato correcto"""
-        if not cif:
-            return False
-
-        cif_limpio = cif.strip().upper()
-        return bool(re.match(r'^[A-Z]\d{7,8}[A-Z]?$', cif_limpio))
-
-    def eliminar_duplicados(self, empresas):
-        """Elimina empresas duplicadas basándose solo en razón social"""
-        if not empresas:
-            return []
-
-        df = pd.DataFrame(empresas)
-
-        # Eliminar duplicados por razón social
-        df = df.drop_duplicates(subset=['razon_social'], keep='first')
-
-        return df.to_dict('records')
-
-    def ejecutar_busqueda_axesor(self, archivo_csv, max_municipios=1000, max_paginas=100):
+    def ejecutar_busqueda_axesor(self, archivo_csv, max_municipios=1000, max_paginas=100, concurrencia=1,
+                                 concurrencia_paginas=1, reanudar=True):
         """Ejecuta la búsqueda para todos los municipios del CSV que tengan enlace en Axesor"""
         logging.info("Iniciando búsqueda en Axesor...")
         municipios = self.cargar_municipios_murcia(archivo_csv)
         if len(municipios) == 0:
             logging.error("No se pudieron cargar municipios")
-            return []
+            return 0
 
         # Obtener enlaces de municipios desde la web
         enlaces_municipios = self.obtener_enlaces_municipios()
         if not enlaces_municipios:
             logging.error("No se pudieron extraer enlaces de municipios de Axesor")
-            return []
+            return 0
 
-        municipios_procesados = 0
         municipios_con_enlace = []
         municipios_sin_enlace = []
+        tareas = []
 
-        # Procesar todos los municipios del CSV que tengan enlace
+        # Emparejar cada municipio del CSV con su enlace en Axesor
         for municipio in municipios:
-            nombre_busqueda = municipio.lower()
-            enlace_encontrado = False
-
-            # Buscar coincidencia exacta primero
-            if nombre_busqueda in enlaces_municipios:
-                url_municipio = enlaces_municipios[nombre_busqueda]
+            url_municipio = self.buscar_enlace_municipio(municipio, enlaces_municipios)
+            if url_municipio:
                 logging.info(f"Procesando municipio: {municipio} -> {url_municipio}")
-                empresas = self.buscar_municipio_axesor_por_url(municipio, url_municipio, max_paginas)
-                self.empresas_encontradas.extend(empresas)
-                municipios_procesados += 1
+                tareas.append((len(tareas), municipio, url_municipio))
                 municipios_con_enlace.append(municipio)
-                enlace_encontrado = True
             else:
-                # Buscar coincidencia flexible (sin tildes, espacios, etc.)
-                for nombre_axesor, url_axesor in enlaces_municipios.items():
-                    if self.nombres_coinciden(municipio, nombre_axesor):
-                        logging.info(f"Procesando municipio: {municipio} (coincide con {nombre_axesor}) -> {url_axesor}")
-                        empresas = self.buscar_municipio_axesor_por_url(municipio, url_axesor, max_paginas)
-                        self.empresas_encontradas.extend(empresas)
-                        municipios_procesados += 1
-                        municipios_con_enlace.append(municipio)
-                        enlace_encontrado = True
-                        break
-
-            if not enlace_encontrado:
                 municipios_sin_enlace.append(municipio)
                 logging.warning(f"No se encontró enlace para municipio: {municipio}")
 
+        # Si el recorrido anterior quedó a medias se continúa; si no, se empieza de cero
+        progreso = self.sumidero.cargar_progreso()
+        completados = {municipio for municipio, estado in progreso.items() if estado['estado'] == 'completado'}
+        if reanudar and progreso and any(municipio not in completados for _, municipio, _ in tareas):
+            logging.info(f"Reanudando recorrido anterior: {len(completados)} municipios ya completados")
+            tareas = [tarea for tarea in tareas if tarea[1] not in completados]
+        else:
+            self.sumidero.vaciar()
+
+        # Una conexión keep-alive por hilo de descarga (municipios x páginas)
+        self.session.ajustar_pool(concurrencia * concurrencia_paginas)
+        if concurrencia > 1:
+            logging.info(f"Recorriendo {len(tareas)} municipios con {concurrencia} hilos")
+            resultados = self.recorrer_municipios_en_paralelo(tareas, max_paginas, concurrencia, concurrencia_paginas)
+        else:
+            resultados = (self.buscar_municipio_axesor_por_url(municipio, url, max_paginas,
+                                                               concurrencia_paginas=concurrencia_paginas,
+                                                               orden_municipio=orden)
+                          for orden, municipio, url in tareas)
+
+        empresas_extraidas = sum(resultados)
+
         # Mostrar resumen de municipios procesados
-        logging.info(f"Municipios procesados: {municipios_procesados}")
+        logging.info(f"Municipios procesados: {len(municipios_con_enlace)}")
         logging.info(f"Municipios con enlace: {municipios_con_enlace}")
         logging.info(f"Municipios sin enlace: {municipios_sin_enlace}")
 
-        # Eliminar duplicados
-        logging.info("Eliminando duplicados...")
-        empresas_unicas = self.eliminar_duplicados(self.empresas_encontradas)
-        logging.info(f"Búsqueda completada. Total de empresas únicas: {len(empresas_unicas)}")
+        # Los duplicados ya se descartaron al insertar en el sumidero
+        empresas_unicas = self.sumidero.total()
+        logging.info(f"Búsqueda completada. Empresas extraídas: {empresas_extraidas}, únicas: {empresas_unicas}")
+        logging.info(f"Ritmo final por host: {self.limitador.describir()}")
         return empresas_unicas
 
+    def buscar_enlace_municipio(self, municipio, enlaces_municipios):
+        """Devuelve la URL de Axesor del municipio o None si no tiene enlace"""
+        nombre_busqueda = municipio.lower()
+
+        # Buscar coincidencia exacta primero
+        if nombre_busqueda in enlaces_municipios:
+            return enlaces_municipios[nombre_busqueda]
+
+        # Buscar coincidencia flexible (sin tildes, espacios, etc.)
+        for nombre_axesor, url_axesor in enlaces_municipios.items():
+            if self.nombres_coinciden(municipio, nombre_axesor):
+                logging.info(f"Municipio {municipio} coincide con {nombre_axesor}")
+                return url_axesor
+
+        return None
+
+    def recorrer_municipios_en_paralelo(self, tareas, max_paginas, concurrencia, concurrencia_paginas=1):
+        """Recorre varios municipios a la vez y devuelve cuántas empresas tenía cada uno"""
+        # El ritmo lo marca el limitador compartido entre hilos.
+        # El sumidero ordena por (municipio, página, posición), así que el resultado
+        # final coincide con el de un recorrido secuencial
+        with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+            futuros = [
+                executor.submit(self.buscar_municipio_axesor_por_url, municipio, url, max_paginas,
+                                concurrencia_paginas, orden)
+                for orden, municipio, url in tareas
+            ]
+            for futuro in futuros:
+                yield futuro.result()
+
     def nombres_coinciden(self, nombre1, nombre2):
         """Compara dos nombres de municipios de forma flexible"""
-        # Normalizar nombres (quitar tildes, espacios, guiones, etc.)
-        def normalizar(nombre):
-            import unicodedata
-            # Quitar tildes
-            nombre = unicodedata.normalize('NFD', nombre).encode('ascii', 'ignore').decode('utf-8')
-            # Convertir a minúsculas y quitar espacios extra
-            nombre = nombre.lower().strip()
-            # Quitar caracteres especiales
-            nombre = nombre.replace('-', ' ').replace('_', ' ')
-            # Quitar espacios múltiples
-            nombre = ' '.join(nombre.split())
-            return nombre
-
-        return normalizar(nombre1) == normalizar(nombre2)
-
-    def buscar_municipio_axesor_por_url(self, municipio, url_base, max_paginas=100):
-        """Busca empresas de un municipio específico en Axesor usando el enlace real y paginación dinámica"""
-        empresas = []
-        pagina_url = url_base
-        pagina_num = 1
+        return normalizar_nombre(nombre1) == normalizar_nombre(nombre2)
+
+    def buscar_municipio_axesor_por_url(self, municipio, url_base, max_paginas=100, concurrencia_paginas=1,
+                                        orden_municipio=0):
+        """Busca empresas de un municipio específico en Axesor y las guarda en el sumidero; devuelve cuántas encontró"""
+        # Si hay checkpoint se vuelve a pedir la última página completada (sus filas ya
+        # están guardadas y no se duplican) y se sigue a partir de ella
+        pagina_num, pagina_url = self.sumidero.iniciar_municipio(municipio, orden_municipio, url_base)
+        if pagina_num > 1:
+            logging.info(f"  Reanudando {municipio} desde la página {pagina_num}: {pagina_url}")
+        else:
+            pagina_num, pagina_url = 1, url_base
+
+        try:
+            logging.info(f"  Página {pagina_num}: {pagina_url}")
+            response = self.descargar(pagina_url)
+        except Exception as e:
+            logging.error(f"    Error al procesar página {pagina_num}: {e}")
+            self.sumidero.fallos.registrar(pagina_url, error=e, contexto={'municipio': municipio, 'pagina': pagina_num})
+            return 0
+
+        if response.status_code != 200:
+            logging.warning(f"    Error HTTP {response.status_code} en página {pagina_num}")
+            self.sumidero.fallos.registrar(pagina_url, response=response,
+                                           contexto={'municipio': municipio, 'pagina': pagina_num})
+            return 0
+
+        soup = self.parsear_listado(response.content)
+        total_paginas = self.detectar_total_paginas(soup, pagina_url)
+
+        if not total_paginas:
+            # Sin paginación numerada: se sigue el botón "siguiente" página a página
+            encontradas, completo = self.recorrer_paginas_encadenadas(
+                municipio, pagina_url, max_paginas, pagina_num=pagina_num, response=response,
+                orden_municipio=orden_municipio
+            )
+        else:
+            encontradas, completo = self.recorrer_paginas_conocidas(
+                municipio, pagina_url, soup, min(total_paginas, max_paginas), max_paginas, concurrencia_paginas,
+                orden_municipio, pagina_num
+            )
+
+        # Si falló alguna página el municipio sigue en curso: la próxima ejecución
+        # lo reanuda desde la última página anterior al primer hueco
+        if completo:
+            self.sumidero.completar_municipio(municipio)
+        else:
+            logging.warning(f"  {municipio} queda sin completar por páginas fallidas; se reanudará en la próxima ejecución")
+        logging.info(f"  Total empresas encontradas en {municipio}: {encontradas}")
+        return encontradas
+
+    def guardar_pagina(self, empresas_pagina, orden_municipio, pagina_num, municipio=None, pagina_url=None):
+        """Envía las empresas de una página al sumidero y devuelve cuántas eran"""
+        # Con municipio y URL se avanza también el checkpoint, en la misma transacción
+        self.sumidero.agregar(empresas_pagina, orden_municipio, pagina_num, municipio, pagina_url)
+        return len(empresas_pagina)
+
+    def detectar_total_paginas(self, soup, url_base):
+        """Lee de la página el número de la última página enlazada (None si no hay paginación numerada)"""
+        prefijo = self.prefijo_paginacion(url_base)
+        if not prefijo:
+            return None
+
+        paginas = []
+        for enlace in soup.find_all('a', href=True):
+            href = enlace['href']
+            href = 'https:' + href if href.startswith('//') else urljoin(self.base_url, href)
+            resto = href[len(prefijo):] if href.startswith(prefijo) else ''
+            if resto.isdigit():
+                paginas.append(int(resto))
+
+        if not paginas:
+            return None
+        logging.info(f"    Paginación detectada: {max(paginas)} páginas")
+        return max(paginas)
+
+    def prefijo_paginacion(self, url_base):
+        """Devuelve la URL sin el número de página final ('.../informacion-empresas-de-Lorca/')"""
+        coincidencia = re.match(r'^(.*/)\d+$', url_base)
+        return coincidencia.group(1) if coincidencia else None
+
+    def recorrer_paginas_conocidas(self, municipio, url_base, soup_primera, total_paginas, max_paginas,
+                                   concurrencia_paginas=1, orden_municipio=0, pagina_inicial=1):
+        """Descarga todas las páginas conocidas de un municipio, en paralelo si se indica, conservando su orden
+
+        Devuelve (empresas encontradas, True si no falló ninguna página)
+        """
+        empresas_pagina = self.extraer_empresas_pagina(soup_primera, municipio)
+        encontradas = self.guardar_pagina(empresas_pagina, orden_municipio, pagina_inicial, municipio, url_base)
+        logging.info(f"    Encontradas {encontradas} empresas en página {pagina_inicial}")
+
+        prefijo = self.prefijo_paginacion(url_base)
+        urls = [f"{prefijo}{numero}" for numero in range(pagina_inicial + 1, total_paginas + 1)]
+
+        # Las páginas llegan en orden: el checkpoint avanza mientras no falle ninguna
+        ultima_soup = soup_primera
+        sin_huecos = True
+        descargas = self.descargar_paginas(urls, municipio, concurrencia_paginas)
+        for numero, (url, soup) in enumerate(zip(urls, descargas), start=pagina_inicial + 1):
+            if soup is None:
+                sin_huecos = False
+                continue
+            empresas_pagina = self.extraer_empresas_pagina(soup, municipio)
+            encontradas += self.guardar_pagina(empresas_pagina, orden_municipio, numero,
+                                               municipio if sin_huecos else None, url)
+            logging.info(f"    Encontradas {len(empresas_pagina)} empresas en página {numero}")
+            ultima_soup = soup
+
+        # Si la paginación solo mostraba una ventana de páginas, se continúa desde la última
+        if total_paginas < max_paginas:
+            siguiente = self.buscar_enlace_siguiente(ultima_soup, total_paginas)
+            if siguiente and siguiente not in urls and siguiente != url_base:
+                # Tras un hueco el checkpoint se queda antes de él aunque se sigan guardando páginas
+                encontradas_siguientes, completo = self.recorrer_paginas_encadenadas(
+                    municipio, siguiente, max_paginas, pagina_num=total_paginas + 1,
+                    orden_municipio=orden_municipio, avanzar_checkpoint=sin_huecos
+                )
+                encontradas += encontradas_siguientes
+                sin_huecos = sin_huecos and completo
+
+        return encontradas, sin_huecos
+
+    def descargar_paginas(self, urls, municipio=None, concurrencia_paginas=1):
+        """Devuelve la soup de cada URL en el mismo orden (None si falló la descarga)"""
+        def descargar_pagina(url):
+            try:
+                logging.info(f"  Página: {url}")
+                response = self.descargar(url)
+                if response.status_code == 200:
+                    return self.parsear_listado(response.content)
+                logging.warning(f"    Error HTTP {response.status_code} en {url}")
+                self.sumidero.fallos.registrar(url, response=response, contexto={'municipio': municipio})
+            except Exception as e:
+                logging.error(f"    Error al procesar {url}: {e}")
+                self.sumidero.fallos.registrar(url, error=e, contexto={'municipio': municipio})
+            return None
+
+        # El limitador compartido marca el ritmo; map conserva el orden de las páginas
+        if concurrencia_paginas > 1:
+            with ThreadPoolExecutor(max_workers=concurrencia_paginas) as executor:
+                yield from executor.map(descargar_pagina, urls)
+        else:
+            for url in urls:
+                yield descargar_pagina(url)
+
+    def buscar_enlace_siguiente(self, soup, pagina_num):
+        """Busca el enlace a la página siguiente con múltiples selectores"""
+        selectores_next = [
+            'a[class*="next"][rel="next"]',
+            'a[class*="next"]',
+            'a[rel="next"]',
+            'a[title*="siguiente"]',
+            'a[title*="next"]',
+            'a.next',
+            'a.icomoon[rel="next"]',
+            'a.next.icomoon[rel="next"]',
+            f'a[href*="/{pagina_num + 1}"]',
+            f'a[href*="page={pagina_num + 1}"]'
+        ]
+        for selector in selectores_next:
+            next_btn = soup.select_one(selector)
+            if next_btn and next_btn.get('href'):
+                href = next_btn['href']
+                logging.info(f"    Botón siguiente encontrado: {href}")
+                if href.startswith('//'):
+                    return 'https:' + href
+                return urljoin(self.base_url, href)
+        return None
+
+    def recorrer_paginas_encadenadas(self, municipio, pagina_url, max_paginas=100, pagina_num=1, response=None,
+                                     orden_municipio=0, avanzar_checkpoint=True):
+        """Recorre las páginas siguiendo el botón "siguiente" (para listados sin paginación numerada)
+
+        Devuelve (empresas encontradas, True si se llegó al final sin que fallara ninguna página)
+        """
+        encontradas = 0
+        completo = True
         while pagina_url and pagina_num <= max_paginas:
             try:
-                logging.info(f"  Página {pagina_num}: {pagina_url}")
-                response = self.session.get(pagina_url, timeout=20)
+                if response is None:
+                    logging.info(f"  Página {pagina_num}: {pagina_url}")
+                    response = self.descargar(pagina_url)
                 if response.status_code == 200:
-                    soup = BeautifulSoup(response.content, 'html.parser')
+                    soup = self.parsear_listado(response.content)
+                    response = None
                     empresas_pagina = self.extraer_empresas_pagina(soup, municipio)
                     if empresas_pagina:
-                        empresas.extend(empresas_pagina)
+                        encontradas += self.guardar_pagina(empresas_pagina, orden_municipio, pagina_num,
+                                                           municipio if avanzar_checkpoint else None, pagina_url)
                         logging.info(f"    Encontradas {len(empresas_pagina)} empresas en página {pagina_num}")
                     else:
                         logging.info(f"    No se encontraron más empresas en página {pagina_num}")
                         break
-                    # Buscar botón siguiente con múltiples selectores
-                    next_btn = None
-                    selectores_next = [
-                        'a[class*="next"][rel="next"]',
-                        'a[class*="next"]',
-                        'a[rel="next"]',
-                        'a[title*="siguiente"]',
-                        'a[title*="next"]',
-                        'a.next',
-                        'a.icomoon[rel="next"]',
-                        'a.next.icomoon[rel="next"]',
-                        f'a[href*="/{pagina_num + 1}"]',
-                        f'a[href*="page={pagina_num + 1}"]'
-                    ]
-                    enlaces_paginacion = soup.find_all('a', href=True)
-                    enlaces_paginacion_texto = []
-                    for enlace in enlaces_paginacion:
-                        href = enlace.get('href', '')
-                        texto = enlace.get_text(strip=True)
-                        if any(palabra in href.lower() for palabra in ['page', str(pagina_num + 1), 'siguiente', 'next']):
-                            enlaces_paginacion_texto.append(f"{texto}: {href}")
-                    if enlaces_paginacion_texto:
-                        logging.info(f"    Enlaces de paginación encontrados: {enlaces_paginacion_texto[:5]}")
-                    for selector in selectores_next:
-                        next_btn = soup.select_one(selector)
-                        if next_btn and next_btn.get('href'):
-                            break
-                    if next_btn and next_btn.get('href'):
-                        href = next_btn['href']
-                        logging.info(f"    Botón siguiente encontrado: {href}")
-                        if href.startswith('//'):
-                            pagina_url = 'https:' + href
-                        else:
-                            pagina_url = urljoin(self.base_url, href)
+                    siguiente_url = self.buscar_enlace_siguiente(soup, pagina_num)
+                    if siguiente_url:
+                        pagina_url = siguiente_url
                         pagina_num += 1
-                        time.sleep(random.uniform(2, 4))
                         continue  # <-- Asegura que el bucle continúe tras encontrar el botón
                     else:
                         # Intentar construir la URL de la siguiente página manualmente
-                        siguiente_url = None
                         if f'/{pagina_num}' in pagina_url:
                             siguiente_url = pagina_url.replace(f'/{pagina_num}', f'/{pagina_num + 1}')
                         elif '/1' in pagina_url:
@@ -496,11 +593,12 @@ class ScraperAxesor:
                         if siguiente_url:
                             logging.info(f"    Intentando URL manual: {siguiente_url}")
                             try:
-                                test_response = self.session.get(siguiente_url, timeout=10)
+                                test_response = self.descargar(siguiente_url, timeout=10)
                                 if test_response.status_code == 200:
+                                    # La respuesta de prueba es la propia página siguiente: no se vuelve a pedir
+                                    response = test_response
                                     pagina_url = siguiente_url
                                     pagina_num += 1
-                                    time.sleep(random.uniform(2, 4))
                                     continue  # <-- Asegura que el bucle continúe tras construir la URL
                             except:
                                 pass
@@ -508,16 +606,20 @@ class ScraperAxesor:
                         break
                 else:
                     logging.warning(f"    Error HTTP {response.status_code} en página {pagina_num}")
+                    self.sumidero.fallos.registrar(pagina_url, response=response,
+                                                   contexto={'municipio': municipio, 'pagina': pagina_num})
+                    completo = False
                     break
             except Exception as e:
                 logging.error(f"    Error al procesar página {pagina_num}: {e}")
+                self.sumidero.fallos.registrar(pagina_url, error=e, contexto={'municipio': municipio, 'pagina': pagina_num})
+                completo = False
                 break
-        logging.info(f"  Total empresas encontradas en {municipio}: {len(empresas)}")
-        return empresas
+        return encontradas, completo
 
-    def guardar_resultados(self, empresas, archivo_salida=None):
-        """Guarda los resultados en Excel y CSV"""
-        if not empresas:
+    def guardar_resultados(self, archivo_salida=None):
+        """Guarda los resultados en Excel y CSV leyendo el sumidero por bloques"""
+        if not self.sumidero.total():
             logging.warning("No hay empresas para guardar")
             return
 
@@ -525,53 +627,58 @@ class ScraperAxesor:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             archivo_salida = f"empresas_axesor_{timestamp}"
 
-        # Crear DataFrame
-        df = pd.DataFrame(empresas)
-
         # Guardar Excel
-        archivo_excel = f"{archivo_salida}.xlsx"
-        df.to_excel(archivo_excel, index=False, engine='openpyxl')
-        logging.info(f"Resultados guardados en Excel: {archivo_excel}")
+        self.sumidero.exportar_excel(f"{archivo_salida}.xlsx")
 
         # Guardar CSV
-        archivo_csv = f"{archivo_salida}.csv"
-        df.to_csv(archivo_csv, index=False, encoding='utf-8')
-        logging.info(f"Resultados guardados en CSV: {archivo_csv}")
+        self.sumidero.exportar_csv(f"{archivo_salida}.csv")
 
         # Mostrar estadísticas
-        self.mostrar_estadisticas(df)
+        self.mostrar_estadisticas()
 
-    def mostrar_estadisticas(self, df):
+    def mostrar_estadisticas(self):
         """Muestra estadísticas de los resultados"""
+        stats = self.sumidero.estadisticas()
+
         print("\n" + "="*60)
         print("📊 ESTADÍSTICAS DE RESULTADOS")
         print("="*60)
 
-        print(f"Total de empresas: {len(df)}")
-
-        if 'municipio' in df.columns:
-            municipios_unicos = df['municipio'].nunique()
-            print(f"Municipios cubiertos: {municipios_unicos}")
-
-        if 'url_detalles' in df.columns:
-            empresas_con_enlace = df['url_detalles'].notna().sum()
-            print(f"Empresas con enlace a detalles: {empresas_con_enlace}")
+        print(f"Total de empresas: {stats['total_empresas']}")
+        print(f"Municipios cubiertos: {stats['municipios_unicos']}")
+        print(f"Empresas con enlace a detalles: {stats['empresas_con_enlace']}")
+        print(f"Páginas con fallo permanente: {stats['paginas_fallidas']}")
 
         print("="*60)
 
 def main():
     """Función principal"""
-    scraper = ScraperAxesor()
+    parser = argparse.ArgumentParser(description='Scraper del directorio de empresas de Murcia en Axesor')
+    parser.add_argument('--concurrencia', type=int, default=Config.CONCURRENCIA_MUNICIPIOS,
+                        help='Número de municipios recorridos simultáneamente (1 = secuencial)')
+    parser.add_argument('--concurrencia-paginas', type=int, default=Config.CONCURRENCIA_PAGINAS,
+                        help='Páginas de un mismo municipio descargadas simultáneamente (1 = secuencial)')
+    parser.add_argument('--reiniciar', action='store_true',
+                        help='Empieza el recorrido de cero aunque el anterior quedara a medias')
+    parser.add_argument('--peticiones-por-segundo', type=float, default=Config.MAX_PETICIONES_POR_SEGUNDO,
+                        help='Techo de peticiones por segundo a Axesor entre todos los hilos (el ritmo se adapta por debajo)')
+    args = parser.parse_args()
+
+    scraper = ScraperAxesor(args.peticiones_por_segundo)
 
     # Ejecutar búsqueda para TODOS los municipios del CSV que tengan enlace en Axesor
-    empresas = scraper.ejecutar_busqueda_axesor(
+    scraper.ejecutar_busqueda_axesor(
         "municipios_pedanias_codigos_postales_corregidos.csv",
         max_municipios=1000,  # Sin límite realista de municipios
-        max_paginas=100       # Sin límite realista de páginas por municipio
+        max_paginas=100,      # Sin límite realista de páginas por municipio
+        concurrencia=args.concurrencia,
+        concurrencia_paginas=args.concurrencia_paginas,
+        reanudar=not args.reiniciar
     )
 
     # Guardar resultados
-    scraper.guardar_resultados(empresas)
+    scraper.guardar_resultados()
+    scraper.sumidero.cerrar()
 
 if __name__ == "__main__":
     main()
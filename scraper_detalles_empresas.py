@@ -1,13 +1,15 @@
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-import time
-import random
 import logging
 import re
 from urllib.parse import urljoin
 import json
 
+from cache_http import crear_sesion_cache
+from codigos_postales import IndiceCodigosPostales
+from config import Config
+from limitador_peticiones import LimitadorPorHost
+from parser_html import crear_soup
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -21,7 +23,9 @@ logging.basicConfig(
 class ScraperDetallesEmpresas:
     def __init__(self):
         """Inicializa el scraper"""
-        self.session = requests.Session()
+        # El limitador adapta el ritmo al servidor en lugar de pausar un tiempo aleatorio
+        self.limitador = LimitadorPorHost(Config.MAX_PETICIONES_POR_SEGUNDO)
+        self.session = crear_sesion_cache(self.limitador)
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
@@ -30,25 +34,12 @@ class ScraperDetallesEmpresas:
         self.codigos_postales = self.cargar_codigos_postales()
 
     def cargar_codigos_postales(self):
-        """Carga los códigos postales desde el archivo CSV"""
-        try:
-            df_cp = pd.read_csv('municipios_pedanias_codigos_postales_corregidos.csv')
-            # Crear diccionario municipio -> código postal principal
-            codigos = {}
-            for _, row in df_cp.iterrows():
-                municipio = row['municipio'].strip()
-                cp = str(row['codigo_postal']).split('.')[0]  # Eliminar decimales
-                if municipio not in codigos:
-                    codigos[municipio] = cp
-            return codigos
-        except Exception as e:
-            logging.error(f"Error cargando códigos postales: {e}")
-            return {}
+        """Carga el índice municipio -> código postal desde el archivo CSV"""
+        return IndiceCodigosPostales('municipios_pedanias_codigos_postales_corregidos.csv')
 
     def obtener_codigo_postal(self, municipio):
         """Obtiene el código postal para un municipio"""
-        municipio_limpio = municipio.strip()
-        return self.codigos_postales.get(municipio_limpio, '')
+        return self.codigos_postales.obtener(municipio, '')
 
     def cargar_empresas(self, archivo_csv):
         """Carga las empresas desde el archivo CSV generado por el scraper anterior"""
@@ -318,13 +309,10 @@ class ScraperDetallesEmpresas:
         try:
             logging.info(f"Procesando: {url}")
 
-            # Hacer pausa aleatoria para no sobrecargar el servidor
-            time.sleep(random.uniform(2, 4))
-
             response = self.session.get(url, timeout=30)
             response.raise_for_status()
 
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = crear_soup(response.content)
 
             # Debug: mostrar estructura de la página
             logging.debug(f"Título de la página: {soup.title.string if soup.title else 'Sin título'}")
@@ -5,19 +5,27 @@ Scraper de detalles de empresas de Axesor con almacenamiento en SQLite
 Extrae información detallada de empresas y la guarda en base de datos SQLite
 """
 
-import requests
 import pandas as pd
 import sqlite3
 import logging
 import re
 import json
+import hashlib
 import time
-import random
+import threading
 from datetime import datetime
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 import argparse
 import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+
+from cache_http import crear_sesion_cache
+from codigos_postales import IndiceCodigosPostales
+from config import Config
+from esquema_empresas import CAMPOS_DETALLE, CONDICIONES_ESTADISTICAS, asegurar_version_cambios
+from limitador_peticiones import LimitadorPorHost
+from parser_html import SOLO_TABLAS, crear_soup
+from reintentos import RegistroFallos
 
 # Configurar logging
 logging.basicConfig(
@@ -29,19 +37,129 @@ logging.basicConfig(
     ]
 )
 
-class ScraperDetallesSQLite:
-    def __init__(self, db_path='empresas_murcia.db'):
+# Etiqueta de la tabla de la ficha que precede a cada campo
+ETIQUETAS_DETALLE = {
+    'direccion': 'Dirección:',
+    'telefono': 'Teléfono:',
+    'cif': 'CIF:',
+    'sitio_web': 'Sitio web:',
+    'email': 'Email:',
+    'fecha_constitucion': 'Fecha de constitución:',
+    'cnae': 'CNAE:',
+    'objeto_social': 'Objeto social:',
+}
+
+# Una sola expresión con un grupo por campo: cada celda se compara una vez contra todas las etiquetas
+PATRON_ETIQUETAS = re.compile(
+    '|'.join(f'(?P<{campo}>{re.escape(etiqueta)})' for campo, etiqueta in ETIQUETAS_DETALLE.items()),
+    re.IGNORECASE
+)
+
+class ExtractorDetalles:
+    """Extractores de campos de la ficha de Axesor, sin red ni base de datos"""
+
+    def extraer_campos(self, html):
+        """Extrae todos los campos de la ficha a partir de su HTML"""
+        # Todos los campos están en las tablas de la ficha: cabecera, scripts y pie no se construyen
+        soup = crear_soup(html, SOLO_TABLAS)
+        return self.extraer_campos_de_celdas(soup)
+
+    def extraer_campos_de_celdas(self, soup):
+        """Recorre una sola vez las celdas de la ficha y resuelve todos los campos a la vez"""
+        campos = dict.fromkeys(CAMPOS_DETALLE)
+        pendientes = len(CAMPOS_DETALLE)
+        for celda in soup.find_all('td'):
+            # Solo cuentan como etiqueta las celdas con un único texto (como string= en find_all)
+            texto = celda.string
+            if not texto:
+                continue
+            coincidencia = PATRON_ETIQUETAS.search(texto)
+            if not coincidencia or campos[coincidencia.lastgroup] is not None:
+                continue
+
+            siguiente_td = celda.find_next_sibling('td')
+            if not siguiente_td:
+                continue
+            campo = coincidencia.lastgroup
+            try:
+                campos[campo] = self.limpiar_valor(campo, siguiente_td.get_text(strip=True))
+            except Exception as e:
+                logging.error(f"Error extrayendo {campo}: {e}")
+                continue
+
+            # Si un valor no vale se sigue buscando otra celda con la misma etiqueta
+            if campos[campo] is not None:
+                pendientes -= 1
+                if not pendientes:
+                    break
+        return campos
+
+    def limpiar_valor(self, campo, valor):
+        """Normaliza el texto de la celda de un campo; None si no sirve"""
+        if not valor:
+            return None
+        if campo in ('telefono', 'cnae'):
+            # Quitar decimales y texto extra
+            return re.sub(r'[^\d]', '', valor) or None
+        if campo == 'sitio_web' and valor == 'N/A':
+            return None
+        if campo == 'email' and '@' not in valor:
+            return None
+        return valor
+
+class ScraperDetallesSQLite(ExtractorDetalles):
+    def __init__(self, db_path='empresas_murcia.db', peticiones_por_segundo=Config.MAX_PETICIONES_POR_SEGUNDO,
+                 tamano_lote=Config.TAMANO_LOTE_DB, intervalo_commit=Config.INTERVALO_COMMIT_DB):
         self.db_path = db_path
-        self.session = requests.Session()
+        self.limitador = LimitadorPorHost(peticiones_por_segundo)
+        # Las fichas ya descargadas salen de la caché en disco sin pasar por el limitador
+        self.session = crear_sesion_cache(self.limitador)
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
+
+        # Escritura por lotes sobre una conexión persistente
+        self.tamano_lote = tamano_lote
+        self.intervalo_commit = intervalo_commit
+        self.pendientes = []
+        self.pendientes_validadores = []
+        self.ultimo_commit = time.monotonic()
+        self.lock_db = threading.RLock()
+        self.conn = self.abrir_conexion()
         self.init_database()
+        self.urls_procesadas = self.cargar_urls_procesadas()
+        # Fichas que no se pudieron procesar ni tras los reintentos de la sesión
+        self.fallos = RegistroFallos(db_path, 'detalles_empresas')
+
+        # En modo refresco se vuelven a pedir las fichas ya guardadas con
+        # peticiones condicionales, usando los validadores de la última descarga
+        self.refrescar = False
+        self.validadores = {}
+        self.fichas_sin_cambios = 0
+
+    def abrir_conexion(self):
+        """Abre la conexión SQLite compartida en modo WAL"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        # WAL permite leer (servidor web) mientras se escribe, y con
+        # synchronous=NORMAL solo se sincroniza a disco en los checkpoints
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # INSERT OR REPLACE borra la fila anterior; sin esto el borrado no
+        # dispara el trigger y las estadísticas contarían la empresa dos veces
+        conn.execute("PRAGMA recursive_triggers=ON")
+        return conn
+
+    def cerrar(self):
+        """Escribe los registros pendientes y cierra las conexiones"""
+        with self.lock_db:
+            self.vaciar_pendientes()
+            self.conn.close()
+        self.fallos.cerrar()
 
     def init_database(self):
         """Inicializa la base de datos SQLite con las tablas necesarias"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.conn
             cursor = conn.cursor()
 
             # Tabla principal de empresas con detalles
@@ -60,7 +178,21 @@ class ScraperDetallesSQLite:
                     cnae TEXT,
                     objeto_social TEXT,
                     url_detalles TEXT UNIQUE,
-                    fecha_extraccion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    fecha_extraccion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    version_cambio INTEGER
+                )
+            ''')
+            asegurar_version_cambios(cursor)
+
+            # Validadores HTTP de la última descarga de cada ficha, para refrescar
+            # con peticiones condicionales sin volver a bajar ni parsear lo que no cambió
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS validadores_http (
+                    url_detalles TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    hash_cuerpo TEXT,
+                    fecha_comprobacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
 
@@ -82,14 +214,69 @@ class ScraperDetallesSQLite:
                 )
             ''')
 
+            # Triggers que mantienen las estadísticas al insertar, borrar o actualizar
+            cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name = 'estadisticas_tras_insertar'")
+            triggers_existentes = cursor.fetchone()[0] > 0
+            self.crear_triggers_estadisticas(cursor)
+
+            cursor.execute("SELECT COUNT(*) FROM estadisticas_procesamiento WHERE id = 1")
+            if not triggers_existentes or cursor.fetchone()[0] == 0:
+                self.recalcular_estadisticas(cursor)
+
             conn.commit()
-            conn.close()
             logging.info(f"Base de datos inicializada: {self.db_path}")
 
         except Exception as e:
             logging.error(f"Error inicializando base de datos: {e}")
             raise
 
+    def crear_triggers_estadisticas(self, cursor):
+        """Crea los triggers que actualizan estadisticas_procesamiento fila a fila"""
+        def incrementos(*terminos):
+            # Cada término es (signo, fila); p. ej. ('+', 'NEW'), ('-', 'OLD')
+            return [f"{campo} = {campo} " + " ".join(f"{signo} ({condicion.format(fila=fila)})"
+                                                  for signo, fila in terminos)
+                    for campo, condicion in CONDICIONES_ESTADISTICAS]
+
+        triggers = {
+            'estadisticas_tras_insertar': ('INSERT', [
+                "total_empresas = total_empresas + 1",
+                "empresas_procesadas = empresas_procesadas + 1",
+            ] + incrementos(('+', 'NEW'))),
+            'estadisticas_tras_borrar': ('DELETE', [
+                "total_empresas = total_empresas - 1",
+                "empresas_procesadas = empresas_procesadas - 1",
+            ] + incrementos(('-', 'OLD'))),
+            'estadisticas_tras_actualizar': ('UPDATE', incrementos(('+', 'NEW'), ('-', 'OLD'))),
+        }
+
+        for nombre, (evento, asignaciones) in triggers.items():
+            asignaciones = asignaciones + ["fecha_actualizacion = CURRENT_TIMESTAMP"]
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {nombre} AFTER {evento} ON empresas_detalles
+                BEGIN
+                    UPDATE estadisticas_procesamiento SET
+                        {", ".join(asignaciones)}
+                    WHERE id = 1;
+                END
+            ''')
+
+    def recalcular_estadisticas(self, cursor):
+        """Recalcula desde cero las estadísticas con una sola pasada por la tabla"""
+        sumas = ", ".join(f"COALESCE(SUM({condicion.format(fila='empresas_detalles')}), 0)"
+                          for _, condicion in CONDICIONES_ESTADISTICAS)
+        cursor.execute(f"SELECT COUNT(*), {sumas} FROM empresas_detalles")
+        valores = cursor.fetchone()
+
+        columnas = ", ".join(campo for campo, _ in CONDICIONES_ESTADISTICAS)
+        marcadores = ", ".join("?" for _ in CONDICIONES_ESTADISTICAS)
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO estadisticas_procesamiento
+            (id, total_empresas, empresas_procesadas, {columnas}, fecha_actualizacion)
+            VALUES (1, ?, ?, {marcadores}, CURRENT_TIMESTAMP)
+        ''', (valores[0], valores[0]) + tuple(valores[1:]))
+        logging.info(f"Estadísticas recalculadas: {valores[0]} empresas en DB")
+
     def cargar_empresas_desde_csv(self, archivo_csv):
         """Carga las empresas desde el archivo CSV"""
         try:
@@ -100,118 +287,152 @@ class ScraperDetallesSQLite:
             logging.error(f"Error cargando CSV: {e}")
             raise
 
-    def empresa_ya_procesada(self, url_detalles):
-        """Verifica si una empresa ya fue procesada"""
+    def cargar_urls_procesadas(self):
+        """Carga en memoria las URLs de las empresas ya guardadas en la base de datos"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM empresas_detalles WHERE url_detalles = ?", (url_detalles,))
-            count = cursor.fetchone()[0]
-            conn.close()
-            return count > 0
+            with self.lock_db:
+                cursor = self.conn.execute("SELECT url_detalles FROM empresas_detalles WHERE url_detalles IS NOT NULL")
+                urls = {fila[0] for fila in cursor}
+            logging.info(f"Empresas ya procesadas en DB: {len(urls)}")
+            return urls
         except Exception as e:
-            logging.error(f"Error verificando empresa procesada: {e}")
-            return False
+            logging.error(f"Error cargando empresas procesadas: {e}")
+            return set()
 
-    def guardar_empresa_en_db(self, datos_empresa):
-        """Guarda los datos de una empresa en la base de datos"""
+    def cargar_validadores(self):
+        """Carga en memoria el ETag, Last-Modified y hash de cada ficha descargada"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            with self.lock_db:
+                cursor = self.conn.execute("SELECT url_detalles, etag, last_modified, hash_cuerpo FROM validadores_http")
+                validadores = {
+                    url: {'etag': etag, 'last_modified': last_modified, 'hash_cuerpo': hash_cuerpo}
+                    for url, etag, last_modified, hash_cuerpo in cursor
+                }
+            logging.info(f"Validadores HTTP cargados: {len(validadores)}")
+            return validadores
+        except Exception as e:
+            logging.error(f"Error cargando validadores HTTP: {e}")
+            return {}
 
-            cursor.execute('''
-                INSERT OR REPLACE INTO empresas_detalles
-                (razon_social, municipio, codigo_postal, direccion, telefono, cif,
-                 sitio_web, email, fecha_constitucion, cnae, objeto_social, url_detalles)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                datos_empresa['razon_social'],
-                datos_empresa['municipio'],
-                datos_empresa['codigo_postal'],
-                datos_empresa['direccion'],
-                datos_empresa['telefono'],
-                datos_empresa['cif'],
-                datos_empresa['sitio_web'],
-                datos_empresa['email'],
-                datos_empresa['fecha_constitucion'],
-                datos_empresa['cnae'],
-                datos_empresa['objeto_social'],
-                datos_empresa['url_detalles']
-            ))
+    def empresa_ya_procesada(self, url_detalles):
+        """Verifica si una empresa ya fue procesada"""
+        return url_detalles in self.urls_procesadas
 
-            conn.commit()
-            conn.close()
+    def omitir_empresa(self, url_detalles):
+        """Indica si la empresa se salta (ya procesada y sin modo refresco)"""
+        return not self.refrescar and self.empresa_ya_procesada(url_detalles)
+
+    def cabeceras_revalidacion(self, url_detalles):
+        """Cabeceras condicionales para volver a pedir una ficha ya guardada"""
+        if not self.refrescar or not self.empresa_ya_procesada(url_detalles):
+            return None
+
+        # Cache-Control hace que la sesión no sirva la ficha desde la caché en disco
+        headers = {'Cache-Control': 'no-cache'}
+        validadores = self.validadores.get(url_detalles, {})
+        if validadores.get('etag'):
+            headers['If-None-Match'] = validadores['etag']
+        if validadores.get('last_modified'):
+            headers['If-Modified-Since'] = validadores['last_modified']
+        return headers
+
+    def guardar_empresa_en_db(self, datos_empresa):
+        """Encola los datos de una empresa y escribe el lote cuando toca"""
+        try:
+            with self.lock_db:
+                self.pendientes.append((
+                    datos_empresa['razon_social'],
+                    datos_empresa['municipio'],
+                    datos_empresa['codigo_postal'],
+                    datos_empresa['direccion'],
+                    datos_empresa['telefono'],
+                    datos_empresa['cif'],
+                    datos_empresa['sitio_web'],
+                    datos_empresa['email'],
+                    datos_empresa['fecha_constitucion'],
+                    datos_empresa['cnae'],
+                    datos_empresa['objeto_social'],
+                    datos_empresa['url_detalles']
+                ))
+                validadores = datos_empresa.get('validadores')
+                if validadores:
+                    self.pendientes_validadores.append((
+                        datos_empresa['url_detalles'],
+                        validadores['etag'],
+                        validadores['last_modified'],
+                        validadores['hash_cuerpo']
+                    ))
+                self.urls_procesadas.add(datos_empresa['url_detalles'])
+
+                lote_lleno = len(self.pendientes) >= self.tamano_lote
+                plazo_vencido = time.monotonic() - self.ultimo_commit >= self.intervalo_commit
+                if lote_lleno or plazo_vencido:
+                    return self.vaciar_pendientes()
             return True
 
         except Exception as e:
             logging.error(f"Error guardando empresa en DB: {e}")
             return False
 
+    def vaciar_pendientes(self):
+        """Escribe en una sola transacción todas las empresas encoladas"""
+        sql = '''
+            INSERT OR REPLACE INTO empresas_detalles
+            (razon_social, municipio, codigo_postal, direccion, telefono, cif,
+             sitio_web, email, fecha_constitucion, cnae, objeto_social, url_detalles)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        '''
+        sql_validadores = '''
+            INSERT OR REPLACE INTO validadores_http
+            (url_detalles, etag, last_modified, hash_cuerpo, fecha_comprobacion)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        '''
+        with self.lock_db:
+            lote, self.pendientes = self.pendientes, []
+            validadores, self.pendientes_validadores = self.pendientes_validadores, []
+            self.ultimo_commit = time.monotonic()
+            if not lote:
+                return True
+
+            try:
+                with self.conn:
+                    self.conn.executemany(sql, lote)
+                    self.conn.executemany(sql_validadores, validadores)
+                return True
+            except sqlite3.Error as e:
+                # Reintentar fila a fila para no perder el lote por un registro erróneo
+                logging.error(f"Error guardando lote de {len(lote)} empresas en DB: {e}")
+                guardadas = set()
+                for fila in lote:
+                    try:
+                        with self.conn:
+                            self.conn.execute(sql, fila)
+                        guardadas.add(fila[-1])
+                    except sqlite3.Error as e_fila:
+                        logging.error(f"Error guardando empresa en DB ({fila[0]}): {e_fila}")
+                        self.urls_procesadas.discard(fila[-1])
+                # Sin la empresa guardada, su validador haría que un refresco la diera por vigente
+                try:
+                    with self.conn:
+                        self.conn.executemany(sql_validadores, [v for v in validadores if v[0] in guardadas])
+                except sqlite3.Error as e_validadores:
+                    logging.error(f"Error guardando validadores HTTP: {e_validadores}")
+                return len(guardadas) == len(lote)
+
     def actualizar_estadisticas(self):
-        """Actualiza las estadísticas de procesamiento en la base de datos"""
+        """Escribe las empresas pendientes para que las estadísticas las reflejen"""
+        # Los contadores de estadisticas_procesamiento los mantienen los triggers
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            # Obtener estadísticas actuales
-            cursor.execute("SELECT COUNT(*) FROM empresas_detalles")
-            total_empresas = cursor.fetchone()[0]
-
-            cursor.execute("SELECT COUNT(*) FROM empresas_detalles WHERE direccion IS NOT NULL AND direccion != ''")
-            empresas_con_direccion = cursor.fetchone()[0]
-
-            cursor.execute("SELECT COUNT(*) FROM empresas_detalles WHERE telefono IS NOT NULL AND telefono != ''")
-            empresas_con_telefono = cursor.fetchone()[0]
-
-            cursor.execute("SELECT COUNT(*) FROM empresas_detalles WHERE cif IS NOT NULL AND cif != ''")
-            empresas_con_cif = cursor.fetchone()[0]
-
-            cursor.execute("SELECT COUNT(*) FROM empresas_detalles WHERE sitio_web IS NOT NULL AND sitio_web != '' AND sitio_web != 'N/A'")
-            empresas_con_web = cursor.fetchone()[0]
-
-            cursor.execute("SELECT COUNT(*) FROM empresas_detalles WHERE email IS NOT NULL AND email != ''")
-            empresas_con_email = cursor.fetchone()[0]
-
-            cursor.execute("SELECT COUNT(*) FROM empresas_detalles WHERE fecha_constitucion IS NOT NULL AND fecha_constitucion != ''")
-            empresas_con_fecha = cursor.fetchone()[0]
-
-            cursor.execute("SELECT COUNT(*) FROM empresas_detalles WHERE cnae IS NOT NULL AND cnae != ''")
-            empresas_con_cnae = cursor.fetchone()[0]
-
-            cursor.execute("SELECT COUNT(*) FROM empresas_detalles WHERE objeto_social IS NOT NULL AND objeto_social != ''")
-            empresas_con_objeto = cursor.fetchone()[0]
-
-            # Insertar o actualizar estadísticas
-            cursor.execute('''
-                INSERT OR REPLACE INTO estadisticas_procesamiento
-                (id, total_empresas, empresas_procesadas, empresas_con_direccion,
-                 empresas_con_telefono, empresas_con_cif, empresas_con_web,
-                 empresas_con_email, empresas_con_fecha, empresas_con_cnae,
-                 empresas_con_objeto, fecha_actualizacion)
-                VALUES (1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (
-                total_empresas, total_empresas, empresas_con_direccion,
-                empresas_con_telefono, empresas_con_cif, empresas_con_web,
-                empresas_con_email, empresas_con_fecha, empresas_con_cnae,
-                empresas_con_objeto
-            ))
-
-            conn.commit()
-            conn.close()
-
+            self.vaciar_pendientes()
         except Exception as e:
             logging.error(f"Error actualizando estadísticas: {e}")
 
     def obtener_estadisticas(self):
         """Obtiene las estadísticas actuales de la base de datos"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute("SELECT * FROM estadisticas_procesamiento ORDER BY fecha_actualizacion DESC LIMIT 1")
-            stats = cursor.fetchone()
-
-            conn.close()
+            with self.lock_db:
+                cursor = self.conn.execute("SELECT * FROM estadisticas_procesamiento WHERE id = 1")
+                stats = cursor.fetchone()
 
             if stats:
                 return {
@@ -232,220 +453,128 @@ class ScraperDetallesSQLite:
             logging.error(f"Error obteniendo estadísticas: {e}")
             return None
 
-    def extraer_direccion(self, soup):
-        """Extrae la dirección de la empresa"""
+    def extraer_detalles_empresa(self, url_detalles, razon_social, municipio, codigo_postal):
+        """Descarga la ficha de una empresa y extrae sus detalles sin guardarlos"""
         try:
-            # Buscar en la tabla de la ficha
-            elementos = soup.find_all('td', string=re.compile(r'Dirección:', re.IGNORECASE))
-            for elemento in elementos:
-                siguiente_td = elemento.find_next_sibling('td')
-                if siguiente_td:
-                    direccion = siguiente_td.get_text(strip=True)
-                    if direccion:
-                        return direccion
-
-            return None
-        except Exception as e:
-            logging.error(f"Error extrayendo dirección: {e}")
-            return None
-
-    def extraer_telefono(self, soup):
-        """Extrae el teléfono de la empresa"""
-        try:
-            # Buscar en la tabla de la ficha
-            elementos = soup.find_all('td', string=re.compile(r'Teléfono:', re.IGNORECASE))
-            for elemento in elementos:
-                siguiente_td = elemento.find_next_sibling('td')
-                if siguiente_td:
-                    telefono = siguiente_td.get_text(strip=True)
-                    if telefono:
-                        # Limpiar teléfono (quitar decimales y texto extra)
-                        telefono_limpio = re.sub(r'[^\d]', '', telefono)
-                        if telefono_limpio:
-                            return telefono_limpio
-
-            return None
-        except Exception as e:
-            logging.error(f"Error extrayendo teléfono: {e}")
-            return None
-
-    def extraer_cif(self, soup):
-        """Extrae el CIF de la empresa"""
-        try:
-            # Buscar en la tabla de la ficha
-            elementos = soup.find_all('td', string=re.compile(r'CIF:', re.IGNORECASE))
-            for elemento in elementos:
-                siguiente_td = elemento.find_next_sibling('td')
-                if siguiente_td:
-                    cif = siguiente_td.get_text(strip=True)
-                    if cif:
-                        return cif
-
-            return None
-        except Exception as e:
-            logging.error(f"Error extrayendo CIF: {e}")
-            return None
-
-    def extraer_sitio_web(self, soup):
-        """Extrae el sitio web de la empresa"""
-        try:
-            # Buscar específicamente en la tabla de la ficha (td tras 'Sitio web:')
-            elementos = soup.find_all('td', string=re.compile(r'Sitio web:', re.IGNORECASE))
-            for elemento in elementos:
-                siguiente_td = elemento.find_next_sibling('td')
-                if siguiente_td:
-                    web = siguiente_td.get_text(strip=True)
-                    if web and web != 'N/A' and web != '':
-                        return web
-
-            return None
-        except Exception as e:
-            logging.error(f"Error extrayendo sitio web: {e}")
-            return None
-
-    def extraer_email(self, soup):
-        """Extrae el email de la empresa"""
-        try:
-            # Buscar específicamente en la tabla de la ficha (td tras 'Email:')
-            elementos = soup.find_all('td', string=re.compile(r'Email:', re.IGNORECASE))
-            for elemento in elementos:
-                siguiente_td = elemento.find_next_sibling('td')
-                if siguiente_td:
-                    email = siguiente_td.get_text(strip=True)
-                    if email and '@' in email:
-                        return email
-
-            return None
-        except Exception as e:
-            logging.error(f"Error extrayendo email: {e}")
-            return None
-
-    def extraer_fecha_constitucion(self, soup):
-        """Extrae la fecha de constitución de la empresa"""
-        try:
-            # Buscar en la tabla de la ficha
-            elementos = soup.find_all('td', string=re.compile(r'Fecha de constitución:', re.IGNORECASE))
-            for elemento in elementos:
-                siguiente_td = elemento.find_next_sibling('td')
-                if siguiente_td:
-                    fecha = siguiente_td.get_text(strip=True)
-                    if fecha:
-                        return fecha
-
-            return None
-        except Exception as e:
-            logging.error(f"Error extrayendo fecha de constitución: {e}")
-            return None
-
-    def extraer_cnae(self, soup):
-        """Extrae el CNAE de la empresa"""
-        try:
-            # Buscar en la tabla de la ficha
-            elementos = soup.find_all('td', string=re.compile(r'CNAE:', re.IGNORECASE))
-            for elemento in elementos:
-                siguiente_td = elemento.find_next_sibling('td')
-                if siguiente_td:
-                    cnae = siguiente_td.get_text(strip=True)
-                    if cnae:
-                        # Limpiar CNAE (quitar decimales)
-                        cnae_limpio = re.sub(r'[^\d]', '', cnae)
-                        if cnae_limpio:
-                            return cnae_limpio
-
-            return None
-        except Exception as e:
-            logging.error(f"Error extrayendo CNAE: {e}")
-            return None
-
-    def extraer_objeto_social(self, soup):
-        """Extrae el objeto social de la empresa"""
-        try:
-            # Buscar en la tabla de la ficha
-            elementos = soup.find_all('td', string=re.compile(r'Objeto social:', re.IGNORECASE))
-            for elemento in elementos:
-                siguiente_td = elemento.find_next_sibling('td')
-                if siguiente_td:
-                    objeto = siguiente_td.get_text(strip=True)
-                    if objeto:
-                        return objeto
-
-            return None
-        except Exception as e:
-            logging.error(f"Error extrayendo objeto social: {e}")
-            return None
-
-    def procesar_empresa(self, url_detalles, razon_social, municipio, codigo_postal):
-        """Procesa una empresa individual y extrae todos sus detalles"""
-        try:
-            # Verificar si ya fue procesada
-            if self.empresa_ya_procesada(url_detalles):
-                logging.info(f"Empresa ya procesada: {razon_social}")
-                return None
-
             logging.info(f"Procesando: {url_detalles}")
 
-            # Hacer petición HTTP
-            response = self.session.get(url_detalles, timeout=30)
+            # Hacer petición HTTP (condicional si se está refrescando una ficha ya guardada)
+            response = self.session.get(url_detalles, headers=self.cabeceras_revalidacion(url_detalles), timeout=30)
             response.raise_for_status()
 
-            # Parsear HTML
-            soup = BeautifulSoup(response.content, 'html.parser')
+            validadores = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'hash_cuerpo': hashlib.sha256(response.content).hexdigest()
+            }
+
+            # 304 o mismo cuerpo que la última vez: no hay nada que parsear ni guardar
+            anteriores = self.validadores.get(url_detalles) if self.refrescar else None
+            if response.status_code == 304 or (anteriores and anteriores['hash_cuerpo'] == validadores['hash_cuerpo']):
+                logging.info(f"  Ficha sin cambios: {razon_social}")
+                return {'razon_social': razon_social, 'url_detalles': url_detalles, 'sin_cambios': True}
 
-            # Extraer todos los campos
-            direccion = self.extraer_direccion(soup)
-            telefono = self.extraer_telefono(soup)
-            cif = self.extraer_cif(soup)
-            sitio_web = self.extraer_sitio_web(soup)
-            email = self.extraer_email(soup)
-            fecha_constitucion = self.extraer_fecha_constitucion(soup)
-            cnae = self.extraer_cnae(soup)
-            objeto_social = self.extraer_objeto_social(soup)
+            # Parsear HTML y extraer todos los campos
+            campos = self.extraer_campos(response.content)
 
             # Contar campos extraídos
-            campos_extraidos = sum([
-                1 if direccion else 0,
-                1 if telefono else 0,
-                1 if cif else 0,
-                1 if sitio_web else 0,
-                1 if email else 0,
-                1 if fecha_constitucion else 0,
-                1 if cnae else 0,
-                1 if objeto_social else 0
-            ])
-
-            logging.info(f"  Extraídos {campos_extraidos}/8 campos")
+            campos_extraidos = sum(1 for valor in campos.values() if valor)
+            logging.info(f"  Extraídos {campos_extraidos}/{len(CAMPOS_DETALLE)} campos")
 
             # Crear diccionario con los datos
-            datos_empresa = {
+            return {
                 'razon_social': razon_social,
                 'municipio': municipio,
                 'codigo_postal': codigo_postal,
-                'direccion': direccion,
-                'telefono': telefono,
-                'cif': cif,
-                'sitio_web': sitio_web,
-                'email': email,
-                'fecha_constitucion': fecha_constitucion,
-                'cnae': cnae,
-                'objeto_social': objeto_social,
-                'url_detalles': url_detalles
+                **campos,
+                'url_detalles': url_detalles,
+                'validadores': validadores
             }
 
-            # Guardar en base de datos
-            if self.guardar_empresa_en_db(datos_empresa):
-                logging.info(f"  Guardada en DB: {razon_social}")
-                return datos_empresa
-            else:
-                logging.error(f"  Error guardando en DB: {razon_social}")
-                return None
-
         except Exception as e:
             logging.error(f"Error procesando empresa {razon_social}: {e}")
+            self.fallos.registrar(url_detalles, error=e, contexto={
+                'razon_social': razon_social, 'municipio': municipio, 'codigo_postal': codigo_postal
+            })
             return None
 
-    def procesar_empresas(self, max_empresas=None):
-        """Procesa todas las empresas del CSV"""
+    def registrar_empresa(self, datos_empresa):
+        """Guarda en base de datos los detalles ya extraídos de una empresa"""
+        if datos_empresa.get('sin_cambios'):
+            self.fichas_sin_cambios += 1
+            self.fallos.resolver(datos_empresa['url_detalles'])
+            return datos_empresa
+
+        if self.guardar_empresa_en_db(datos_empresa):
+            self.fallos.resolver(datos_empresa['url_detalles'])
+            logging.info(f"  Guardada en DB: {datos_empresa['razon_social']}")
+            return datos_empresa
+
+        logging.error(f"  Error guardando en DB: {datos_empresa['razon_social']}")
+        return None
+
+    def procesar_empresa(self, url_detalles, razon_social, municipio, codigo_postal):
+        """Procesa una empresa individual y extrae todos sus detalles"""
+        # Verificar si ya fue procesada
+        if self.omitir_empresa(url_detalles):
+            logging.info(f"Empresa ya procesada: {razon_social}")
+            return None
+
+        datos_empresa = self.extraer_detalles_empresa(url_detalles, razon_social, municipio, codigo_postal)
+        if not datos_empresa:
+            return None
+
+        return self.registrar_empresa(datos_empresa)
+
+    def generar_tareas(self, df, indice_cp, max_empresas=None):
+        """Genera las tuplas (url, razón social, municipio, código postal) a procesar"""
+        filas = zip(df['url_detalles'], df['razon_social'], df['municipio'])
+        for idx, (url_detalles, razon_social, municipio) in enumerate(filas):
+            if max_empresas and idx >= max_empresas:
+                break
+
+            # Buscar código postal
+            codigo_postal = indice_cp.obtener(municipio, 'N/A')
+
+            yield url_detalles, razon_social, municipio, codigo_postal
+
+    def procesar_en_serie(self, tareas):
+        """Procesa las empresas una a una; el limitador de la sesión marca el ritmo"""
+        for tarea in tareas:
+            yield self.procesar_empresa(*tarea)
+
+    def procesar_en_paralelo(self, tareas, concurrencia):
+        """Descarga varias fichas a la vez y guarda los resultados desde el hilo principal"""
+        with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+            en_curso = set()
+            for tarea in tareas:
+                if self.omitir_empresa(tarea[0]):
+                    logging.info(f"Empresa ya procesada: {tarea[1]}")
+                    yield None
+                    continue
+
+                # La sesión reparte los turnos del limitador entre los hilos
+                en_curso.add(executor.submit(self.extraer_detalles_empresa, *tarea))
+
+                # Mantener acotado el número de descargas pendientes
+                if len(en_curso) >= concurrencia * 2:
+                    terminadas, en_curso = wait(en_curso, return_when=FIRST_COMPLETED)
+                    for futuro in terminadas:
+                        datos_empresa = futuro.result()
+                        yield self.registrar_empresa(datos_empresa) if datos_empresa else None
+
+            for futuro in as_completed(en_curso):
+                datos_empresa = futuro.result()
+                yield self.registrar_empresa(datos_empresa) if datos_empresa else None
+
+    def procesar_empresas(self, max_empresas=None, concurrencia=1, refrescar=False):
+        """Procesa todas las empresas del CSV (refrescar=True revalida también las ya guardadas)"""
         try:
+            self.refrescar = refrescar
+            self.fichas_sin_cambios = 0
+            if refrescar:
+                self.validadores = self.cargar_validadores()
+
             # Encontrar el archivo CSV más reciente
             archivos_csv = [f for f in os.listdir('.') if f.startswith('empresas_axesor_') and f.endswith('.csv')]
             if not archivos_csv:
@@ -458,47 +587,34 @@ class ScraperDetallesSQLite:
             df = self.cargar_empresas_desde_csv(archivo_csv)
 
             # Cargar códigos postales
-            df_cp = pd.read_csv('municipios_pedanias_codigos_postales_corregidos.csv')
+            indice_cp = IndiceCodigosPostales('municipios_pedanias_codigos_postales_corregidos.csv')
+
+            tareas = self.generar_tareas(df, indice_cp, max_empresas)
+            # Una conexión keep-alive por hilo para que ninguno tenga que abrir otra
+            self.session.ajustar_pool(concurrencia)
+            if concurrencia > 1:
+                logging.info(f"Modo concurrente: {concurrencia} descargas simultáneas, "
+                             f"máximo {self.limitador.peticiones_por_segundo} peticiones/s por host")
+                resultados = self.procesar_en_paralelo(tareas, concurrencia)
+            else:
+                resultados = self.procesar_en_serie(tareas)
 
             # Procesar empresas
             empresas_procesadas = 0
             empresas_exitosas = 0
 
-            for idx, row in df.iterrows():
-                if max_empresas and empresas_procesadas >= max_empresas:
-                    break
-
-                # Buscar código postal
-                codigo_postal = None
-                for _, row_cp in df_cp.iterrows():
-                    if row_cp['municipio'].lower() == row['municipio'].lower():
-                        codigo_postal = str(row_cp['codigo_postal'])
-                        break
-
-                if not codigo_postal:
-                    codigo_postal = 'N/A'
-
-                # Procesar empresa
-                resultado = self.procesar_empresa(
-                    row['url_detalles'],
-                    row['razon_social'],
-                    row['municipio'],
-                    codigo_postal
-                )
-
+            for resultado in resultados:
                 empresas_procesadas += 1
                 if resultado:
                     empresas_exitosas += 1
 
-                # Actualizar estadísticas cada 10 empresas
-                if empresas_procesadas % 10 == 0:
-                    self.actualizar_estadisticas()
+                # Progreso una vez por lote. No se vacían aquí las pendientes: los lotes se
+                # escriben al llenarse o al vencer el plazo y los triggers cuentan lo ya guardado
+                if empresas_procesadas % self.tamano_lote == 0:
                     stats = self.obtener_estadisticas()
                     if stats:
-                        logging.info(f"📊 Progreso: {empresas_procesadas} procesadas, {stats['total_empresas']} en DB")
-
-                # Pausa entre peticiones
-                time.sleep(random.uniform(1, 3))
+                        logging.info(f"📊 Progreso: {empresas_procesadas} procesadas, {stats['total_empresas']} en DB, "
+                                     f"ritmo: {self.limitador.describir()}")
 
             # Actualizar estadísticas finales
             self.actualizar_estadisticas()
@@ -509,6 +625,10 @@ class ScraperDetallesSQLite:
                 self.mostrar_estadisticas(stats)
 
             logging.info(f"✅ Procesamiento completado: {empresas_exitosas}/{empresas_procesadas} empresas procesadas")
+            if refrescar:
+                logging.info(f"Fichas sin cambios desde la última descarga: {self.fichas_sin_cambios}")
+            if self.fallos.total():
+                logging.warning(f"Fichas con fallo permanente pendientes (tabla fallos_permanentes): {self.fallos.total()}")
 
         except Exception as e:
             logging.error(f"Error en procesamiento: {e}")
@@ -535,22 +655,32 @@ def main():
     parser = argparse.ArgumentParser(description='Scraper de detalles de empresas con SQLite')
     parser.add_argument('--max-empresas', type=int, help='Número máximo de empresas a procesar')
     parser.add_argument('--db-path', default='empresas_murcia.db', help='Ruta de la base de datos SQLite')
+    parser.add_argument('--concurrencia', type=int, default=Config.CONCURRENCIA_DETALLES,
+                        help='Número de fichas descargadas simultáneamente (1 = secuencial)')
+    parser.add_argument('--peticiones-por-segundo', type=float, default=Config.MAX_PETICIONES_POR_SEGUNDO,
+                        help='Techo de peticiones por segundo a cada host (el ritmo se adapta por debajo)')
+    parser.add_argument('--refrescar', action='store_true',
+                        help='Revalidar con peticiones condicionales las empresas ya guardadas')
 
     args = parser.parse_args()
 
+    scraper = None
     try:
-        scraper = ScraperDetallesSQLite(args.db_path)
+        scraper = ScraperDetallesSQLite(args.db_path, args.peticiones_por_segundo)
 
         if args.max_empresas:
             logging.info(f"Iniciando extracción de detalles para máximo {args.max_empresas} empresas")
         else:
             logging.info("Iniciando extracción de detalles para todas las empresas")
 
-        scraper.procesar_empresas(args.max_empresas)
+        scraper.procesar_empresas(args.max_empresas, args.concurrencia, args.refrescar)
 
     except Exception as e:
         logging.error(f"Error en ejecución: {e}")
         raise
+    finally:
+        if scraper:
+            scraper.cerrar()
 
 if __name__ == "__main__":
     main()
@@ -4,19 +4,274 @@
 Servidor web para servir datos de empresas en tiempo real
 """
 
-from flask import Flask, jsonify, render_template_string, send_from_directory
+from flask import Flask, Response, jsonify, render_template_string, send_from_directory, request
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+import csv
+import io
+import json
 import sqlite3
-import pandas as pd
+import tempfile
+import threading
+import time
 from datetime import datetime
 import os
 
+from esquema_empresas import CONDICIONES_ESTADISTICAS
+
 app = Flask(__name__)
 
+DB_PATH = 'empresas_murcia.db'
+
+# Columnas que se devuelven de cada empresa
+COLUMNAS_EMPRESA = [
+    'id', 'razon_social', 'municipio', 'codigo_postal', 'direccion', 'telefono',
+    'cif', 'sitio_web', 'email', 'fecha_constitucion', 'cnae', 'objeto_social',
+    'url_detalles', 'fecha_extraccion'
+]
+
+# Columnas por las que se permite ordenar (lista blanca para el ORDER BY)
+COLUMNAS_ORDENABLES = [
+    'fecha_extraccion', 'razon_social', 'municipio', 'codigo_postal', 'cnae', 'fecha_constitucion'
+]
+
+TAMANO_PAGINA_POR_DEFECTO = 50
+TAMANO_PAGINA_MAXIMO = 500
+
+# Máximo de filas nuevas por respuesta de /api/empresas/cambios; si hay más,
+# el cliente recarga la página completa
+MAX_CAMBIOS = 500
+
+# Flujo SSE: cada cuánto se mira si el scraper ha confirmado filas nuevas y
+# cada cuánto se envía un comentario para mantener viva la conexión
+INTERVALO_SONDEO_STREAM = 1
+INTERVALO_LATIDO_STREAM = 15
+
+# Exportación: filas leídas por bloque y columnas del archivo con su cabecera
+TAMANO_BLOQUE_EXPORTACION = 1000
+TAMANO_TROZO_ARCHIVO = 64 * 1024
+COLUMNAS_EXPORTACION = [
+    ('razon_social', 'Empresa'),
+    ('municipio', 'Municipio'),
+    ('codigo_postal', 'C.P.'),
+    ('cif', 'CIF'),
+    ('cnae', 'CNAE'),
+    ('telefono', 'Teléfono'),
+    ('sitio_web', 'Sitio Web'),
+    ('email', 'Email'),
+    ('fecha_constitucion', 'Fecha Constitución'),
+    ('objeto_social', 'Objeto Social'),
+    ('url_detalles', 'URL Detalles'),
+]
+
+# Estadísticas del panel: los contadores se leen en cada petición de la fila que
+# mantienen los triggers del scraper; los valores distintos (municipios, CNAE,
+# códigos postales) necesitan recorrer la tabla y se recalculan como mucho cada
+# INTERVALO_ESTADISTICAS_DISTINTAS segundos
+INTERVALO_ESTADISTICAS_DISTINTAS = 30
+_cache_estadisticas = {'momento': None, 'distintas': None, 'contadores': None}
+_lock_estadisticas = threading.Lock()
+
+# Los índices se crean una vez por proceso, en la primera conexión que lo consigue.
+# El cursor de cambios es version_cambio en cuanto algún proceso que escribe la ha añadido
+_esquema_preparado = threading.Event()
+_lock_esquema = threading.Lock()
+_esquema = {'indices': False, 'cursor': 'id'}
+
+# Índices que cubren los filtros y la ordenación de /api/empresas
+INDICES_EMPRESAS = [
+    "CREATE INDEX IF NOT EXISTS idx_empresas_fecha ON empresas_detalles(fecha_extraccion)",
+    "CREATE INDEX IF NOT EXISTS idx_empresas_municipio ON empresas_detalles(municipio, fecha_extraccion)",
+    "CREATE INDEX IF NOT EXISTS idx_empresas_cp ON empresas_detalles(codigo_postal, fecha_extraccion)",
+    "CREATE INDEX IF NOT EXISTS idx_empresas_cnae ON empresas_detalles(cnae, fecha_extraccion)",
+    "CREATE INDEX IF NOT EXISTS idx_empresas_razon_social ON empresas_detalles(razon_social)",
+]
+
+# Condición "tiene dato" de los filtros de contacto del panel
+CONDICIONES_CONTACTO = {
+    'telefono': "(telefono IS NOT NULL AND telefono != '')",
+    'email': "(email IS NOT NULL AND email != '')",
+    'web': "(sitio_web IS NOT NULL AND sitio_web != '')",
+}
+
 def get_db_connection():
     """Crea una conexión a la base de datos"""
-    conn = sqlite3.connect('empresas_murcia.db')
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    # La primera conexión prepara los índices, también cuando la app se sirve con
+    # flask run o un servidor WSGI, que no pasan por el bloque __main__
+    if not _esquema_preparado.is_set():
+        asegurar_indices(conn)
     return conn
 
+def asegurar_indices(conn):
+    """Crea los índices que usan los filtros y la ordenación de la API y elige el cursor de cambios"""
+    with _lock_esquema:
+        if _esquema_preparado.is_set():
+            return
+        columnas = [fila['name'] for fila in conn.execute("PRAGMA table_info(empresas_detalles)")]
+        # Si el scraper aún no ha creado la tabla se vuelve a intentar en la siguiente conexión
+        if not columnas:
+            return
+        if not _esquema['indices']:
+            try:
+                with conn:
+                    for sql in INDICES_EMPRESAS:
+                        conn.execute(sql)
+            except sqlite3.Error as e:
+                # p. ej. "database is locked" mientras escribe el scraper: la siguiente conexión lo reintenta
+                print(f"⚠️  No se pudieron crear los índices: {e}")
+                return
+            _esquema['indices'] = True
+
+        # version_cambio la añaden el scraper y reextraer_detalles.py, no el servidor, que solo lee.
+        # Hasta entonces se sigue por id, que es el valor con el que se rellena la columna
+        if 'version_cambio' not in columnas:
+            return
+        _esquema['cursor'] = 'version_cambio'
+        _esquema_preparado.set()
+
+def columnas_empresa():
+    """Columnas del SELECT de cada empresa, con el cursor de cambios como version_cambio"""
+    return ', '.join(COLUMNAS_EMPRESA + [f"{_esquema['cursor']} AS version_cambio"])
+
+def construir_filtros(args):
+    """Traduce los filtros de la petición a una cláusula WHERE con parámetros"""
+    condiciones = []
+    parametros = []
+
+    for campo in ('municipio', 'codigo_postal', 'cnae'):
+        valor = args.get(campo, '').strip()
+        if valor:
+            condiciones.append(f"{campo} = ?")
+            parametros.append(valor)
+
+    busqueda = args.get('q', '').strip()
+    if busqueda:
+        patron = '%' + busqueda.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        condiciones.append("(razon_social LIKE ? ESCAPE '\\' OR cif LIKE ? ESCAPE '\\')")
+        parametros.extend([patron, patron])
+
+    for campo, condicion in CONDICIONES_CONTACTO.items():
+        valor = args.get(f'con_{campo}', '')
+        if valor == 'si':
+            condiciones.append(condicion)
+        elif valor == 'no':
+            condiciones.append(f"NOT {condicion}")
+
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ''
+    return where, parametros
+
+def construir_orden(args):
+    """Devuelve la cláusula ORDER BY a partir de los parámetros orden y direccion"""
+    columna = args.get('orden', 'fecha_extraccion')
+    if columna not in COLUMNAS_ORDENABLES:
+        columna = 'fecha_extraccion'
+    direccion = 'ASC' if args.get('direccion', 'desc').lower() == 'asc' else 'DESC'
+    # El id desempata para que la paginación sea estable
+    return f"ORDER BY {columna} {direccion}, id {direccion}"
+
+def calcular_distintas(conn):
+    """Cuenta los municipios, CNAE y códigos postales distintos con una única consulta"""
+    fila = conn.execute("""
+        SELECT
+            COUNT(DISTINCT municipio) AS municipios_unicos,
+            COUNT(DISTINCT cnae) AS cnaes_unicos,
+            COUNT(DISTINCT codigo_postal) AS codigos_postales_unicos
+        FROM empresas_detalles
+    """).fetchone()
+    return dict(fila)
+
+def leer_contadores(conn):
+    """Lee los contadores de estadisticas_procesamiento, o None si la base de datos no los tiene"""
+    columnas = ', '.join(campo for campo, _ in CONDICIONES_ESTADISTICAS)
+    try:
+        fila = conn.execute(f"""
+            SELECT total_empresas, {columnas} FROM estadisticas_procesamiento WHERE id = 1
+        """).fetchone()
+    except sqlite3.OperationalError:
+        # Base de datos anterior a los triggers de estadísticas
+        return None
+    return dict(fila) if fila else None
+
+def calcular_contadores(conn):
+    """Calcula desde cero los mismos contadores que mantienen los triggers del scraper"""
+    sumas = ', '.join(f"COALESCE(SUM({condicion.format(fila='empresas_detalles')}), 0) AS {campo}"
+                      for campo, condicion in CONDICIONES_ESTADISTICAS)
+    return dict(conn.execute(f"SELECT COUNT(*) AS total_empresas, {sumas} FROM empresas_detalles").fetchone())
+
+def obtener_estadisticas(conn):
+    """Devuelve las estadísticas del panel sin recorrer la tabla en cada petición"""
+    # Una sola fila: los triggers la actualizan con cada empresa que guarda el scraper
+    contadores = leer_contadores(conn)
+
+    with _lock_estadisticas:
+        ahora = time.monotonic()
+        caducada = (_cache_estadisticas['momento'] is None
+                    or ahora - _cache_estadisticas['momento'] >= INTERVALO_ESTADISTICAS_DISTINTAS)
+        if caducada or (contadores is None and _cache_estadisticas['contadores'] is None):
+            _cache_estadisticas['distintas'] = calcular_distintas(conn)
+            # Sin la fila de contadores se calculan con la misma frecuencia que los distintos
+            _cache_estadisticas['contadores'] = calcular_contadores(conn) if contadores is None else None
+            _cache_estadisticas['momento'] = ahora
+        stats = dict(_cache_estadisticas['distintas'])
+        stats.update(contadores if contadores is not None else _cache_estadisticas['contadores'])
+    return stats
+
+def obtener_cursor(conn):
+    """Devuelve la version_cambio más alta: cada alta o modificación recibe una nueva"""
+    return conn.execute(f"SELECT COALESCE(MAX({_esquema['cursor']}), 0) FROM empresas_detalles").fetchone()[0]
+
+def condicion_cambios(where):
+    """Añade a los filtros la condición de cursor posterior al que ya tiene el cliente"""
+    columna = _esquema['cursor']
+    return f"{where} AND {columna} > ?" if where else f"WHERE {columna} > ?"
+
+def leer_empresas_por_bloques(args):
+    """Devuelve un generador de bloques de filas con los filtros y el orden de la tabla"""
+    # La consulta se construye ya, mientras el contexto de la petición sigue activo
+    where, parametros = construir_filtros(args)
+    query = f"""
+        SELECT {', '.join(columna for columna, _ in COLUMNAS_EXPORTACION)}
+        FROM empresas_detalles
+        {where}
+        {construir_orden(args)}
+    """
+
+    def generar():
+        conn = get_db_connection()
+        try:
+            cursor = conn.execute(query, parametros)
+            while True:
+                filas = cursor.fetchmany(TAMANO_BLOQUE_EXPORTACION)
+                if not filas:
+                    break
+                yield filas
+        finally:
+            conn.close()
+
+    return generar()
+
+def nombre_exportacion(extension):
+    """Nombre del archivo descargado"""
+    return f"empresas_murcia_{datetime.now().strftime('%Y-%m-%d')}.{extension}"
+
+def evento_sse(evento, datos, id_evento=None):
+    """Formatea un evento Server-Sent Events con los datos en JSON"""
+    lineas = [f"event: {evento}"]
+    if id_evento is not None:
+        lineas.append(f"id: {id_evento}")
+    lineas.append(f"data: {json.dumps(datos, ensure_ascii=False)}")
+    return '\n'.join(lineas) + '\n\n'
+
+def leer_entero(args, nombre, por_defecto, minimo, maximo):
+    """Lee un parámetro entero de la petición acotándolo al rango dado"""
+    try:
+        valor = int(args.get(nombre, por_defecto))
+    except (TypeError, ValueError):
+        valor = por_defecto
+    return max(minimo, min(valor, maximo))
+
 @app.route('/')
 def index():
     """Página principal con visualización en tiempo real"""
@@ -203,6 +458,18 @@ def index():
             50% { background: #d4edda; }
             100% { background: #e8f5e8; }
         }
+        .pagination {
+            text-align: center;
+            margin-top: 20px;
+            color: white;
+        }
+        .pagination .btn {
+            margin: 0 10px;
+        }
+        .pagination .btn:disabled {
+            opacity: 0.5;
+            cursor: default;
+        }
         .export-buttons {
             text-align: center;
             margin-top: 20px;
@@ -309,7 +576,7 @@ def index():
                 </div>
                 <div class="filter-item">
                     <label for="search-filter">Buscar empresa:</label>
-                    <input type="text" id="search-filter" placeholder="Nombre de la empresa..." oninput="filterTable()">
+                    <input type="text" id="search-filter" placeholder="Nombre o CIF de la empresa..." oninput="filterTableDelayed()">
                 </div>
             </div>
             <div class="filter-group">
@@ -337,6 +604,18 @@ def index():
                         <option value="no">Solo sin sitio web</option>
                     </select>
                 </div>
+                <div class="filter-item">
+                    <label for="orden-filter">Ordenar por:</label>
+                    <select id="orden-filter" onchange="filterTable()">
+                        <option value="fecha_extraccion:desc">Más recientes</option>
+                        <option value="fecha_extraccion:asc">Más antiguas</option>
+                        <option value="razon_social:asc">Empresa (A-Z)</option>
+                        <option value="razon_social:desc">Empresa (Z-A)</option>
+                        <option value="municipio:asc">Municipio</option>
+                        <option value="codigo_postal:asc">Código postal</option>
+                        <option value="cnae:asc">CNAE</option>
+                    </select>
+                </div>
             </div>
         </div>
 
@@ -369,6 +648,12 @@ def index():
             </table>
         </div>
 
+        <div class="pagination">
+            <button id="prev-page" onclick="changePage(-1)" class="btn btn-primary">◀ Anterior</button>
+            <span id="page-info">Página 1 de 1</span>
+            <button id="next-page" onclick="changePage(1)" class="btn btn-primary">Siguiente ▶</button>
+        </div>
+
         <div class="export-buttons">
             <button onclick="exportToCSV()" class="btn btn-success">📥 Exportar a CSV</button>
             <button onclick="exportToExcel()" class="btn btn-primary">📊 Exportar a Excel</button>
@@ -377,24 +662,62 @@ def index():
 
     <script>
         let autoRefreshInterval;
-        let autoRefreshActive = true;
+        let autoRefreshActive = false;
+        let eventSource = null;
+        let filterCounts = null;
         let refreshCountdown = 30;
         let empresasData = [];
         let lastUpdate = null;
+        let currentPage = 1;
+        let totalPages = 1;
+        let totalFiltered = 0;
+        let searchTimeout = null;
+        let lastCursor = 0;
+        let pageSize = 50;
+        let newRows = new Set();
 
         // Cargar datos iniciales
+        loadFilters();
         loadData();
 
+        function buildQueryParams() {
+            const [orden, direccion] = document.getElementById('orden-filter').value.split(':');
+            const params = new URLSearchParams({
+                municipio: document.getElementById('municipio-filter').value,
+                codigo_postal: document.getElementById('cp-filter').value,
+                cnae: document.getElementById('cnae-filter').value,
+                q: document.getElementById('search-filter').value.trim(),
+                con_telefono: document.getElementById('telefono-filter').value,
+                con_email: document.getElementById('email-filter').value,
+                con_web: document.getElementById('web-filter').value,
+                orden: orden,
+                direccion: direccion
+            });
+            // No enviar filtros vacíos
+            [...params.keys()].forEach(key => { if (!params.get(key)) params.delete(key); });
+            return params;
+        }
+
         function loadData() {
-            fetch('/api/empresas')
+            const params = buildQueryParams();
+            params.set('pagina', currentPage);
+
+            fetch('/api/empresas?' + params.toString())
                 .then(response => response.json())
                 .then(data => {
                     empresasData = data.empresas;
                     lastUpdate = data.last_update;
+                    totalPages = data.paginas;
+                    totalFiltered = data.total;
+                    lastCursor = data.cursor;
+                    pageSize = data.tamano_pagina;
+                    newRows = new Set();
                     updateStats(data.stats);
                     updateTable();
-                    updateFilters();
+                    updatePagination();
                     updateLastUpdate();
+                    // El flujo en directo sigue desde el nuevo cursor con los filtros actuales
+                    if (autoRefreshActive && window.EventSource) startStream();
                 })
                 .catch(error => {
                     console.error('Error cargando datos:', error);
@@ -441,10 +764,59 @@ def index():
             `;
         }
 
+        function loadChanges() {
+            // Pide solo lo insertado o actualizado desde el último cursor y lo mezcla con la página actual
+            const params = buildQueryParams();
+            params.set('desde', lastCursor);
+
+            fetch('/api/empresas/cambios?' + params.toString())
+                .then(response => response.json())
+                .then(data => {
+                    if (!data.completo) {
+                        loadData();
+                        return;
+                    }
+                    mergeChanges(data.empresas);
+                    lastCursor = data.cursor;
+                    lastUpdate = data.last_update;
+                    totalFiltered = data.total;
+                    totalPages = Math.max(1, Math.ceil(data.total / pageSize));
+                    updateStats(data.stats);
+                    updatePagination();
+                    updateLastUpdate();
+                })
+                .catch(error => console.error('Error cargando cambios:', error));
+        }
+
+        function mergeChanges(cambios) {
+            if (cambios.length === 0) return;
+
+            const [orden, direccion] = document.getElementById('orden-filter').value.split(':');
+            const showsNewest = currentPage === 1 && orden === 'fecha_extraccion' && direccion === 'desc';
+
+            cambios.forEach(empresa => {
+                const index = empresasData.findIndex(e => e.url_detalles === empresa.url_detalles);
+                if (index >= 0) {
+                    // Empresa actualizada que ya estaba en la página
+                    empresasData.splice(index, 1);
+                    if (!showsNewest) {
+                        empresasData.splice(index, 0, empresa);
+                    }
+                }
+                if (showsNewest) {
+                    empresasData.unshift(empresa);
+                    newRows.add(empresa.url_detalles);
+                }
+            });
+
+            empresasData = empresasData.slice(0, pageSize);
+            updateTable();
+        }
+
         function updateTable() {
             const tbody = document.getElementById('empresas-tbody');
             tbody.innerHTML = empresasData.map((empresa, index) => `
-                <tr class="${index < 5 ? 'new-company' : ''}">
+                <tr class="${newRows.has(empresa.url_detalles) ? 'new-company' : ''}">
                     <td>${empresa.razon_social}</td>
                     <td>${empresa.municipio || ''}</td>
                     <td>${empresa.codigo_postal || ''}</td>
@@ -461,22 +833,39 @@ def index():
             `).join('');
         }
 
-        function updateFilters() {
-            const municipios = [...new Set(empresasData.map(e => e.municipio).filter(Boolean))].sort();
-            const codigosPostales = [...new Set(empresasData.map(e => e.codigo_postal).filter(Boolean))].sort();
-            const cnaes = [...new Set(empresasData.map(e => e.cnae).filter(Boolean))].sort();
+        function loadFilters() {
+            fetch('/api/empresas/filtros')
+                .then(response => response.json())
+                .then(data => {
+                    fillSelect('municipio-filter', 'Todos los municipios', data.municipios);
+                    fillSelect('cp-filter', 'Todos los códigos postales', data.codigos_postales);
+                    fillSelect('cnae-filter', 'Todos los CNAEs', data.cnaes);
+                })
+                .catch(error => console.error('Error cargando filtros:', error));
+        }
 
-            document.getElementById('municipio-filter').innerHTML =
-                '<option value="">Todos los municipios</option>' +
-                municipios.map(m => `<option value="${m}">${m}</option>`).join('');
+        function fillSelect(id, placeholder, values) {
+            // Conservar la opción elegida al refrescar la lista
+            const select = document.getElementById(id);
+            const selected = select.value;
+            select.innerHTML =
+                `<option value="">${placeholder}</option>` +
+                values.map(v => `<option value="${v}">${v}</option>`).join('');
+            select.value = selected;
+        }
 
-            document.getElementById('cp-filter').innerHTML =
-                '<option value="">Todos los códigos postales</option>' +
-                codigosPostales.map(cp => `<option value="${cp}">${cp}</option>`).join('');
+        function updatePagination() {
+            document.getElementById('page-info').textContent =
+                `Página ${currentPage} de ${totalPages} (${totalFiltered} empresas)`;
+            document.getElementById('prev-page').disabled = currentPage <= 1;
+            document.getElementById('next-page').disabled = currentPage >= totalPages;
+        }
 
-            document.getElementById('cnae-filter').innerHTML =
-                '<option value="">Todos los CNAEs</option>' +
-                cnaes.map(cnae => `<option value="${cnae}">${cnae}</option>`).join('');
+        function changePage(delta) {
+            const page = currentPage + delta;
+            if (page < 1 || page > totalPages) return;
+            currentPage = page;
+            loadData();
         }
 
         function updateLastUpdate() {
@@ -485,61 +874,49 @@ def index():
         }
 
         function filterTable() {
-            const municipioFilter = document.getElementById('municipio-filter').value;
-            const cpFilter = document.getElementById('cp-filter').value;
-            const cnaeFilter = document.getElementById('cnae-filter').value;
-            const searchFilter = document.getElementById('search-filter').value.toLowerCase();
-            const telefonoFilter = document.getElementById('telefono-filter').value;
-            const emailFilter = document.getElementById('email-filter').value;
-            const webFilter = document.getElementById('web-filter').value;
+            // El filtrado se hace en el servidor; se vuelve a la primera página
+            currentPage = 1;
+            loadData();
+        }
 
-            const tbody = document.getElementById('empresas-tbody');
-            const rows = tbody.querySelectorAll('tr');
-
-            let visibleCount = 0;
-
-            rows.forEach(row => {
-                const empresa = row.cells[0].textContent.toLowerCase();
-                const municipio = row.cells[1].textContent;
-                const cp = row.cells[2].textContent;
-                const cnae = row.cells[4].textContent;
-                const telefono = row.cells[5].textContent.trim();
-                const web = row.cells[6].textContent.trim();
-                const email = row.cells[7].textContent.trim();
-
-                const matchesMunicipio = !municipioFilter || municipio === municipioFilter;
-                const matchesCP = !cpFilter || cp === cpFilter;
-                const matchesCNAE = !cnaeFilter || cnae === cnaeFilter;
-                const matchesSearch = !searchFilter || empresa.includes(searchFilter);
-
-                // Filtros de contacto
-                const hasTelefono = telefono !== '';
-                const hasWeb = web !== '';
-                const hasEmail = email !== '';
-
-                const matchesTelefono = !telefonoFilter ||
-                    (telefonoFilter === 'si' && hasTelefono) ||
-                    (telefonoFilter === 'no' && !hasTelefono);
-                const matchesEmail = !emailFilter ||
-                    (emailFilter === 'si' && hasEmail) ||
-                    (emailFilter === 'no' && !hasEmail);
-                const matchesWeb = !webFilter ||
-                    (webFilter === 'si' && hasWeb) ||
-                    (webFilter === 'no' && !hasWeb);
-
-                if (matchesMunicipio && matchesCP && matchesCNAE && matchesSearch &&
-                    matchesTelefono && matchesEmail && matchesWeb) {
-                    row.style.display = '';
-                    visibleCount++;
-                } else {
-                    row.style.display = 'none';
-                }
+        function filterTableDelayed() {
+            clearTimeout(searchTimeout);
+            searchTimeout = setTimeout(filterTable, 300);
+        }
+
+        function startStream() {
+            // Una sola conexión abierta recibe cada empresa en cuanto el scraper la guarda
+            stopStream();
+            const params = buildQueryParams();
+            params.set('desde', lastCursor);
+            eventSource = new EventSource('/api/empresas/stream?' + params.toString());
+
+            eventSource.addEventListener('empresa', event => {
+                const empresa = JSON.parse(event.data);
+                mergeChanges([empresa]);
+                lastCursor = empresa.version_cambio;
             });
 
-            // Actualizar contador
-            const statNumbers = document.querySelectorAll('.stat-card .stat-number');
-            if (statNumbers.length > 0) {
-                statNumbers[0].textContent = visibleCount;
+            eventSource.addEventListener('stats', event => {
+                const data = JSON.parse(event.data);
+                lastUpdate = data.last_update;
+                totalFiltered = data.total;
+                totalPages = Math.max(1, Math.ceil(data.total / pageSize));
+                updateStats(data.stats);
+                updatePagination();
+                updateLastUpdate();
+
+                // Los desplegables solo se recargan si aparecen valores nuevos
+                const counts = [data.stats.municipios_unicos, data.stats.codigos_postales_unicos, data.stats.cnaes_unicos].join('/');
+                if (filterCounts !== null && counts !== filterCounts) loadFilters();
+                filterCounts = counts;
+            });
+        }
+
+        function stopStream() {
+            if (eventSource) {
+                eventSource.close();
+                eventSource = null;
             }
         }
 
@@ -549,11 +926,20 @@ def index():
 
             if (autoRefreshActive) {
                 clearInterval(autoRefreshInterval);
+                stopStream();
                 autoRefreshActive = false;
                 btn.textContent = '🔄 Auto-refresh: DESACTIVADO';
                 btn.classList.remove('active');
                 progressFill.style.width = '0%';
+            } else if (window.EventSource) {
+                autoRefreshActive = true;
+                btn.textContent = '🔴 En directo: ACTIVADO';
+                btn.classList.add('active');
+                progressFill.style.width = '100%';
+                // Si aún no hay cursor, loadData abrirá el flujo al terminar
+                if (lastCursor) startStream();
             } else {
+                // Navegadores sin EventSource: sondeo de cambios cada 30 segundos
                 autoRefreshActive = true;
                 btn.textContent = '🔄 Auto-refresh: ACTIVADO';
                 btn.classList.add('active');
@@ -565,7 +951,8 @@ def index():
                     updateProgress();
 
                     if (refreshCountdown <= 0) {
-                        loadData();
+                        loadFilters();
+                        loadChanges();
                         refreshCountdown = 30;
                     }
                 }, 1000);
@@ -579,36 +966,12 @@ def index():
         }
 
         function exportToCSV() {
-            const headers = ['Empresa', 'Municipio', 'C.P.', 'CIF', 'CNAE', 'Teléfono', 'Sitio Web', 'Email', 'Fecha Constitución', 'Objeto Social', 'URL Detalles'];
-
-            let csvContent = headers.join(',') + '\\n';
-
-            empresasData.forEach(row => {
-                const values = [
-                    `"${row.razon_social}"`,
-                    `"${row.municipio || ''}"`,
-                    `"${row.codigo_postal || ''}"`,
-                    `"${row.cif || ''}"`,
-                    `"${row.cnae || ''}"`,
-                    `"${row.telefono || ''}"`,
-                    `"${row.sitio_web || ''}"`,
-                    `"${row.email || ''}"`,
-                    `"${row.fecha_constitucion || ''}"`,
-                    `"${row.objeto_social || ''}"`,
-                    `"${row.url_detalles}"`,
-                ];
-                csvContent += values.join(',') + '\\n';
-            });
-
-            const blob = new Blob([csvContent], { type: 'text/csv;charset=utf-8;' });
-            const link = document.createElement('a');
-            link.href = URL.createObjectURL(blob);
-            link.download = 'empresas_murcia_' + new Date().toISOString().slice(0,10) + '.csv';
-            link.click();
+            // El servidor genera el archivo por bloques con los mismos filtros y orden que la tabla
+            window.location = '/api/empresas/exportar/csv?' + buildQueryParams().toString();
         }
 
         function exportToExcel() {
-            alert('Función de exportación a Excel simulada. Usa la exportación a CSV.');
+            window.location = '/api/empresas/exportar/xlsx?' + buildQueryParams().toString();
         }
 
         // Iniciar auto-refresh
@@ -621,52 +984,41 @@ def index():
 
 @app.route('/api/empresas')
 def api_empresas():
-    """API para obtener datos de empresas"""
+    """API para obtener una página de empresas filtrada y ordenada"""
     try:
-        # Conectar directamente a la base de datos
-        conn = sqlite3.connect('empresas_murcia.db')
+        pagina = leer_entero(request.args, 'pagina', 1, 1, 10**9)
+        tamano_pagina = leer_entero(request.args, 'tamano_pagina', TAMANO_PAGINA_POR_DEFECTO, 1, TAMANO_PAGINA_MAXIMO)
+        where, parametros = construir_filtros(request.args)
+        orden = construir_orden(request.args)
 
-        # Obtener empresas
-        query = """
-        SELECT
-            razon_social,
-            municipio,
-            codigo_postal,
-            direccion,
-            telefono,
-            cif,
-            sitio_web,
-            email,
-            fecha_constitucion,
-            cnae,
-            objeto_social,
-            url_detalles,
-            fecha_extraccion
+        conn = get_db_connection()
+
+        # El cursor se lee antes que la página: lo que el scraper confirme entre medias
+        # queda por encima y llega en la siguiente consulta de cambios en vez de perderse
+        cursor = obtener_cursor(conn)
+        total = conn.execute(f"SELECT COUNT(*) FROM empresas_detalles {where}", parametros).fetchone()[0]
+
+        # Obtener solo la página pedida
+        query = f"""
+        SELECT {columnas_empresa()}
         FROM empresas_detalles
-        ORDER BY fecha_extraccion DESC
+        {where}
+        {orden}
+        LIMIT ? OFFSET ?
         """
-
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        filas = conn.execute(query, parametros + [tamano_pagina, (pagina - 1) * tamano_pagina]).fetchall()
 
         # Calcular estadísticas
-        stats = {
-            'total_empresas': int(len(df)),
-            'municipios_unicos': int(df['municipio'].nunique()),
-            'cnaes_unicos': int(df['cnae'].nunique()),
-            'codigos_postales_unicos': int(df['codigo_postal'].nunique()),
-            'empresas_con_direccion': int(df['direccion'].notna().sum()),
-            'empresas_con_telefono': int(df['telefono'].notna().sum()),
-            'empresas_con_cif': int(df['cif'].notna().sum()),
-            'empresas_con_web': int(df['sitio_web'].notna().sum()),
-            'empresas_con_email': int(df['email'].notna().sum()),
-            'empresas_con_fecha': int(df['fecha_constitucion'].notna().sum()),
-            'empresas_con_cnae': int(df['cnae'].notna().sum()),
-            'empresas_con_objeto': int(df['objeto_social'].notna().sum())
-        }
+        stats = obtener_estadisticas(conn)
+        conn.close()
 
         return jsonify({
-            'empresas': df.to_dict('records'),
+            'empresas': [dict(fila) for fila in filas],
+            'total': total,
+            'pagina': pagina,
+            'tamano_pagina': tamano_pagina,
+            'paginas': max(1, -(-total // tamano_pagina)),
+            'cursor': cursor,
             'stats': stats,
             'last_update': datetime.now().strftime('%d/%m/%Y %H:%M:%S')
         })
@@ -677,6 +1029,227 @@ def api_empresas():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/empresas/cambios')
+def api_cambios():
+    """API con las empresas insertadas o actualizadas desde el cursor del cliente"""
+    try:
+        desde = leer_entero(request.args, 'desde', 0, 0, 2**63 - 1)
+        where, parametros = construir_filtros(request.args)
+        conn = get_db_connection()
+        # Se fija el tope antes de leer las filas: lo que se confirme después queda
+        # por encima del cursor devuelto y llega en la siguiente consulta
+        tope = obtener_cursor(conn)
+        where_cambios = f"{condicion_cambios(where)} AND {_esquema['cursor']} <= ?"
+
+        # Los triggers dan una version_cambio nueva a cada empresa insertada o
+        # actualizada (también a las re-extraídas en el sitio, que conservan el id)
+        filas = conn.execute(f"""
+            SELECT {columnas_empresa()}
+            FROM empresas_detalles
+            {where_cambios}
+            ORDER BY {_esquema['cursor']}
+            LIMIT ?
+        """, parametros + [desde, tope, MAX_CAMBIOS + 1]).fetchall()
+
+        completo = len(filas) <= MAX_CAMBIOS
+        filas = filas[:MAX_CAMBIOS]
+        cursor = filas[-1]['version_cambio'] if filas and not completo else max(desde, tope)
+
+        total = conn.execute(f"SELECT COUNT(*) FROM empresas_detalles {where}", parametros).fetchone()[0]
+        stats = obtener_estadisticas(conn)
+        conn.close()
+
+        respuesta = jsonify({
+            'empresas': [dict(fila) for fila in filas],
+            'completo': completo,
+            'cursor': cursor,
+            'total': total,
+            'stats': stats,
+            'last_update': datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+        })
+        # Permite que la página estática de visualizacion_tiempo_real.py consulte los cambios
+        respuesta.headers['Access-Control-Allow-Origin'] = '*'
+        return respuesta
+
+    except Exception as e:
+        print(f"Error en API de cambios: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/empresas/stream')
+def api_stream():
+    """Flujo SSE con cada empresa en cuanto el scraper la confirma en la base de datos"""
+    # Al reconectar, el navegador envía el id del último evento recibido
+    args = {'desde': request.headers.get('Last-Event-ID') or request.args.get('desde')}
+    desde = leer_entero(args, 'desde', 0, 0, 2**63 - 1)
+    where, parametros = construir_filtros(request.args)
+
+    def generar():
+        conn = get_db_connection()
+        cursor = desde
+        version = None
+        ultimo_envio = time.monotonic()
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                # data_version solo cambia cuando otra conexión confirma una transacción,
+                # así que sin escrituras del scraper no se consulta la tabla
+                version_actual = conn.execute("PRAGMA data_version").fetchone()[0]
+                if version_actual != version:
+                    version = version_actual
+                    hay_cambios = False
+                    # Un proceso que escribe puede haber añadido version_cambio desde que se abrió el flujo
+                    if not _esquema_preparado.is_set():
+                        asegurar_indices(conn)
+                    while True:
+                        filas = conn.execute(f"""
+                            SELECT {columnas_empresa()}
+                            FROM empresas_detalles
+                            {condicion_cambios(where)}
+                            ORDER BY {_esquema['cursor']}
+                            LIMIT ?
+                        """, parametros + [cursor, MAX_CAMBIOS]).fetchall()
+                        for fila in filas:
+                            cursor = fila['version_cambio']
+                            yield evento_sse('empresa', dict(fila), cursor)
+                        hay_cambios = hay_cambios or bool(filas)
+                        if len(filas) < MAX_CAMBIOS:
+                            break
+
+                    if hay_cambios:
+                        total = conn.execute(f"SELECT COUNT(*) FROM empresas_detalles {where}", parametros).fetchone()[0]
+                        yield evento_sse('stats', {
+                            'total': total,
+                            'stats': obtener_estadisticas(conn),
+                            'last_update': datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+                        }, cursor)
+                        ultimo_envio = time.monotonic()
+
+                if time.monotonic() - ultimo_envio >= INTERVALO_LATIDO_STREAM:
+                    yield ': latido\n\n'
+                    ultimo_envio = time.monotonic()
+                time.sleep(INTERVALO_SONDEO_STREAM)
+        finally:
+            conn.close()
+
+    return Response(generar(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+        'Access-Control-Allow-Origin': '*'
+    })
+
+@app.route('/api/estadisticas')
+def api_estadisticas():
+    """API con las estadísticas del panel servidas desde la caché"""
+    try:
+        conn = get_db_connection()
+        stats = obtener_estadisticas(conn)
+        cursor = obtener_cursor(conn)
+        conn.close()
+
+        return jsonify({
+            'stats': stats,
+            'cursor': cursor,
+            'last_update': datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+        })
+
+    except Exception as e:
+        print(f"Error en API de estadísticas: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/empresas/exportar/csv')
+def exportar_csv():
+    """Descarga en CSV de las empresas filtradas, generada por bloques"""
+    bloques = leer_empresas_por_bloques(request.args)
+
+    def generar():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # BOM para que Excel abra el CSV como UTF-8
+        buffer.write('\ufeff')
+        writer.writerow([cabecera for _, cabecera in COLUMNAS_EXPORTACION])
+        for filas in bloques:
+            writer.writerows(filas)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        yield buffer.getvalue()
+
+    return Response(generar(), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename="{nombre_exportacion("csv")}"'
+    })
+
+@app.route('/api/empresas/exportar/xlsx')
+def exportar_xlsx():
+    """Descarga en Excel de las empresas filtradas, escrita en modo write-only"""
+    try:
+        # En modo write-only openpyxl vuelca cada fila a disco al añadirla,
+        # así que la memoria no crece con el número de empresas
+        libro = Workbook(write_only=True)
+        hoja = libro.create_sheet('Empresas')
+        hoja.append([cabecera for _, cabecera in COLUMNAS_EXPORTACION])
+        for filas in leer_empresas_por_bloques(request.args):
+            for fila in filas:
+                hoja.append([
+                    ILLEGAL_CHARACTERS_RE.sub('', valor) if isinstance(valor, str) else valor
+                    for valor in fila
+                ])
+
+        temporal = tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False)
+        temporal.close()
+        try:
+            libro.save(temporal.name)
+        except Exception:
+            # Un archivo a medio escribir no se va a servir nunca
+            os.remove(temporal.name)
+            raise
+
+    except Exception as e:
+        print(f"Error exportando a Excel: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    def generar():
+        with open(temporal.name, 'rb') as archivo:
+            while True:
+                trozo = archivo.read(TAMANO_TROZO_ARCHIVO)
+                if not trozo:
+                    break
+                yield trozo
+
+    response = Response(generar(), headers={
+        'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'Content-Disposition': f'attachment; filename="{nombre_exportacion("xlsx")}"',
+        'Content-Length': str(os.path.getsize(temporal.name))
+    })
+    # El servidor cierra la respuesta también cuando el cliente corta la descarga
+    # antes de empezar a leerla, y entonces el generador no llega a ejecutarse
+    response.call_on_close(lambda: os.remove(temporal.name))
+    return response
+
+@app.route('/api/empresas/filtros')
+def api_filtros():
+    """API con los valores disponibles para los desplegables de filtro"""
+    try:
+        conn = get_db_connection()
+        valores = {}
+        for campo in ('municipio', 'codigo_postal', 'cnae'):
+            filas = conn.execute(f"""
+                SELECT DISTINCT {campo} FROM empresas_detalles
+                WHERE {campo} IS NOT NULL AND {campo} != ''
+                ORDER BY {campo}
+            """).fetchall()
+            valores[campo] = [fila[0] for fila in filas]
+        conn.close()
+
+        return jsonify({
+            'municipios': valores['municipio'],
+            'codigos_postales': valores['codigo_postal'],
+            'cnaes': valores['cnae']
+        })
+
+    except Exception as e:
+        print(f"Error en API de filtros: {e}")
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     print("🌐 Iniciando servidor web en http://localhost:5000")
     print("📊 La página se actualizará automáticamente cada 30 segundos")
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Pruebas del sumidero SQLite del listado de Axesor
+"""
+
+from almacen_listado import SumideroListado
+
+
+def empresas(*nombres, municipio='Lorca'):
+    """Filas de una página del listado"""
+    return [{'razon_social': nombre, 'municipio': municipio, 'fuente': 'axesor',
+             'url_detalles': f'https://www.axesor.es/Informes-Empresas/{nombre}.html'} for nombre in nombres]
+
+
+def test_repetidas_conservan_la_primera_posicion(tmp_path):
+    """Una razón social repetida se queda con la posición de un recorrido secuencial, llegue cuando llegue"""
+    sumidero = SumideroListado(str(tmp_path / 'listado.db'))
+    try:
+        # El municipio 1 termina antes que el 0, como puede pasar con varios hilos
+        sumidero.agregar(empresas('ACME', 'BETA', municipio='Lorca'), orden_municipio=1, pagina=2)
+        sumidero.agregar(empresas('GAMMA', 'ACME', municipio='Murcia'), orden_municipio=0, pagina=3)
+        # Aparece después en el orden secuencial: no mueve a ACME
+        sumidero.agregar(empresas('ACME', municipio='Yecla'), orden_municipio=2, pagina=1)
+        # Misma página, posición anterior
+        sumidero.agregar(empresas('BETA', 'DELTA', municipio='Lorca'), orden_municipio=1, pagina=1)
+
+        filas = [fila for bloque in sumidero.leer_por_bloques() for fila in bloque]
+        assert [(razon_social, municipio) for razon_social, municipio, _, _ in filas] == [
+            ('GAMMA', 'Murcia'), ('ACME', 'Murcia'), ('BETA', 'Lorca'), ('DELTA', 'Lorca'),
+        ]
+        assert sumidero.total() == 4
+    finally:
+        sumidero.cerrar()
+
+
+def test_checkpoint_solo_avanza_con_municipio(tmp_path):
+    """El checkpoint avanza con las páginas que lo indican y nunca retrocede"""
+    sumidero = SumideroListado(str(tmp_path / 'listado.db'))
+    try:
+        assert sumidero.iniciar_municipio('Lorca', 0, 'https://axesor/lorca/1') == (0, None)
+        sumidero.agregar(empresas('A'), 0, 2, 'Lorca', 'https://axesor/lorca/2')
+        # Página guardada tras un hueco: no mueve el checkpoint
+        sumidero.agregar(empresas('B'), 0, 4)
+        # Página anterior que llega tarde: tampoco
+        sumidero.agregar(empresas('C'), 0, 1, 'Lorca', 'https://axesor/lorca/1')
+
+        assert sumidero.iniciar_municipio('Lorca', 0, 'https://axesor/lorca/1') == (2, 'https://axesor/lorca/2')
+        assert sumidero.cargar_progreso()['Lorca']['estado'] == 'en_curso'
+        sumidero.completar_municipio('Lorca')
+        assert sumidero.cargar_progreso()['Lorca']['estado'] == 'completado'
+    finally:
+        sumidero.cerrar()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Pruebas del escáner de CIF, CNAE, email, teléfono y código postal
+"""
+
+from escaner_texto import (ESCANER_AXESOR, ESCANER_EMPRESA_SCRAPER, ESCANER_SCRAPER_AVANZADO,
+                           literal_obligatorio)
+
+
+def test_literal_obligatorio():
+    """El texto fijo se toma del nivel exterior del patrón, sin grupos, clases ni repeticiones"""
+    assert literal_obligatorio(r'CIF[:\s]*([A-Z]\d{7,8}[A-Z]?)') == 'CIF'
+    assert literal_obligatorio(r'([A-Z]\d{7,8}[A-Z]?)\s*\(CIF\)') == '(CIF)'
+    assert literal_obligatorio(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b') == '@'
+    assert literal_obligatorio(r'Código Postal[:\s]*(\d{5})') == 'Código Postal'
+    assert literal_obligatorio(r'(\+34\s?)?[6-9]\d{8}') == ''
+    assert literal_obligatorio(r'\b[A-Z]\d{8}\b') == ''
+    assert literal_obligatorio(r'CIFS?') == 'CIF'
+    assert literal_obligatorio(r'CIF|NIF') == ''
+
+
+def test_cif_exige_digito_de_control():
+    """Solo se aceptan CIF con el dígito de control correcto, en mayúsculas"""
+    assert ESCANER_AXESOR.buscar('cif', '<p>CIF: B73512345</p>') is None
+    assert ESCANER_AXESOR.buscar('cif', '<p>cif: b73512348</p>') == 'B73512348'
+    # Si el primero no es válido se sigue con los demás candidatos
+    assert ESCANER_EMPRESA_SCRAPER.buscar('cif', 'B73512345 y luego B73512348') == 'B73512348'
+
+
+def test_telefono_es_la_coincidencia_entera():
+    """El teléfono conserva el prefijo +34 (antes se devolvía solo el grupo del prefijo)"""
+    datos = ESCANER_EMPRESA_SCRAPER.extraer('Llámenos al +34 968123456 o escriba a info@acme.es')
+    assert datos['telefono'] == '+34 968123456'
+    assert datos['email'] == 'info@acme.es'
+
+
+def test_patrones_de_cnae_de_cada_scraper():
+    """Cada scraper conserva sus patrones de CNAE y su distinción de mayúsculas"""
+    texto = 'Código: 30800'
+    assert ESCANER_EMPRESA_SCRAPER.extraer(texto)['cnae'] is None
+    assert ESCANER_SCRAPER_AVANZADO.extraer(texto)['cnae'] == '3080'
+    assert ESCANER_AXESOR.extraer(texto)['cnae'] == '3080'
+
+    assert ESCANER_EMPRESA_SCRAPER.extraer('cnae: 4321')['cnae'] is None
+    assert ESCANER_SCRAPER_AVANZADO.extraer('cnae: 4321')['cnae'] == '4321'
+
+
+def test_codigo_postal_distingue_mayusculas():
+    """El código postal de Axesor sigue sin IGNORECASE"""
+    assert ESCANER_AXESOR.extraer('CP: 41001')['codigo_postal'] == '41001'
+    assert ESCANER_AXESOR.extraer('cp: 41001')['codigo_postal'] is None
+    assert ESCANER_AXESOR.extraer('Lorca 30800')['codigo_postal'] == '30800'
+
+
+def test_texto_vacio():
+    """Sin texto todas las entidades quedan vacías"""
+    assert ESCANER_AXESOR.extraer('') == {'cif': None, 'cnae': None, 'codigo_postal': None}
+    assert ESCANER_EMPRESA_SCRAPER.extraer(None)['email'] is None
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la columna version_cambio de empresas_detalles
+"""
+
+import sqlite3
+
+from esquema_empresas import asegurar_version_cambios
+
+
+def test_migracion_conserva_los_cursores_por_id(tmp_path):
+    """Una base de datos sin version_cambio la rellena con el id y sigue numerando desde ahí"""
+    conn = sqlite3.connect(str(tmp_path / 'empresas.db'))
+    conn.execute('''
+        CREATE TABLE empresas_detalles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, razon_social TEXT NOT NULL, telefono TEXT,
+            url_detalles TEXT UNIQUE
+        )
+    ''')
+    conn.executemany("INSERT INTO empresas_detalles (razon_social, url_detalles) VALUES (?, ?)",
+                     [('A', 'u1'), ('B', 'u2'), ('C', 'u3')])
+    conn.execute("DELETE FROM empresas_detalles WHERE url_detalles = 'u2'")
+    with conn:
+        asegurar_version_cambios(conn)
+    # Volver a llamarla no cambia nada
+    with conn:
+        asegurar_version_cambios(conn)
+
+    assert conn.execute("SELECT id, version_cambio FROM empresas_detalles ORDER BY id").fetchall() == [(1, 1), (3, 3)]
+    with conn:
+        conn.execute("UPDATE empresas_detalles SET telefono = '968000001' WHERE url_detalles = 'u1'")
+        conn.execute("INSERT INTO empresas_detalles (razon_social, url_detalles) VALUES ('D', 'u4')")
+    assert conn.execute("SELECT url_detalles, version_cambio FROM empresas_detalles ORDER BY version_cambio").fetchall() \
+        == [('u3', 3), ('u1', 4), ('u4', 5)]
+    conn.close()
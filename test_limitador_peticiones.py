@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Pruebas del limitador AIMD por host
+"""
+
+import time
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from cache_http import SesionCache
+from limitador_peticiones import LimitadorPorHost
+from reintentos import PoliticaReintentos
+
+URL = 'https://www.axesor.es/Informes-Empresas/acme.html'
+OTRO_HOST = 'https://www.ejemplo.es/'
+
+
+def crear_limitador(**opciones):
+    """Limitador con parámetros fijos, independientes de Config"""
+    parametros = dict(peticiones_por_segundo=4, tasa_inicial=2, tasa_minima=0.5, incremento=0.5,
+                      factor_reduccion=0.5)
+    parametros.update(opciones)
+    return LimitadorPorHost(**parametros)
+
+
+def test_aumento_aditivo_hasta_el_techo():
+    """Cada éxito suma el incremento sin pasar de peticiones_por_segundo"""
+    limitador = crear_limitador()
+    limitador.registrar_exito(URL)
+    assert limitador.tasa_actual(URL) == 2.5
+    for _ in range(10):
+        limitador.registrar_exito(URL)
+    assert limitador.tasa_actual(URL) == 4
+    # Cada host lleva su propia tasa
+    assert limitador.tasa_actual(OTRO_HOST) == 2
+
+    sin_techo = crear_limitador(peticiones_por_segundo=None)
+    for _ in range(10):
+        sin_techo.registrar_exito(URL)
+    assert sin_techo.tasa_actual(URL) == 7
+
+
+def test_reduccion_multiplicativa_con_minimo():
+    """Cada saturación divide la tasa sin bajar de la mínima"""
+    limitador = crear_limitador()
+    limitador.registrar_saturacion(URL)
+    assert limitador.tasa_actual(URL) == 1
+    limitador.registrar_saturacion(URL)
+    limitador.registrar_saturacion(URL)
+    assert limitador.tasa_actual(URL) == 0.5
+
+
+def test_una_reduccion_por_episodio(monkeypatch):
+    """Las peticiones que ya tenían turno antes de la reducción no vuelven a reducir"""
+    monkeypatch.setattr(time, 'sleep', lambda segundos: None)
+    limitador = crear_limitador(tasa_inicial=4)
+    enviadas = [limitador.esperar(URL) for _ in range(3)]
+
+    limitador.registrar_saturacion(URL, enviada=enviadas[0])
+    assert limitador.tasa_actual(URL) == 2
+    for enviada in enviadas[1:]:
+        limitador.registrar_saturacion(URL, enviada=enviada)
+    assert limitador.tasa_actual(URL) == 2
+
+    # Una petición pedida después de la reducción abre un episodio nuevo
+    limitador.registrar_saturacion(URL, enviada=time.monotonic())
+    assert limitador.tasa_actual(URL) == 1
+
+
+def test_retry_after_aplaza_el_siguiente_turno(monkeypatch):
+    """El siguiente turno del host espera lo que pide el servidor; los demás hosts no"""
+    esperas = []
+    monkeypatch.setattr(time, 'sleep', esperas.append)
+    limitador = crear_limitador()
+
+    limitador.registrar_saturacion(URL, retry_after=3)
+    limitador.esperar(URL)
+    assert esperas and esperas[-1] == pytest.approx(3, abs=0.1)
+
+    esperas.clear()
+    limitador.esperar(OTRO_HOST)
+    assert esperas == []
+
+
+class AdaptadorFalso(BaseAdapter):
+    """Transporte que lanza la excepción o devuelve el código indicado"""
+
+    def __init__(self, resultado):
+        super().__init__()
+        self.resultado = resultado
+
+    def send(self, request, **kwargs):
+        if isinstance(self.resultado, Exception):
+            raise self.resultado
+        response = requests.Response()
+        response.status_code = self.resultado
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.mark.parametrize('resultado, reduce', [
+    (requests.ReadTimeout(), True),
+    (requests.ConnectTimeout(), True),
+    (429, True),
+    (503, True),
+    (requests.ConnectionError('conexión rechazada'), False),
+    (requests.exceptions.SSLError(), False),
+    (requests.exceptions.ChunkedEncodingError(), False),
+    (500, False),
+])
+def test_solo_timeouts_429_y_503_reducen_la_tasa(monkeypatch, resultado, reduce):
+    """Los demás errores se reintentan o se propagan sin bajar el ritmo del host"""
+    monkeypatch.setattr(time, 'sleep', lambda segundos: None)
+    limitador = crear_limitador()
+    sesion = SesionCache(None, limitador, PoliticaReintentos(max_reintentos=0))
+    sesion.mount('https://', AdaptadorFalso(resultado))
+
+    try:
+        sesion.get(URL)
+    except requests.RequestException:
+        pass
+    assert (limitador.tasa_actual(URL) < 2) == reduce
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la política de reintentos y de la clasificación de errores
+"""
+
+import sqlite3
+
+import requests
+
+from reintentos import PoliticaReintentos, RegistroFallos, clasificar_error
+from scraper_detalles_empresas_sqlite import ScraperDetallesSQLite
+
+
+def respuesta(status_code):
+    """Respuesta HTTP sin cuerpo con el código indicado"""
+    response = requests.Response()
+    response.status_code = status_code
+    return response
+
+
+def test_quedan_intentos():
+    """Con max_reintentos=2 se hacen tres intentos en total"""
+    politica = PoliticaReintentos(max_reintentos=2)
+    assert [politica.quedan_intentos(intento) for intento in range(4)] == [True, True, False, False]
+    assert not PoliticaReintentos(max_reintentos=0).quedan_intentos(0)
+
+
+def test_espera_exponencial_con_jitter_acotada():
+    """La espera está entre la mitad y el total del techo exponencial, que no pasa del máximo"""
+    politica = PoliticaReintentos(max_reintentos=10, espera_base=1, espera_maxima=10)
+    for intento in range(8):
+        techo = min(10, 2 ** intento)
+        esperas = [politica.calcular_espera(intento) for _ in range(200)]
+        assert all(techo / 2 <= espera <= techo for espera in esperas)
+        # El jitter reparte las esperas en vez de repetir siempre la misma
+        assert len(set(esperas)) > 1
+
+    # Retry-After manda cuando pide más que el backoff
+    assert politica.calcular_espera(0, retry_after=30) == 30
+    assert politica.calcular_espera(5, retry_after=0.1) >= 5
+
+
+def test_clasificar_error():
+    """Timeouts, cortes, 429 y 5xx se reintentan; 4xx, SSL y errores de programa no"""
+    assert clasificar_error(response=respuesta(503)) == (True, 'http_503')
+    assert clasificar_error(response=respuesta(429)) == (True, 'http_429')
+    assert clasificar_error(response=respuesta(404)) == (False, 'http_404')
+    assert clasificar_error(requests.HTTPError(response=respuesta(502))) == (True, 'http_502')
+
+    assert clasificar_error(requests.ReadTimeout()) == (True, 'ReadTimeout')
+    assert clasificar_error(requests.ConnectionError()) == (True, 'ConnectionError')
+    assert clasificar_error(requests.exceptions.ChunkedEncodingError()) == (True, 'ChunkedEncodingError')
+    # SSLError hereda de ConnectionError, pero reintentar no lo arregla
+    assert clasificar_error(requests.exceptions.SSLError()) == (False, 'SSLError')
+    assert clasificar_error(ValueError('html roto')) == (False, 'ValueError')
+
+
+def test_registro_de_fallos_no_confirma_el_lote_del_scraper(tmp_path):
+    """El registro escribe por su conexión y el lote de empresas sigue pendiente"""
+    db_path = str(tmp_path / 'empresas.db')
+    scraper = ScraperDetallesSQLite(db_path=db_path, tamano_lote=100, intervalo_commit=3600)
+    assert scraper.fallos.conn is not scraper.conn
+
+    scraper.guardar_empresa_en_db({
+        'razon_social': 'Acme', 'municipio': 'Lorca', 'codigo_postal': '30800', 'direccion': None,
+        'telefono': None, 'cif': None, 'sitio_web': None, 'email': None, 'fecha_constitucion': None,
+        'cnae': None, 'objeto_social': None, 'url_detalles': 'https://axesor/acme',
+    })
+    scraper.fallos.registrar('https://axesor/rota', error=requests.ReadTimeout('sin respuesta'))
+
+    otra = sqlite3.connect(db_path)
+    assert otra.execute("SELECT url, tipo_error FROM fallos_permanentes").fetchall() \
+        == [('https://axesor/rota', 'ReadTimeout')]
+    assert otra.execute("SELECT COUNT(*) FROM empresas_detalles").fetchone()[0] == 0
+    assert len(scraper.pendientes) == 1
+
+    scraper.fallos.resolver('https://axesor/rota')
+    scraper.cerrar()
+    assert otra.execute("SELECT COUNT(*) FROM fallos_permanentes").fetchone()[0] == 0
+    assert otra.execute("SELECT COUNT(*) FROM empresas_detalles").fetchone()[0] == 1
+    otra.close()
+
+    # Al reabrir se recuperan los fallos pendientes de cada origen
+    registro = RegistroFallos(db_path, 'listado_axesor')
+    registro.registrar('https://axesor/pagina/3', response=respuesta(404))
+    registro.cerrar()
+    for origen, pendientes in (('listado_axesor', 1), ('detalles_empresas', 0)):
+        registro = RegistroFallos(db_path, origen)
+        assert registro.total() == pendientes
+        registro.cerrar()
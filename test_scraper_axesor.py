@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la reanudación del listado de Axesor tras una página fallida
+"""
+
+import re
+import sqlite3
+
+import pytest
+
+from scraper_axesor import ScraperAxesor
+
+URL_LORCA = 'https://www.axesor.es/directorio-informacion-empresas/empresas-de-Murcia/informacion-empresas-de-Lorca/'
+TOTAL_PAGINAS = 5
+EMPRESAS_POR_PAGINA = 3
+
+
+class RespuestaFalsa:
+    """Lo que leen descargar y el recorrido de una respuesta de requests"""
+
+    def __init__(self, html, status_code=200):
+        self.text = html
+        self.content = html.encode()
+        self.status_code = status_code
+        self.reason = 'OK' if status_code == 200 else 'Error'
+
+
+class AxesorFalso:
+    """Listado de Lorca con paginación numerada o solo con el botón "siguiente" y páginas que fallan"""
+
+    def __init__(self, numerada):
+        self.numerada = numerada
+        self.fallan = set()
+        self.pedidas = []
+
+    def pagina(self, numero):
+        filas = ''.join(
+            f'<tr><td><a href="//www.axesor.es/Informes-Empresas/lorca-{numero}-{i}.html">LORCA {numero}-{i}</a></td></tr>'
+            for i in range(EMPRESAS_POR_PAGINA)
+        )
+        enlaces = range(1, TOTAL_PAGINAS + 1) if self.numerada else []
+        navegacion = ''.join(f'<a href="{URL_LORCA}{k}">{k}</a>' for k in enlaces)
+        if numero < TOTAL_PAGINAS:
+            navegacion += f'<a class="next" rel="next" href="{URL_LORCA}{numero + 1}">Siguiente</a>'
+        return f'<html><body><table><tr><th>Empresa</th></tr>{filas}</table>{navegacion}</body></html>'
+
+    def get(self, url, timeout=20, **kwargs):
+        self.pedidas.append(url)
+        coincidencia = re.fullmatch(re.escape(URL_LORCA) + r'(\d+)', url)
+        numero = int(coincidencia.group(1)) if coincidencia else 0
+        if numero in self.fallan:
+            return RespuestaFalsa('', 503)
+        if 1 <= numero <= TOTAL_PAGINAS:
+            return RespuestaFalsa(self.pagina(numero))
+        return RespuestaFalsa('', 404)
+
+
+def estado_lorca(db_path):
+    """(estado, última página del checkpoint, empresas guardadas, fallos pendientes)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        estado, ultima_pagina = conn.execute(
+            "SELECT estado, ultima_pagina FROM progreso_municipios WHERE municipio = 'Lorca'").fetchone()
+        empresas = conn.execute("SELECT COUNT(*) FROM empresas_listado").fetchone()[0]
+        fallos = conn.execute("SELECT COUNT(*) FROM fallos_permanentes").fetchone()[0]
+        return estado, ultima_pagina, empresas, fallos
+    finally:
+        conn.close()
+
+
+def recorrer_lorca(db_path, axesor, concurrencia_paginas):
+    """Una ejecución del scraper sobre el listado falso"""
+    scraper = ScraperAxesor(peticiones_por_segundo=None, db_listado=db_path)
+    scraper.session.get = axesor.get
+    try:
+        return scraper.buscar_municipio_axesor_por_url('Lorca', URL_LORCA + '1', max_paginas=100,
+                                                       concurrencia_paginas=concurrencia_paginas)
+    finally:
+        scraper.sumidero.cerrar()
+
+
+@pytest.mark.parametrize('numerada, concurrencia_paginas', [(True, 1), (True, 3), (False, 1)])
+def test_reanuda_desde_la_pagina_anterior_al_fallo(tmp_path, numerada, concurrencia_paginas):
+    """Con una página fallida el municipio sigue en curso y la siguiente ejecución lo completa"""
+    db_path = str(tmp_path / 'listado.db')
+    axesor = AxesorFalso(numerada)
+    axesor.fallan.add(3)
+
+    encontradas = recorrer_lorca(db_path, axesor, concurrencia_paginas)
+    estado, ultima_pagina, empresas, fallos = estado_lorca(db_path)
+    assert estado == 'en_curso'
+    assert ultima_pagina == 2
+    assert fallos == 1
+    # Con paginación numerada las páginas posteriores al hueco se guardan igualmente
+    paginas_guardadas = TOTAL_PAGINAS - 1 if numerada else 2
+    assert encontradas == empresas == paginas_guardadas * EMPRESAS_POR_PAGINA
+
+    axesor.fallan.clear()
+    axesor.pedidas.clear()
+    recorrer_lorca(db_path, axesor, concurrencia_paginas)
+    assert axesor.pedidas[0] == URL_LORCA + '2'
+    assert estado_lorca(db_path) == ('completado', TOTAL_PAGINAS, TOTAL_PAGINAS * EMPRESAS_POR_PAGINA, 0)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Pruebas del scraper de detalles con almacenamiento en SQLite
+"""
+
+import random
+import re
+import sqlite3
+import threading
+import time
+
+from bs4 import BeautifulSoup
+
+from scraper_detalles_empresas_sqlite import (CAMPOS_DETALLE, CONDICIONES_ESTADISTICAS, ETIQUETAS_DETALLE,
+                                              ExtractorDetalles, ScraperDetallesSQLite)
+
+FICHA = '''<table>
+  <tr><td>Teléfono:</td><td>968 000 000</td></tr>
+  <tr><td>CIF:</td><td>B73512348</td></tr>
+</table>'''
+
+
+class RespuestaFalsa:
+    """Lo que lee extraer_detalles_empresa de una respuesta de requests"""
+    status_code = 200
+    headers = {}
+    content = FICHA.encode()
+
+    def raise_for_status(self):
+        pass
+
+
+class SesionFalsa:
+    """Sirve la misma ficha tras una pausa al azar y anota qué URLs se piden"""
+
+    def __init__(self):
+        self.pedidas = []
+        self.lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        with self.lock:
+            self.pedidas.append(url)
+        time.sleep(random.uniform(0, 0.01))
+        return RespuestaFalsa()
+
+
+def test_procesar_en_paralelo(tmp_path):
+    """Acota las descargas pendientes, guarda todas las fichas y se salta las ya procesadas"""
+    db_path = str(tmp_path / 'empresas.db')
+    scraper = ScraperDetallesSQLite(db_path=db_path)
+    scraper.session = SesionFalsa()
+    ya_procesadas = {f'https://axesor/{i}' for i in range(0, 40, 5)}
+    scraper.urls_procesadas.update(ya_procesadas)
+
+    concurrencia = 3
+    generadas = 0
+
+    def tareas():
+        nonlocal generadas
+        for i in range(40):
+            generadas += 1
+            yield f'https://axesor/{i}', f'Empresa {i}', 'Lorca', '30800'
+
+    resultados = []
+    for resultado in scraper.procesar_en_paralelo(tareas(), concurrencia):
+        resultados.append(resultado)
+        # Nunca hay más de 2 x concurrencia tareas enviadas al pool sin recoger
+        assert generadas - len(resultados) <= 2 * concurrencia
+    scraper.cerrar()
+
+    assert len(resultados) == 40
+    assert resultados.count(None) == len(ya_procesadas)
+    assert not ya_procesadas & set(scraper.session.pedidas)
+    assert len(scraper.session.pedidas) == 40 - len(ya_procesadas)
+
+    conn = sqlite3.connect(db_path)
+    guardadas = {url for (url,) in conn.execute("SELECT url_detalles FROM empresas_detalles WHERE cif = 'B73512348'")}
+    conn.close()
+    assert guardadas == {f'https://axesor/{i}' for i in range(40)} - ya_procesadas
+
+
+def empresa(url, **campos):
+    """Fila de vaciar_pendientes con los campos indicados y el resto vacíos"""
+    datos = dict.fromkeys(CAMPOS_DETALLE)
+    datos.update(campos)
+    return (f'Empresa {url}', 'Lorca', '30800') + tuple(datos[campo] for campo in CAMPOS_DETALLE) + (url,)
+
+
+def estadisticas_recalculadas(conn):
+    """Contadores calculados desde cero sobre la tabla"""
+    sumas = ", ".join(f"COALESCE(SUM({condicion.format(fila='empresas_detalles')}), 0)"
+                      for _, condicion in CONDICIONES_ESTADISTICAS)
+    return conn.execute(f"SELECT COUNT(*), COUNT(*), {sumas} FROM empresas_detalles").fetchone()
+
+
+def estadisticas_de_triggers(conn):
+    """Contadores que mantienen los triggers en estadisticas_procesamiento"""
+    columnas = ", ".join(campo for campo, _ in CONDICIONES_ESTADISTICAS)
+    return conn.execute(f'''
+        SELECT total_empresas, empresas_procesadas, {columnas} FROM estadisticas_procesamiento WHERE id = 1
+    ''').fetchone()
+
+
+def test_triggers_de_estadisticas_con_insert_or_replace(tmp_path):
+    """Reemplazar una empresa no la cuenta dos veces y resta los campos que pierde"""
+    scraper = ScraperDetallesSQLite(db_path=str(tmp_path / 'empresas.db'))
+    try:
+        scraper.pendientes = [
+            empresa('u1', telefono='968000001', email='a@acme.es'),
+            empresa('u2', cif='B73512348', sitio_web='N/A'),
+        ]
+        scraper.vaciar_pendientes()
+        assert estadisticas_de_triggers(scraper.conn) == estadisticas_recalculadas(scraper.conn)
+
+        # u1 se vuelve a guardar sin teléfono y con web: INSERT OR REPLACE borra y vuelve a insertar
+        scraper.pendientes = [empresa('u1', email='a@acme.es', sitio_web='www.acme.es'), empresa('u3')]
+        scraper.vaciar_pendientes()
+        stats = estadisticas_de_triggers(scraper.conn)
+        assert stats == estadisticas_recalculadas(scraper.conn)
+        assert stats[:2] == (3, 3)
+        assert dict(zip([campo for campo, _ in CONDICIONES_ESTADISTICAS], stats[2:]))['empresas_con_telefono'] == 0
+
+        # Un UPDATE en el sitio resta lo que había y suma lo nuevo
+        with scraper.conn:
+            scraper.conn.execute("UPDATE empresas_detalles SET telefono = '968000002' WHERE url_detalles = 'u2'")
+        assert estadisticas_de_triggers(scraper.conn) == estadisticas_recalculadas(scraper.conn)
+    finally:
+        scraper.cerrar()
+
+
+def test_version_cambio_avanza_con_cada_alta_o_modificacion(tmp_path):
+    """Los reemplazos y los UPDATE en el sitio (reextraer_detalles.py) reciben una versión nueva"""
+    db_path = str(tmp_path / 'empresas.db')
+    scraper = ScraperDetallesSQLite(db_path=db_path)
+    scraper.pendientes = [empresa('u1'), empresa('u2')]
+    scraper.vaciar_pendientes()
+    scraper.pendientes = [empresa('u1', cif='B73512348')]
+    scraper.vaciar_pendientes()
+    scraper.cerrar()
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT url_detalles, version_cambio FROM empresas_detalles ORDER BY version_cambio").fetchall() \
+        == [('u2', 2), ('u1', 3)]
+    with conn:
+        conn.execute("UPDATE empresas_detalles SET telefono = '968000002' WHERE url_detalles = 'u2'")
+    assert conn.execute("SELECT version_cambio FROM empresas_detalles WHERE url_detalles = 'u2'").fetchone()[0] == 4
+    assert estadisticas_de_triggers(conn) == estadisticas_recalculadas(conn)
+    conn.close()
+
+
+# Limpieza que hacía cada antiguo extraer_<campo>; '' equivale a "sin valor, seguir buscando"
+LIMPIEZA_ANTIGUA = {
+    'telefono': lambda valor: re.sub(r'[^\d]', '', valor),
+    'cnae': lambda valor: re.sub(r'[^\d]', '', valor),
+    'sitio_web': lambda valor: '' if valor == 'N/A' else valor,
+    'email': lambda valor: valor if '@' in valor else '',
+}
+
+FICHAS = [
+    # Ficha completa, con valores que no sirven antes de los buenos y etiquetas en otra tabla
+    '''<html><head><script>var celda = "<td>CIF:</td><td>X</td>";</script></head><body>
+    <table>
+      <tr><td>Dirección:</td><td>  Calle Mayor 1, Lorca </td></tr>
+      <tr><td>Teléfono:</td><td>968.123.456</td></tr>
+      <tr><td>cif:</td><td>B73512348</td></tr>
+      <tr><td>Sitio web:</td><td>N/A</td></tr>
+      <tr><td>EMAIL:</td><td>no disponible</td></tr>
+    </table>
+    <table>
+      <tr><td>Sitio web:</td><td><a href="http://www.acme.es">www.acme.es</a></td></tr>
+      <tr><td>Email:</td><td>info@acme.es</td></tr>
+      <tr><td><b>CNAE:</b></td><td>4321 - Instalaciones eléctricas</td></tr>
+      <tr><td>Fecha de constitución:</td><td>01/02/2003</td></tr>
+      <tr><td>Objeto social: </td><td>Construcción de edificios</td></tr>
+    </table></body></html>''',
+    # Etiquetas sin celda de valor, con varios textos o con el valor vacío
+    '''<table>
+      <tr><td>Dirección:</td></tr>
+      <tr><td>Teléfono: <span>fijo</span></td><td>968000000</td></tr>
+      <tr><td>CNAE:</td><td>sin dato</td></tr>
+      <tr><td>CIF:</td><td></td></tr>
+      <tr><td>CIF:</td><td>A08001850</td></tr>
+    </table>''',
+    # Sin tablas ni etiquetas
+    '<html><body><p>CIF: B73512348</p></body></html>',
+    '',
+]
+
+
+def extraer_campo_por_separado(soup, campo):
+    """Réplica de los antiguos extraer_<campo>: un find_all por etiqueta sobre la página entera"""
+    limpiar = LIMPIEZA_ANTIGUA.get(campo, lambda valor: valor)
+    for elemento in soup.find_all('td', string=re.compile(ETIQUETAS_DETALLE[campo], re.IGNORECASE)):
+        siguiente_td = elemento.find_next_sibling('td')
+        if siguiente_td:
+            valor = limpiar(siguiente_td.get_text(strip=True))
+            if valor:
+                return valor
+    return None
+
+
+def test_extraer_campos_coincide_con_los_extractores_por_campo():
+    """La pasada única por las celdas da los mismos campos que un find_all por campo"""
+    extractor = ExtractorDetalles()
+    for html in FICHAS:
+        soup = BeautifulSoup(html, 'html.parser')
+        esperado = {campo: extraer_campo_por_separado(soup, campo) for campo in CAMPOS_DETALLE}
+        assert extractor.extraer_campos(html) == esperado
+
+    campos = extractor.extraer_campos(FICHAS[0])
+    assert campos['telefono'] == '968123456'
+    assert campos['sitio_web'] == 'www.acme.es'
+    assert campos['email'] == 'info@acme.es'
+    assert campos['cnae'] == '4321'
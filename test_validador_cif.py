@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la validación vectorizada de CIF frente a la validación fila a fila
+"""
+
+import numpy as np
+import pandas as pd
+
+from validador_cif import ProcesadorCIF, ValidadorCIF
+
+CIFS = [
+    'A08001850',      # válido
+    'b-7351234-8',    # válido tras limpiar
+    ' B73512345 ',    # dígito de control incorrecto
+    'A0800185',       # 8 caracteres: se completa
+    'P3000000I',      # termina en letra
+    'Z1234567',       # letra inicial no válida
+    'A123',           # demasiado corto
+    'A1234567890',    # demasiado largo
+    12345678,         # número sin letra inicial
+    '---',            # vacío tras limpiar
+    '',
+    None,
+]
+
+
+def analizar_fila_a_fila(cif):
+    """Lo que hacía procesar_dataframe con un apply por columna"""
+    limpio = ValidadorCIF.limpiar_cif(cif)
+    return {
+        'cif_limpio': limpio,
+        'cif_valido': ValidadorCIF.validar_cif_completo(limpio)[0] if limpio else False,
+        'cif_completado': ValidadorCIF.completar_cif(limpio) if limpio and len(limpio) == 8 else limpio,
+        'tipo_entidad': ValidadorCIF.obtener_tipo_entidad(limpio),
+    }
+
+
+def test_analizar_serie_coincide_con_el_validador_escalar():
+    """Cada columna del análisis vectorizado coincide con los métodos fila a fila"""
+    serie = pd.Series(CIFS, dtype=object, index=range(100, 100 + len(CIFS)))
+    analisis = ValidadorCIF.analizar_serie(serie)
+
+    assert list(analisis.index) == list(serie.index)
+    for indice, cif in serie.items():
+        fila = analisis.loc[indice]
+        esperado = analizar_fila_a_fila(cif)
+        assert {columna: (None if pd.isna(valor) else valor) for columna, valor in fila.items()} == esperado, cif
+
+
+def test_analizar_serie_vacios_de_pandas():
+    """Los NaN de un CSV leído con pandas cuentan como vacíos (limpiar_cif los convertía en 'NAN')"""
+    analisis = ValidadorCIF.analizar_serie(pd.Series([np.nan, 'A08001850']))
+    assert analisis['cif_limpio'].tolist() == [None, 'A08001850']
+    assert analisis['cif_valido'].tolist() == [False, True]
+    assert analisis['tipo_entidad'].tolist() == [None, 'Sociedades Anónimas']
+
+
+def test_procesar_dataframe_por_bloques_acumula_estadisticas():
+    """Procesar en dos bloques da las mismas estadísticas que todo de una vez"""
+    df = pd.DataFrame({'cif': CIFS})
+
+    completo = ProcesadorCIF()
+    completo.procesar_dataframe(df, 'cif')
+
+    por_bloques = ProcesadorCIF()
+    por_bloques.procesar_dataframe(df.iloc[:5], 'cif', acumular=True)
+    por_bloques.procesar_dataframe(df.iloc[5:], 'cif', acumular=True)
+
+    assert por_bloques.estadisticas == completo.estadisticas
@@ -5,8 +5,12 @@ Utilidades para validar, limpiar y verificar CIFs españoles
 """
 
 import re
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from openpyxl import Workbook, load_workbook
+
+from config import Config
 
 class ValidadorCIF:
     """Clase para validar y limpiar CIFs españoles"""
@@ -164,21 +168,120 @@ class ValidadorCIF:
 
         return None
 
+    @classmethod
+    def limpiar_serie(cls, serie):
+        """Versión vectorizada de limpiar_cif para una columna entera (None en los vacíos)"""
+        vacios = serie.isna() | ~serie.astype(bool)
+        limpios = serie.astype(str).str.upper().str.replace(r'[^A-Z0-9]', '', regex=True)
+        return limpios.where(~vacios & (limpios != ''), None).astype(object)
+
+    @classmethod
+    def calcular_digitos_control(cls, digitos):
+        """Dígitos de control de una matriz (filas x 7) con los 7 números centrales de cada CIF"""
+        productos = digitos * np.array(cls.MULTIPLICADORES[:7])
+        # Suma de las cifras de cada producto: como mucho 18, así que basta con restar 9
+        suma = np.where(productos > 9, productos - 9, productos).sum(axis=1)
+        return (10 - suma % 10) % 10
+
+    @classmethod
+    def analizar_serie(cls, serie):
+        """Limpia, valida, completa y clasifica una columna de CIFs de una vez
+
+        Devuelve un DataFrame con las columnas cif_limpio, cif_valido, cif_completado
+        y tipo_entidad, con los mismos resultados que aplicar los métodos fila a fila
+        """
+        limpios = cls.limpiar_serie(serie)
+        texto = limpios.fillna('')
+        longitud = texto.str.len().to_numpy()
+
+        # Tras limpiar solo quedan A-Z y 0-9: cada CIF pasa a ser una fila de 9 bytes
+        # (los más largos se recortan, pero ya son inválidos por longitud)
+        bytes_cif = np.array(texto.tolist(), dtype='S9').view(np.uint8).reshape(-1, 9)
+        letra = bytes_cif[:, 0]
+        digitos = bytes_cif[:, 1:8].astype(np.int16) - ord('0')
+        numericos = ((digitos >= 0) & (digitos <= 9)).all(axis=1)
+        control = cls.calcular_digitos_control(digitos) + ord('0')
+
+        letras_validas = np.frombuffer(cls.LETRAS_VALIDAS.encode('ascii'), dtype=np.uint8)
+        formato = np.isin(longitud, [8, 9]) & np.isin(letra, letras_validas) & numericos
+        validos = formato & ((longitud == 8) | (bytes_cif[:, 8] == control))
+
+        # Los de 8 caracteres se completan con el dígito calculado; si no se puede, quedan vacíos
+        completados = limpios.copy()
+        de_ocho = longitud == 8
+        if de_ocho.any():
+            con_digito = bytes_cif[de_ocho].copy()
+            con_digito[:, 8] = control[de_ocho]
+            texto_completo = pd.Series(con_digito.view('S9').ravel()).str.decode('ascii').to_numpy()
+            completados[de_ocho] = np.where(numericos[de_ocho], texto_completo, None)
+
+        # Tipo de entidad por tabla indexada con el byte de la letra inicial
+        tabla_tipos = np.full(256, 'Tipo no definido', dtype=object)
+        for inicial, tipo in cls.TIPOS_ENTIDAD.items():
+            tabla_tipos[ord(inicial)] = tipo
+        tipos = np.where(limpios.notna(), tabla_tipos[letra], None)
+
+        return pd.DataFrame({
+            'cif_limpio': limpios,
+            'cif_valido': validos,
+            'cif_completado': completados,
+            'tipo_entidad': tipos,
+        }, index=serie.index)
+
+class SalidaPorBloques:
+    """Escribe en CSV o XLSX los bloques procesados a medida que llegan"""
+
+    def __init__(self, archivo_salida):
+        self.archivo_salida = archivo_salida
+        self.excel = archivo_salida.endswith('.xlsx')
+        self.cabecera_escrita = False
+        if self.excel:
+            # En modo write-only openpyxl vuelca cada fila a disco al añadirla
+            self.libro = Workbook(write_only=True)
+            self.hoja = self.libro.create_sheet('Sheet1')
+        else:
+            self.archivo = open(archivo_salida, 'w', newline='', encoding='utf-8-sig')
+
+    def escribir(self, df):
+        """Añade las filas de un bloque (y la cabecera con el primero)"""
+        if not self.excel:
+            df.to_csv(self.archivo, index=False, header=not self.cabecera_escrita)
+            self.cabecera_escrita = True
+            return
+
+        if not self.cabecera_escrita:
+            self.hoja.append([str(columna) for columna in df.columns])
+            self.cabecera_escrita = True
+        # Tipos de Python y None en las celdas vacías, que es lo que entiende openpyxl
+        valores = df.astype(object).where(df.notna(), None)
+        for fila in valores.itertuples(index=False, name=None):
+            self.hoja.append(list(fila))
+
+    def cerrar(self):
+        """Termina el archivo de salida"""
+        if self.excel:
+            self.libro.save(self.archivo_salida)
+        else:
+            self.archivo.close()
+
 class ProcesadorCIF:
     """Clase para procesar CIFs en archivos de datos"""
 
     def __init__(self):
         self.validador = ValidadorCIF()
-        self.estadisticas = {
-            'total': 0,
-            'validos': 0,
-            'invalidos': 0,
-            'completados': 0,
-            'tipos_entidad': {}
-        }
+        self.reiniciar_estadisticas()
+
+    def procesar_archivo(self, archivo_entrada, archivo_salida=None, por_bloques=False,
+                         tamano_bloque=Config.TAMANO_BLOQUE_CIF):
+        """Procesa un archivo Excel/CSV y valida/limpia los CIFs
+
+        Con por_bloques=True el archivo se lee, valida y escribe por trozos de
+        tamano_bloque filas, así la memoria no depende del tamaño del archivo;
+        en ese caso devuelve las estadísticas en lugar del DataFrame
+        """
+        if por_bloques:
+            return self.procesar_archivo_por_bloques(archivo_entrada, archivo_salida, tamano_bloque)
 
-    def procesar_archivo(self, archivo_entrada, archivo_salida=None):
-        """Procesa un archivo Excel/CSV y valida/limpia los CIFs"""
         print(f"🔍 Procesando archivo: {archivo_entrada}")
 
         try:
@@ -191,11 +294,7 @@ class ProcesadorCIF:
             print(f"📊 Archivo cargado: {len(df)} filas")
 
             # Buscar columna CIF
-            columna_cif = None
-            for col in df.columns:
-                if 'cif' in col.lower():
-                    columna_cif = col
-                    break
+            columna_cif = self.buscar_columna_cif(df.columns)
 
             if not columna_cif:
                 print("❌ No se encontró columna CIF en el archivo")
@@ -224,33 +323,134 @@ class ProcesadorCIF:
             print(f"❌ Error al procesar archivo: {e}")
             return None
 
-    def procesar_dataframe(self, df, columna_cif):
-        """Procesa un DataFrame y valida/limpia los CIFs"""
+    def buscar_columna_cif(self, columnas):
+        """Primera columna cuyo nombre contiene "cif" (None si no hay ninguna)"""
+        for col in columnas:
+            if 'cif' in str(col).lower():
+                return col
+        return None
+
+    def leer_por_bloques(self, archivo_entrada, tamano_bloque):
+        """Genera DataFrames de como mucho tamano_bloque filas sin cargar el archivo entero"""
+        if not archivo_entrada.endswith('.xlsx'):
+            # Todo como texto para que cada bloque escriba los valores igual que vienen
+            with pd.read_csv(archivo_entrada, chunksize=tamano_bloque, dtype=str) as lector:
+                yield from lector
+            return
+
+        libro = load_workbook(archivo_entrada, read_only=True, data_only=True)
+        try:
+            filas = libro.active.iter_rows(values_only=True)
+            columnas = next(filas, None)
+            if columnas is None:
+                return
+            ancho = len(columnas)
+            bloque = []
+            for fila in filas:
+                # Como read_excel, se saltan las filas vacías
+                if all(valor is None for valor in fila):
+                    continue
+                # Sin dimensiones guardadas en la hoja, las filas pueden venir más cortas
+                bloque.append(fila[:ancho] + (None,) * (ancho - len(fila)))
+                if len(bloque) >= tamano_bloque:
+                    yield pd.DataFrame(bloque, columns=columnas)
+                    bloque = []
+            if bloque:
+                yield pd.DataFrame(bloque, columns=columnas)
+        finally:
+            libro.close()
+
+    def procesar_archivo_por_bloques(self, archivo_entrada, archivo_salida=None,
+                                     tamano_bloque=Config.TAMANO_BLOQUE_CIF):
+        """Valida los CIFs de un archivo Excel/CSV por bloques, escribiendo cada uno al terminarlo"""
+        print(f"🔍 Procesando archivo por bloques de {tamano_bloque} filas: {archivo_entrada}")
+
+        self.reiniciar_estadisticas()
+        salida = None
+        try:
+            columna_cif = None
+            for numero, bloque in enumerate(self.leer_por_bloques(archivo_entrada, tamano_bloque), 1):
+                if columna_cif is None:
+                    columna_cif = self.buscar_columna_cif(bloque.columns)
+                    if not columna_cif:
+                        print("❌ No se encontró columna CIF en el archivo")
+                        return None
+                    print(f"✅ Columna CIF encontrada: {columna_cif}")
+                    if archivo_salida:
+                        salida = SalidaPorBloques(archivo_salida)
+
+                bloque_procesado = self.procesar_dataframe(bloque, columna_cif, acumular=True)
+                if salida:
+                    salida.escribir(bloque_procesado)
+
+                print(f"   - Bloque {numero}: {len(bloque)} filas "
+                      f"({self.estadisticas['total']} procesadas, {self.estadisticas['validos']} válidas)")
+
+            if columna_cif is None:
+                print("❌ El archivo no tiene filas")
+                return None
+
+            if salida:
+                salida.cerrar()
+                salida = None
+                print(f"💾 Resultados guardados en: {archivo_salida}")
+
+            self.mostrar_estadisticas()
+
+            return self.estadisticas
+
+        except Exception as e:
+            print(f"❌ Error al procesar archivo: {e}")
+            return None
+
+        finally:
+            # Si algo falló a medias, al menos se cierra el archivo de salida
+            if salida and not salida.excel:
+                salida.cerrar()
+
+    def procesar_dataframe(self, df, columna_cif, acumular=False):
+        """Procesa un DataFrame y valida/limpia los CIFs
+
+        Con acumular=True las estadísticas se suman a las de los bloques anteriores
+        """
         # Crear copia del DataFrame
         df_procesado = df.copy()
 
         # Agregar columnas de validación
         df_procesado['cif_original'] = df_procesado[columna_cif]
-        df_procesado['cif_limpio'] = df_procesado[columna_cif].apply(ValidadorCIF.limpiar_cif)
-        df_procesado['cif_valido'] = df_procesado['cif_limpio'].apply(lambda x: ValidadorCIF.validar_cif_completo(x)[0] if x else False)
-        df_procesado['cif_completado'] = df_procesado['cif_limpio'].apply(lambda x: ValidadorCIF.completar_cif(x) if x and len(x) == 8 else x)
-        df_procesado['tipo_entidad'] = df_procesado['cif_limpio'].apply(ValidadorCIF.obtener_tipo_entidad)
+        # Toda la columna de una vez (pandas/NumPy) en lugar de una llamada por fila
+        analisis = ValidadorCIF.analizar_serie(df_procesado[columna_cif])
+        for columna in analisis.columns:
+            df_procesado[columna] = analisis[columna]
 
         # Actualizar estadísticas
-        self.actualizar_estadisticas(df_procesado)
+        self.actualizar_estadisticas(df_procesado, acumular)
 
         return df_procesado
 
-    def actualizar_estadisticas(self, df):
-        """Actualiza las estadísticas de procesamiento"""
-        self.estadisticas['total'] = len(df)
-        self.estadisticas['validos'] = len(df[df['cif_valido'] == True])
-        self.estadisticas['invalidos'] = len(df[df['cif_valido'] == False])
-        self.estadisticas['completados'] = len(df[df['cif_completado'].notna() & (df['cif_completado'] != df['cif_limpio'])])
+    def reiniciar_estadisticas(self):
+        """Pone a cero las estadísticas de procesamiento"""
+        self.estadisticas = {
+            'total': 0,
+            'validos': 0,
+            'invalidos': 0,
+            'completados': 0,
+            'tipos_entidad': {}
+        }
+
+    def actualizar_estadisticas(self, df, acumular=False):
+        """Actualiza las estadísticas de procesamiento (sumándolas a las que hay si acumular=True)"""
+        if not acumular:
+            self.reiniciar_estadisticas()
+        self.estadisticas['total'] += len(df)
+        self.estadisticas['validos'] += len(df[df['cif_valido'] == True])
+        self.estadisticas['invalidos'] += len(df[df['cif_valido'] == False])
+        self.estadisticas['completados'] += len(df[df['cif_completado'].notna() & (df['cif_completado'] != df['cif_limpio'])])
 
         # Tipos de entidad
-        tipos = df['tipo_entidad'].value_counts()
-        self.estadisticas['tipos_entidad'] = tipos.to_dict()
+        tipos = self.estadisticas['tipos_entidad']
+        for tipo, cantidad in df['tipo_entidad'].value_counts().items():
+            tipos[tipo] = tipos.get(tipo, 0) + int(cantidad)
 
     def mostrar_estadisticas(self):
         """Muestra las estadísticas de procesamiento"""
@@ -5,11 +5,15 @@ Visualización en tiempo real de empresas desde SQLite
 Genera una página HTML que se actualiza automáticamente
 """
 
+import json
 import sqlite3
 import pandas as pd
 from datetime import datetime
 import os
 
+# Servidor de servidor_web.py del que la página obtiene las empresas nuevas
+URL_SERVIDOR = 'http://localhost:5000'
+
 def generar_visualizacion_tiempo_real():
     """Genera una página HTML que muestra las empresas en tiempo real"""
 
@@ -19,6 +23,7 @@ def generar_visualizacion_tiempo_real():
     # Obtener todas las empresas ordenadas por fecha de extracción (más recientes primero)
     query = """
     SELECT
+        id,
         razon_social,
         municipio,
         codigo_postal,
@@ -31,7 +36,8 @@ def generar_visualizacion_tiempo_real():
         cnae,
         objeto_social,
         url_detalles,
-        fecha_extraccion
+        fecha_extraccion,
+        version_cambio
     FROM empresas_detalles
     ORDER BY fecha_extraccion DESC
     """
@@ -59,6 +65,10 @@ def generar_visualizacion_tiempo_real():
     empresas_con_cnae = df['cnae'].notna().sum()
     empresas_con_objeto = df['objeto_social'].notna().sum()
 
+    # Datos embebidos como JSON (los NaN pasan a null) y cursor para pedir solo los cambios
+    empresas_json = json.dumps(df.astype(object).where(df.notna(), None).to_dict('records'), ensure_ascii=False)
+    cursor = int(df['version_cambio'].max())
+
     # Generar HTML
     html_content = f"""
 <!DOCTYPE html>
@@ -379,7 +389,7 @@ def generar_visualizacion_tiempo_real():
                 </thead>
                 <tbody>
                     {''.join([f'''
-                    <tr class="{'new-company' if idx < 5 else ''}">
+                    <tr class="{'new-company' if idx < 5 else ''}" data-url="{row['url_detalles']}">
                         <td>{row['razon_social']}</td>
                         <td>{row['municipio']}</td>
                         <td>{row['codigo_postal'] if pd.notna(row['codigo_postal']) else ''}</td>
@@ -408,9 +418,10 @@ def generar_visualizacion_tiempo_real():
         let autoRefreshInterval;
         let autoRefreshActive = false;
         let refreshCountdown = 30;
+        let cursor = {cursor};
 
         // Datos para el filtrado
-        const empresasData = {df.to_dict('records')};
+        let empresasData = {empresas_json};
 
         // Función de filtrado
         function filterTable() {{
@@ -476,12 +487,88 @@ def generar_visualizacion_tiempo_real():
                     updateProgress();
 
                     if (refreshCountdown <= 0) {{
-                        location.reload();
+                        refreshCountdown = 30;
+                        loadChanges();
                     }}
                 }}, 1000);
             }}
         }}
 
+        function loadChanges() {{
+            // Pide al servidor solo las empresas nuevas o actualizadas desde el cursor
+            fetch('{URL_SERVIDOR}/api/empresas/cambios?desde=' + cursor)
+                .then(response => response.json())
+                .then(data => {{
+                    if (!data.completo) {{
+                        location.reload();
+                        return;
+                    }}
+                    mergeChanges(data.empresas);
+                    cursor = data.cursor;
+                    updateStatsFromServer(data.stats);
+                    document.querySelector('.last-update').textContent = 'Última actualización: ' + data.last_update;
+                    filterTable();
+                }})
+                .catch(error => console.error('Error cargando cambios:', error));
+        }}
+
+        function mergeChanges(cambios) {{
+            const tbody = document.querySelector('#empresas-table tbody');
+            tbody.querySelectorAll('tr.new-company').forEach(row => row.classList.remove('new-company'));
+
+            cambios.forEach(empresa => {{
+                // Una empresa actualizada sustituye a su fila anterior
+                empresasData = empresasData.filter(e => e.url_detalles !== empresa.url_detalles);
+                empresasData.unshift(empresa);
+                tbody.querySelectorAll('tr').forEach(row => {{
+                    if (row.dataset.url === empresa.url_detalles) row.remove();
+                }});
+                tbody.insertAdjacentHTML('afterbegin', renderRow(empresa));
+            }});
+        }}
+
+        function renderRow(row) {{
+            const objeto = row.objeto_social || '';
+            return `
+                    <tr class="new-company" data-url="${{row.url_detalles}}">
+                        <td>${{row.razon_social}}</td>
+                        <td>${{row.municipio}}</td>
+                        <td>${{row.codigo_postal || ''}}</td>
+                        <td>${{row.cif || ''}}</td>
+                        <td>${{row.cnae || ''}}</td>
+                        <td>${{row.telefono || ''}}</td>
+                        <td>${{row.sitio_web ? `<a href="${{row.sitio_web}}" target="_blank" class="btn btn-success">🌐 Sitio Web</a>` : ''}}</td>
+                        <td>${{row.email || ''}}</td>
+                        <td>${{row.fecha_constitucion || ''}}</td>
+                        <td class="objeto-social" title="${{objeto}}">${{objeto.length > 100 ? objeto.slice(0, 100) + '...' : objeto}}</td>
+                        <td><a href="${{row.url_detalles}}" target="_blank" class="btn btn-primary">Ver</a></td>
+                        <td>${{(row.fecha_extraccion || '').slice(0, 19)}}</td>
+                    </tr>`;
+        }}
+
+        function updateStatsFromServer(stats) {{
+            // La primera tarjeta la mantiene filterTable con las filas visibles
+            const campos = [
+                null, 'municipios_unicos', 'cnaes_unicos', 'codigos_postales_unicos',
+                'empresas_con_direccion', 'empresas_con_telefono', 'empresas_con_cif', 'empresas_con_web'
+            ];
+            const etiquetas = {{
+                empresas_con_direccion: 'Con Dirección',
+                empresas_con_telefono: 'Con Teléfono',
+                empresas_con_cif: 'Con CIF',
+                empresas_con_web: 'Con Sitio Web'
+            }};
+            const cards = document.querySelectorAll('.stat-card');
+            campos.forEach((campo, i) => {{
+                if (!campo || !cards[i]) return;
+                cards[i].querySelector('.stat-number').textContent = stats[campo];
+                if (etiquetas[campo]) {{
+                    const porcentaje = (stats[campo] / stats.total_empresas * 100).toFixed(1);
+                    cards[i].querySelector('.stat-label').textContent = `${{etiquetas[campo]}} (${{porcentaje}}%)`;
+                }}
+            }});
+        }}
+
         function updateProgress() {{
             const progressFill = document.getElementById('progress-fill');
             const progress = ((30 - refreshCountdown) / 30) * 100;
@@ -530,13 +617,6 @@ def generar_visualizacion_tiempo_real():
 
         // Inicializar filtros
         filterTable();
-
-        // Auto-refresh cada 30 segundos si está activado
-        setInterval(() => {{
-            if (autoRefreshActive) {{
-                location.reload();
-            }}
-        }}, 30000);
     </script>
 </body>
 </html>